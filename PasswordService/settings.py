@@ -132,6 +132,62 @@ PWDSVC_GROUP_FILE_PATH = '/etc/group'
 
 PWDSVC_SEARCH = 'DataBaseSearch'
 
+# Responses with more records than this are streamed rather than
+# built in memory; None to never stream.  Only the encoding is streamed;
+# database searches still build every record of their results first.
+PWDSVC_STREAMING_THRESHOLD = 1000
+
+# Page size of list requests giving a cursor but no limit.
+PWDSVC_PAGE_LIMIT = 1000
+
+# Largest number of values looked up by one batch request.
+PWDSVC_BATCH_LIMIT = 10000
+
+# Bounds of the cache of recent search results, by number of searches
+# and total size of their json encoding; 0 entries disables the cache.
+PWDSVC_CACHE_ENTRIES = 1024
+PWDSVC_CACHE_BYTES = 64 * 1024 * 1024
+
+# Largest number of requests searching the database at once; requests
+# arriving while all are busy wait for a search to finish.  None for no
+# bound.
+PWDSVC_DB_SEARCHES = 4
+
+# Seconds a request waits for a database search to finish before it is
+# answered with 503 Service Unavailable.
+PWDSVC_DB_SEARCH_WAIT = 5
+
+# True for PasswordService.wsgi to answer GET /users/<uid>, /groups/<gid>
+# and /users/<uid>/groups from memory ahead of the Django request stack.
+PWDSVC_FAST_PATH = True
+
+# Seconds to wait for further changes to a watched file before reloading
+# it, so a burst of writes or a rename replacing the file reloads once.
+PWDSVC_RELOAD_DELAY = 0.2
+
+# How the passwd and group files are watched for change: 'native' for
+# filesystem events alone, 'poll' to check their mtime, size and inode
+# every PWDSVC_WATCH_INTERVAL seconds, or 'auto' for both, catching
+# changes on filesystems such as NFS that never deliver events.
+PWDSVC_WATCH_BACKEND = 'auto'
+PWDSVC_WATCH_INTERVAL = 2.0
+
+# Number of processes parsing a full load of a file over 1MB in parallel;
+# 1 parses in the serving process.  They are forked when the data manager
+# is created, before it starts any threads: a process forked while another
+# thread holds a lock inherits it held and can deadlock, so with more than
+# 1, don't start threads of your own before pwdsvc.views is imported.
+PWDSVC_LOAD_WORKERS = 1
+
+# Directory of compiled indexes of the passwd and group files, which let
+# a restart skip parsing sources that haven't changed; None to disable.
+PWDSVC_INDEX_DIR = os.path.dirname(DATABASES['default']['NAME'])
+
+# True for serving processes to attach to the data a 'manage.py
+# pwdsvc_loader' process publishes in PWDSVC_INDEX_DIR, rather than each
+# loading and watching the files and loading the database itself.
+PWDSVC_ATTACH_LOADER = False
+
 LOGGING_CONFIG = None
 LOGLEVEL = DEBUG
 
@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/1.9/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "PasswordService.settings")
 
 application = get_wsgi_application()
+
+# Answer lookups of single users and groups from memory, ahead of the
+# Django request stack.
+if settings.PWDSVC_FAST_PATH:
+    from pwdsvc.fastpath import FastPathApplication
+    application = FastPathApplication(application)
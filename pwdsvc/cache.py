@@ -0,0 +1,151 @@
+"""
+This module provides a bounded cache of search results, so that
+repeated identical requests are answered without searching again.
+"""
+import threading
+from collections import OrderedDict
+from pwdsvc.formats import JSON
+# Get an instance of a logger.
+import logging
+logger = logging.getLogger(__name__)
+
+
+def canonical_params(dict_):
+    """
+    Purpose: Build a key for query parameters that is the same for all
+             equivalent queries; parameters are sorted by name and the
+             repeated member parameter is treated as a set.
+    Input Parameters: dict_ - QueryDict or dictionary of parameters.
+    Return: tuple of (name, tuple of values) pairs.
+    Exceptions: N/A."""
+    params = []
+    for key in sorted(dict_):
+        if hasattr(dict_, 'getlist'):
+            values = dict_.getlist(key)
+        else:
+            values = [dict_[key]]
+
+        if key == 'member':
+            values = sorted(set(values))
+        params.append((key, tuple(values)))
+    return tuple(params)
+
+
+class ResultCache(object):
+    """
+    This class holds search results in least recently used order, bounded
+    by number of entries and by size of their encoding in the format each
+    was requested in.  All entries
+    belong to one snapshot generation; results of a newer generation
+    replace the whole content.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = None
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _invalidate(self, generation):
+        """
+        Purpose: Drop all entries if they belong to another generation.
+                 Caller must hold the lock.
+        Input Parameters: generation - current snapshot generation.
+        Return: N/A.
+        Exceptions: N/A."""
+        if generation != self._generation:
+            if self._entries:
+                self.invalidations += 1
+                logger.debug('Result cache invalidated for generation %d.', generation)
+            self._entries.clear()
+            self._bytes = 0
+            self._generation = generation
+
+    def get(self, generation, key):
+        """
+        Purpose: Find cached results of a request.
+        Input Parameters:
+            generation - generation of the current snapshot.
+            key - hashable key of the request.
+        Return: ResultList, None if not cached.
+        Exceptions: N/A."""
+        with self._lock:
+            self._invalidate(generation)
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            # Re-insert as most recently used.
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, result_list, response_format=JSON, size=None):
+        """
+        Purpose: Cache results of a request, evicting the least recently
+                 used entries to stay within bounds.  Results of an older
+                 generation than the cached ones, or larger than the byte
+                 bound on their own, are not cached.
+        Input Parameters:
+            key - hashable key of the request, including its format.
+            result_list - ResultList to cache, encoded if needed.
+            response_format - formats.ResponseFormat the results are
+                              sized in, default = JSON.
+            size - bytes to count the entry as, default = None for the
+                   size of its encoding in response_format.
+        Return: N/A.
+        Exceptions: N/A."""
+        if self.max_entries < 1:
+            return
+
+        generation = result_list.generation
+        if size is None:
+            size = result_list.encoded_size(response_format)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if self._generation is not None and generation < self._generation:
+                return
+            self._invalidate(generation)
+
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self._bytes -= old_entry[1]
+
+            while self._entries and (len(self._entries) >= self.max_entries or
+                                     self._bytes + size > self.max_bytes):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+            self._entries[key] = (result_list, size)
+            self._bytes += size
+
+    def stats(self):
+        """
+        Purpose: Report use of the cache.
+        Input Parameters: N/A.
+        Return: OrderedDict of counters and current size.
+        Exceptions: N/A."""
+        with self._lock:
+            stats = OrderedDict()
+            stats['generation'] = self._generation
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+            stats['max_entries'] = self.max_entries
+            stats['max_bytes'] = self.max_bytes
+            stats['hits'] = self.hits
+            stats['misses'] = self.misses
+            stats['evictions'] = self.evictions
+            stats['invalidations'] = self.invalidations
+            return stats
@@ -0,0 +1,213 @@
+"""
+This module saves loaded records and lookup tables of a source file
+in a compiled form, so that a restart with the source unchanged can
+rebuild them without parsing and grouping the file again.
+
+A compiled index holds the well formed lines of the source in file
+order, as rebuilt from the records, and, for each field, a dictionary of value to line positions;
+or None when each record is registered under its own value of the
+field alone, such as unique names, which is rebuilt from the records.  It is encoded with marshal and keyed by the
+path, size, modification time and md5 digest of the source it was
+built from.
+
+Compiled indexes are also how a loader process publishes each snapshot
+to worker processes attached to it; see DataManager.attach_data.
+"""
+import marshal
+import os
+import os.path
+import tempfile
+from hashlib import md5
+from itertools import imap, izip
+from operator import attrgetter
+# Get an instance of a logger.
+import logging
+logger = logging.getLogger(__name__)
+
+# Version of the compiled form; change when records or lookups are
+# built differently so older indexes are rebuilt.
+INDEX_VERSION = 1
+
+# File name suffix of compiled indexes.
+INDEX_SUFFIX = '.pwdidx'
+
+
+def index_path(directory, data_type_name):
+    """
+    Purpose: Name the compiled index file of a data type.
+    Input Parameters:
+        directory - directory holding compiled indexes.
+        data_type_name - name of data type.
+    Return: path of compiled index file.
+    Exceptions: N/A."""
+    return os.path.join(directory, data_type_name.lower() + INDEX_SUFFIX)
+
+
+def source_key(path, mtime, digest):
+    """
+    Purpose: Build the key telling whether a compiled index was built
+             from the current content of a source file.
+    Input Parameters:
+        path - path of source file.
+        mtime - modification time of source as read.
+        digest - md5 hex digest of source as read.
+    Return: tuple of (path, size, mtime, digest), None if the file
+            can't be examined.
+    Exceptions: N/A."""
+    try:
+        size = os.stat(path).st_size
+    except EnvironmentError:
+        return None
+    return path, size, mtime, digest
+
+
+def line_digest(line):
+    """
+    Purpose: Digest a source line to key the record parsed from it, so
+             reloads can find unchanged lines without keeping them.
+    Input Parameters: line - line of source file without line terminator.
+    Return: binary md5 digest as a string.
+    Exceptions: N/A."""
+    return md5(line).digest()
+
+
+def owns_values(field, values, items):
+    """
+    Purpose: Determine if a field's lookup table registers each record
+             under its own value of the field, and nothing else.
+    Input Parameters:
+        field - name of field.
+        values - lookup table of field as built by prepare_search.
+        items - list of records.
+    Return: True if the table can be rebuilt from the records.
+    Exceptions: N/A."""
+    if len(values) != len(items):
+        return False
+
+    for item in items:
+        matches = values.get(getattr(item, field))
+        if matches is None or len(matches) != 1 or matches[0] is not item:
+            return False
+    return True
+
+
+def write_index(file_path, key, items, lookup):
+    """
+    Purpose: Save records and lookup tables as a compiled index.  The
+             file is replaced by rename, so readers never see a partly
+             written index.
+    Input Parameters:
+        file_path - path of compiled index file.
+        key - key of the source as returned by source_key.
+        items - list of records in file order.
+        lookup - lookup dictionary of items as built by prepare_search.
+    Return: True if the index was written.
+    Exceptions: N/A."""
+    lines = [':'.join(item.source_fields()) for item in items]
+    position_of = dict((id(item), position) for position, item in enumerate(items))
+
+    fields = {}
+    for field, values in lookup.iteritems():
+        if owns_values(field, values, items):
+            fields[field] = None
+        else:
+            fields[field] = dict((value, [position_of[id(match)] for match in matches])
+                                 for value, matches in values.iteritems())
+
+    temp_path = None
+    try:
+        directory, name = os.path.split(file_path)
+        handle, temp_path = tempfile.mkstemp(suffix='.tmp', prefix=name + '.', dir=directory)
+        with os.fdopen(handle, 'wb') as index_file:
+            marshal.dump((INDEX_VERSION, key, lines, fields), index_file)
+        os.rename(temp_path, file_path)
+    except EnvironmentError, env_error:
+        logger.error('Unable to write compiled index %s: %s', file_path, env_error)
+        if temp_path is not None:
+            try:
+                os.remove(temp_path)
+            except EnvironmentError:
+                pass
+        return False
+
+    logger.debug('Wrote compiled index %s of %d records.', file_path, len(items))
+    return True
+
+
+def load_index(file_path):
+    """
+    Purpose: Read a compiled index without checking what it was built from.
+    Input Parameters:
+        file_path - path of compiled index file.
+    Return: tuple of (key, lines, fields) as written by write_index, None
+            if there is no index of the current version.
+    Exceptions: N/A."""
+    try:
+        with open(file_path, 'rb') as index_file:
+            version, key, lines, fields = marshal.load(index_file)
+    except (EnvironmentError, EOFError, ValueError, TypeError), load_error:
+        logger.debug('No usable compiled index %s: %s', file_path, load_error)
+        return None
+
+    if version != INDEX_VERSION:
+        logger.debug('Compiled index %s is of version %s.', file_path, version)
+        return None
+    return key, lines, fields
+
+
+def build_index(lines, fields, data_type, keep_source=True):
+    """
+    Purpose: Rebuild records and lookup tables from the content of a
+             compiled index.
+    Input Parameters:
+        lines - lines of records as returned by load_index.
+        fields - lookup positions as returned by load_index.
+        data_type - data type to create.
+        keep_source - False to leave out the source dictionary of line
+                      digest to record, which only a process reloading the
+                      source needs; default = True.
+    Return: tuple of (list of records, lookup dictionary, None, source)
+            as built by loading the source.
+    Exceptions: N/A."""
+    items = []
+    for line in lines:
+        new_item = data_type()
+        new_item.load_from_list(line.split(':'))
+        items.append(new_item)
+    source = dict(izip(imap(line_digest, lines), items)) if keep_source else {}
+
+    lookup = {}
+    for field, positions in fields.iteritems():
+        if positions is None:
+            lookup[field] = dict(izip(imap(attrgetter(field), items),
+                                      [[item] for item in items]))
+        else:
+            lookup[field] = dict((value, [items[position] for position in value_positions])
+                                 for value, value_positions in positions.iteritems())
+
+    return items, lookup, None, source
+
+
+def read_index(file_path, key, data_type):
+    """
+    Purpose: Rebuild records and lookup tables from a compiled index.
+    Input Parameters:
+        file_path - path of compiled index file.
+        key - key of the current source as returned by source_key.
+        data_type - data type to create.
+    Return: tuple of (list of records, lookup dictionary, None, source)
+            as built by loading the source, None if there is no index
+            for this key.
+    Exceptions: N/A."""
+    index = load_index(file_path)
+    if index is None:
+        return None
+
+    index_key, lines, fields = index
+    if index_key != key:
+        logger.debug('Compiled index %s is out of date.', file_path)
+        return None
+
+    content = build_index(lines, fields, data_type)
+    logger.debug('Read compiled index %s of %d records.', file_path, len(content[0]))
+    return content
@@ -6,15 +6,32 @@ file change while running.
 
 import os
 import os.path
+import gc
 import logging
 import json
+import marshal
+import mmap
+import multiprocessing
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from hashlib import md5
 
 from collections import OrderedDict
-from watchdog.observers import Observer
-from watchdog.events import PatternMatchingEventHandler
+from itertools import chain, count, imap, izip
 from django.conf import settings
-from pwdsvc.models import Account, Group
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, connection, transaction
+from pwdsvc.models import SQL_BATCH_SIZE, Account, Group, SourceState
 from pwdsvc.errors import QueryError, PathError
+from pwdsvc.formats import pack_fields
+from pwdsvc.results import ResultList
+from pwdsvc.query import field_key, in_bounds, parse_ranges, to_int
+from pwdsvc.scheduler import ReloadScheduler
+from pwdsvc.watcher import FileWatcher
+from pwdsvc.compiled import (build_index, index_path, line_digest, load_index, read_index,
+                             source_key, write_index)
 
 # Get an instance of a logger.
 logger = logging.getLogger(__name__)
@@ -24,13 +41,32 @@ class BaseDataType(object):
     """
     This class implements the common structure and functionality
     related to data loaded from either passwd or group files.
+
+    Fields are held in __slots__ named by field_names rather than a
+    per instance dictionary, keeping each record small.  Records are
+    not changed once loaded, so their encoding in each response format
+    is cached.
     """
 
-    def __init__(self, field_names):
-        self._fields = OrderedDict()
+    # Names of fields in output order; defined by sub-classes.
+    field_names = ()
+
+    __slots__ = ('_json', '_msgpack', '_line')
 
-        for name in field_names:
-            self._fields[name] = ''
+    def __init__(self):
+        for name in self.field_names:
+            setattr(self, name, '')
+        self.clear_encoded()
+
+    def clear_encoded(self):
+        """
+        Purpose: Drop cached encodings after fields are loaded.
+        Input Parameters: N/A
+        Return: N/A
+        Exceptions: N/A"""
+        self._json = None
+        self._msgpack = None
+        self._line = None
 
     def get_field(self, key):
         """
@@ -41,40 +77,102 @@ class BaseDataType(object):
         Exceptions: N/A"""
         ret = None
 
-        if key in self._fields:
-            ret = self._fields[key]
+        if key in self.field_names:
+            ret = getattr(self, key)
 
         return ret
 
     def from_dict(self, data_dict):
         """
-        Populates a dictionary from the fields in 
-        instance of sub- class.
+        Populates the fields of this instance of sub-class
+        from a dictionary.
         Input Parameters: data_dict - dicttionary to use to populate fields.
         Return: N/A
         Exceptions: N/A        
         """
-        self._fields = data_dict
+        for name in self.field_names:
+            setattr(self, name, data_dict[name])
+        self.clear_encoded()
+
+    def to_dict(self):
+        """
+        Purpose: Return fields of this instance in an OrderedDict.
+        Input Parameters: N/A
+        Return: OrderedDict of field name to value in field_names order.
+        Exceptions: N/A"""
+        return OrderedDict((name, getattr(self, name)) for name in self.field_names)
+
+    def to_json(self):
+        """
+        Purpose: Return json representation of fields as string,
+                 encoding it on first use only.
+        Input Parameters: N/A
+        Return: json encoded value of fields as a string.
+        Exceptions: N/A"""
+        if self._json is None:
+            self._json = json.dumps(self.to_dict(), sort_keys=False)
+        return self._json
+
+    def to_msgpack(self):
+        """
+        Purpose: Return msgpack map of field name to value as string,
+                 encoding it on first use only.
+        Input Parameters: N/A
+        Return: msgpack encoded value of fields as a string.
+        Exceptions: N/A"""
+        if self._msgpack is None:
+            self._msgpack = pack_fields(self.field_names,
+                                        [getattr(self, name) for name in self.field_names])
+        return self._msgpack
+
+    def line_fields(self):
+        """
+        Purpose: Return the fields of the source file line of this
+                 instance; defined by sub-classes.
+        Input Parameters: N/A
+        Return: list of field values in source file order.
+        Exceptions: N/A"""
+        raise NotImplementedError
+
+    def source_fields(self):
+        """
+        Purpose: Return field values that parse back to this instance,
+                 kept exactly as read unlike line_fields.
+        Input Parameters: N/A
+        Return: list of field values in source file order.
+        Exceptions: N/A"""
+        return self.line_fields()
+
+    def to_line(self):
+        """
+        Purpose: Return fields as a line of the source file, as printed
+                 by getent, encoding it on first use only.  Passwords
+                 are not loaded and are given as 'x'.
+        Input Parameters: N/A
+        Return: utf-8 encoded line without terminator.
+        Exceptions: N/A"""
+        if self._line is None:
+            line = ':'.join(self.line_fields())
+            if isinstance(line, unicode):
+                line = line.encode('utf-8')
+            self._line = line
+        return self._line
 
     def __repr__(self):
         """
         Purpose: Return json representation of fields as string.
         Input Parameters: N/A
-        Return: json encoded value of _fields as a string.
+        Return: json encoded value of fields as a string.
         Exceptions: N/A"""
-        out_dict = {}
-        for key, val in self._fields.items():
-            out_dict[key] = val
-
-        return json.dumps(self._fields, sort_keys=False)
+        return self.to_json()
 
     def compare_fields(self, fields):
         """
-        Purpose: Compare the _fields in this instance to fields passed in.
+        Purpose: Compare the fields in this instance to fields passed in.
         Input Parameters: fields, dictionary of values to compare against.
         Return: True if all fields match.
                 True if field name is members and all fields
-                in input parameter are subset of _fields[members].
+                in input parameter are subset of members.
                 Other wise False.
         Exceptions: QueryError if unsupported fields are specified."""
         ret = True
@@ -82,8 +180,7 @@ class BaseDataType(object):
         for key, val in fields.items():
             if key == 'member':
                 query_members = fields.getlist(key)
-                data_key = 'members'
-                data_members = self._fields[data_key].split(',')
+                data_members = self.member_set
 
                 # So long as the queried members exist it's to be considered a match,
                 # even if there are additional members not in the query.
@@ -93,17 +190,49 @@ class BaseDataType(object):
                         break
 
             else:
-                if key not in self._fields:
+                if key not in self.field_names:
                     errmsg = 'Unsupported key for this type: %s' % (key)
                     logger.debug(errmsg)
                     raise QueryError(errmsg)
 
-                if self._fields[key] != val:
+                if getattr(self, key) != val:
                     ret = False
                     break
 
         return ret
 
+    def match_field(self, key, value):
+        """
+        Purpose: Check one field of this instance against a value.
+        Input Parameters:
+            key - name of field as used in lookup dictionaries.
+            value - value to compare; for members the name of one member.
+        Return: True if the field matches.
+        Exceptions: N/A."""
+        if key == 'members':
+            return value in self.member_set
+        return getattr(self, key) == value
+
+    def search_values(self):
+        """
+        Purpose: List the field name and value pairs this instance
+                 is registered under in lookup dictionaries.
+        Input Parameters: N/A.
+        Return: list of (field name, value) tuples.
+        Exceptions: N/A."""
+        ret = []
+
+        for key in self.field_names:
+            val = getattr(self, key)
+            if key == 'members':
+                # Register each distinct member name to this instance.
+                for subval in self.member_set:
+                    ret.append((key, subval))
+            else:
+                ret.append((key, val))
+
+        return ret
+
     def prepare_search(self, dict_):
         """
         Purpose: Loads dictionaries to support lookup of specified values.
@@ -113,29 +242,18 @@ class BaseDataType(object):
 
         if(len(dict_)) == 0:
             # initialize lookup table if empty
-            for key, val in self._fields.items():
+            for key in self.field_names:
                 dict_[key] = {}
 
         # update lookup table with my current values
-        for key, val in self._fields.items():
-            if key == 'members':
-                # Split members csv format and register
-                # each name to this instance.
-                for subval in val.split(','):
-                    if subval not in dict_[key]:
-                        # lazy initialize list
-                        dict_[key][subval] = []
-
-                    # add user name to list
-                    dict_[key][subval].append(self)
-            else:
-                if val not in dict_[key]:
-                    # lazy initialize of lookup
-                    dict_[key][val] = []
+        for key, val in self.search_values():
+            if val not in dict_[key]:
+                # lazy initialize of lookup
+                dict_[key][val] = []
 
-                # Register this instance as value to return
-                # from search of this field type/value combo.
-                dict_[key][val].append(self)
+            # Register this instance as value to return
+            # from search of this field type/value combo.
+            dict_[key][val].append(self)
 
 
 class PasswordData(BaseDataType):
@@ -144,10 +262,15 @@ class PasswordData(BaseDataType):
     related to data loaded from passwd file.
     """
 
-    def __init__(self):
-        field_names = ['name', 'uid', 'gid', 'comment', 'home', 'shell']
-        BaseDataType.__init__(self, field_names)
-        self.source_field_size = 7
+    field_names = ('name', 'uid', 'gid', 'comment', 'home', 'shell')
+    __slots__ = field_names
+
+    # Number of fields in a line of the passwd file.
+    source_field_size = 7
+
+    # Account fields in the order returned by to_row.
+    model_fields = ('uid', 'name', 'gid', 'comment', 'home', 'shell',
+                    'uid_number', 'gid_number')
 
     def load_from_list(self, list_):
         """
@@ -157,27 +280,50 @@ class PasswordData(BaseDataType):
         Exceptions: N/A."""
 
         if len(list_) == 7:
-            self._fields['name'] = list_[0]
-            self._fields['uid'] = list_[2]
-            self._fields['gid'] = list_[3]
-            self._fields['comment'] = list_[4]
-            self._fields['home'] = list_[5]
-            self._fields['shell'] = list_[6]
+            self.name = list_[0]
+            self.uid = list_[2]
+            # Few distinct values are shared by many accounts,
+            # so share one copy of each string between records.
+            self.gid = intern(list_[3])
+            self.comment = list_[4]
+            self.home = list_[5]
+            self.shell = intern(list_[6])
+            self.clear_encoded()
         else:
             raise RuntimeError('Invalid User Data: %s' % (list_))
 
     def to_model(self):
         account = Account()
-        account.name = self._fields['name']
-        account.uid = self._fields['uid']
+        account.name = self.name
+        account.uid = self.uid
+
+        # Refer to the group by key rather than fetching it; an account
+        # may keep a primary gid whose group line was removed.
+        account.gid_id = self.gid
+
+        account.comment = self.comment
+        account.home = self.home
+        account.shell = self.shell
+        account.uid_number = to_int(self.uid)
+        account.gid_number = to_int(self.gid)
+        return account
 
-        gid_pk = self._fields['gid']
-        account.gid = Group.objects.get(gid=gid_pk)
+    def to_row(self):
+        """
+        Purpose: Return the values of Account fields for a bulk insert.
+        Input Parameters: N/A.
+        Return: tuple of values in model_fields order.
+        Exceptions: N/A."""
+        return (self.uid, self.name, self.gid, self.comment, self.home, self.shell,
+                to_int(self.uid), to_int(self.gid))
 
-        account.comment = self._fields['comment']
-        account.home = self._fields['home']
-        account.shell = self._fields['shell']
-        return account
+    def line_fields(self):
+        """
+        Purpose: Return the fields of the passwd line of this instance.
+        Input Parameters: N/A.
+        Return: list of field values in passwd file order.
+        Exceptions: N/A."""
+        return [self.name, 'x', self.uid, self.gid, self.comment, self.home, self.shell]
 
 
 class GroupData(BaseDataType):
@@ -186,9 +332,20 @@ class GroupData(BaseDataType):
     related to data loaded from group file.
     """
 
+    field_names = ('name', 'gid', 'members')
+
+    # member_set holds the members csv split into a frozenset of names.
+    __slots__ = field_names + ('member_set',)
+
+    # Number of fields in a line of the group file.
+    source_field_size = 4
+
+    # Group fields in the order returned by to_row.
+    model_fields = ('gid', 'name', 'gid_number')
+
     def __init__(self):
-        self.source_field_size = 4
-        BaseDataType.__init__(self, ['name', 'gid', 'members'])
+        BaseDataType.__init__(self)
+        self.member_set = frozenset([''])
 
     def load_from_list(self, list_):
         """
@@ -198,126 +355,659 @@ class GroupData(BaseDataType):
         Exceptions: N/A."""
 
         if len(list_) == 4:
-            self._fields['name'] = list_[0]
-            self._fields['gid'] = list_[2]
-            self._fields['members'] = list_[3]
+            self.name = list_[0]
+            self.gid = list_[2]
+            self.members = list_[3]
+            self.member_set = frozenset(self.members.split(','))
+            self.clear_encoded()
         else:
             raise RuntimeError('Invalid Group Data: %s' % (list_))
 
+    def from_dict(self, data_dict):
+        """
+        Populates the fields of this instance from a dictionary.
+        Input Parameters: data_dict - dictionary to use to populate fields.
+        Return: N/A
+        Exceptions: N/A
+        """
+        BaseDataType.from_dict(self, data_dict)
+        self.member_set = frozenset(self.members.split(','))
+
     def to_model(self):
         group = Group()
-        group.name = self._fields['name']
-        group.gid = self._fields['gid']
+        group.name = self.name
+        group.gid = self.gid
+        group.gid_number = to_int(self.gid)
         return group
 
-    def load_members(self, data_mgr):
-        gid = self._fields['gid']
-        gid_pk = gid
-        group = Group.objects.get(gid=gid_pk)
-        member_names = self._fields['members'].split(',')
+    def to_row(self):
+        """
+        Purpose: Return the values of Group fields for a bulk insert.
+        Input Parameters: N/A.
+        Return: tuple of values in model_fields order.
+        Exceptions: N/A."""
+        return (self.gid, self.name, to_int(self.gid))
+
+    def line_fields(self):
+        """
+        Purpose: Return the fields of the group line of this instance;
+                 members are listed without the trailing comma of groups
+                 read from the database.
+        Input Parameters: N/A.
+        Return: list of field values in group file order.
+        Exceptions: N/A."""
+        members = ','.join([member for member in self.members.split(',') if member])
+        return [self.name, 'x', self.gid, members]
+
+    def source_fields(self):
+        """
+        Purpose: Return the fields of the group line of this instance,
+                 members as read.
+        Input Parameters: N/A.
+        Return: list of field values in group file order.
+        Exceptions: N/A."""
+        return [self.name, 'x', self.gid, self.members]
+
+    def member_names(self, data_mgr, snapshot=None):
+        """
+        Purpose: List names of accounts belonging to this group; those
+                 listed in the group file plus those with this primary gid.
+        Input Parameters:
+            data_mgr - instance of DataManager to search for accounts.
+            snapshot - DataSnapshot to search, defaults to current.
+        Return: list of account names.
+        Exceptions: N/A."""
+        member_names = self.members.split(',')
+        known_names = set(member_names)
 
-        acct_results = data_mgr.search(PWD_TYPENAME, 'gid', gid)
+        acct_results = data_mgr.search(PWD_TYPENAME, 'gid', self.gid, snapshot)
         for acct in acct_results:
-            acct_name = acct._fields['name']
-            if acct_name not in member_names:
-                member_names.append(acct_name)
+            if acct.name not in known_names:
+                known_names.add(acct.name)
+                member_names.append(acct.name)
+
+        return [member_name for member_name in member_names if len(member_name)]
 
-        for member_name in member_names:
-            if len(member_name):
-                acct_name = member_name
-                acct = Account.objects.get(name=acct_name)
-                logger.debug('Loading account with name: %s into group with gid: %s.', acct_name, gid)
-                group.members.add(acct)
-                group.save()
+
+PWD_TYPENAME = PasswordData.__name__
+GRP_TYPENAME = GroupData.__name__
 
 
-class DataFileEventHandler(PatternMatchingEventHandler):
+class SortedIndex(object):
     """
-    This class handles file change events on passwd or group files.
+    This class holds records ordered by the value of one field, so that
+    the records with values in a range are found by bisection at a cost
+    proportional to the number of records returned.
     """
 
-    def __init__(self, patterns):
-        PatternMatchingEventHandler.__init__(self, patterns)
-        self._data_mgr = None
-        self._data_type = None
-        self._file_path = ''
+    __slots__ = ('keys', 'positions', 'items')
 
-    def init_callback(self, data_mgr, file_path, data_type):
+    def __init__(self, items, key_func):
+        entries = []
+        for position, item in enumerate(items):
+            key = key_func(item)
+            if key is not None:
+                entries.append((key, position, item))
+        # Positions are unique so records themselves are never compared.
+        entries.sort()
+
+        self.keys = [entry[0] for entry in entries]
+        self.positions = [entry[1] for entry in entries]
+        self.items = [entry[2] for entry in entries]
+
+    def bounds(self, low, high):
         """
-        Purpose: Initializes callback so that this class can
-                 reload the data in DataManager.
+        Purpose: Find the slice of records with keys in a range.
         Input Parameters:
-            data_mgr - instance of data_mgr.
-            file_path - path to file to watch.
-            data_type - type of data being watched (Password or Group).
-        Return: N/A.
+            low - smallest key included, None if unbounded.
+            high - key excluded and above, None if unbounded.
+        Return: tuple of (start, stop) positions in the sorted records.
         Exceptions: N/A."""
+        start = 0 if low is None else bisect_left(self.keys, low)
+        stop = len(self.keys) if high is None else bisect_left(self.keys, high)
+        return start, max(start, stop)
 
-        logger.debug('Callback initialized: %s', file_path)
-        self._data_mgr = data_mgr
-        self._data_type = data_type
-        self._file_path = file_path
+    def count(self, low, high):
+        """
+        Purpose: Count records with keys in a range.
+        Input Parameters: low, high - range as passed to bounds.
+        Return: number of records.
+        Exceptions: N/A."""
+        start, stop = self.bounds(low, high)
+        return stop - start
 
-    def on_modified(self, event):
+    def select(self, low, high):
         """
-        Purpose: Receives notification of file change and calls
-                on DataManager instance to reload.
+        Purpose: Return records with keys in a range.
+        Input Parameters: low, high - range as passed to bounds.
+        Return: list of records in file order.
+        Exceptions: N/A."""
+        start, stop = self.bounds(low, high)
+        selected = sorted(izip(self.positions[start:stop], self.items[start:stop]))
+        return [item for _, item in selected]
+
+
+class DataSnapshot(object):
+    """
+    This class holds one complete generation of loaded data; records,
+    lookup tables and load status for both passwd and group types.
+    A snapshot is never modified once published by DataManager, so
+    readers holding a reference always see consistent content.
+    """
+
+    def __init__(self, generation, item_list, item_lookup, item_status, item_source,
+                 published):
+        # Monotonically increasing number identifying this snapshot.
+        self.generation = generation
+
+        # Per type ResultList of all data loaded, in file order.
+        self.item_list = item_list
+
+        # Per type dictionary of dictionaries that allows for search of data
+        # without a database intance.
+        self.item_lookup = item_lookup
+
+        # Per type instances of server error codes raised on internal error
+        # such as misconfigured settings file (i.e. invalid passowrd file).
+        self.item_status = item_status
+
+        # Per type dictionary of the digest of each source file line to
+        # the record parsed from it, used to find what changed when the
+        # file is reloaded without keeping the lines themselves.
+        self.item_source = item_source
+
+        # Whole seconds since the epoch when this snapshot was published,
+        # later than every snapshot before it, 0 for no data loaded.
+        self.published = published
+
+        # Effective group membership of each account, built on first use
+        # by user_groups.  Derived from the content above so building it
+        # does not change what the snapshot holds.
+        self._user_groups = None
+
+        # Per type and field SortedIndex for range queries, built on
+        # first use by sorted_index.
+        self._sorted_indexes = {}
+        self._derived_lock = threading.Lock()
+
+    def build_user_groups(self):
+        """
+        Purpose: Build the effective group membership of every account;
+                 its primary group followed by groups listing it as a
+                 member, each group once.
+        Input Parameters: N/A
+        Return: dictionary of 'uid' and 'name' to dictionaries of
+                field value to ResultList of GroupData instances.
+        Exceptions: N/A."""
+        group_lookup = self.item_lookup[GRP_TYPENAME]
+        groups_by_gid = group_lookup.get('gid', {})
+        groups_by_member = group_lookup.get('members', {})
+
+        by_uid = {}
+        by_name = {}
+        for account in self.item_list[PWD_TYPENAME]:
+            # The first account with a uid or name is the one searches return.
+            if account.uid in by_uid and account.name in by_name:
+                continue
+
+            groups = ResultList(generation=self.generation)
+            seen = set()
+            for group in chain(groups_by_gid.get(account.gid, ()),
+                               groups_by_member.get(account.name, ())):
+                if id(group) not in seen:
+                    seen.add(id(group))
+                    groups.append(group)
+
+            by_uid.setdefault(account.uid, groups)
+            by_name.setdefault(account.name, groups)
+
+        return {'uid': by_uid, 'name': by_name}
+
+    def user_groups(self, search_key, search_value):
+        """
+        Purpose: Return the groups an account belongs to, building the
+                 membership index of this snapshot if needed.
         Input Parameters:
-            event - type of filesystem event.
-        Return: N/A.
+            search_key - 'uid' or 'name' field identifying the account.
+            search_value - value of search_key for the account.
+        Return: ResultList of GroupData instances, None when no account
+                matches.  The list must not be modified by the caller.
+        Exceptions: KeyError if search_key is not 'uid' or 'name'."""
+        index = self._user_groups
+        if index is None:
+            with self._derived_lock:
+                if self._user_groups is None:
+                    self._user_groups = self.build_user_groups()
+                index = self._user_groups
+
+        return index[search_key].get(search_value)
+
+    def sorted_index(self, data_type_name, field):
+        """
+        Purpose: Return records of data type sorted by the value of
+                 field, building the index on first use.
+        Input Parameters:
+            data_type_name - name of data type to index.
+            field - name of field to sort by, ordered by field_key.
+        Return: SortedIndex instance.
         Exceptions: N/A."""
-        logger.debug("on_modified event received: %s", event)
+        key = (data_type_name, field)
+        index = self._sorted_indexes.get(key)
+        if index is None:
+            with self._derived_lock:
+                index = self._sorted_indexes.get(key)
+                if index is None:
+                    index = SortedIndex(self.item_list[data_type_name],
+                                        lambda item: field_key(field, getattr(item, field)))
+                    self._sorted_indexes[key] = index
+        return index
+
+    def replace_types(self, parts):
+        """
+        Purpose: Create the next generation of this snapshot with the
+                 content of one or more data types replaced.
+        Input Parameters:
+            parts - dictionary of data type name to tuple of
+                    (list of records, lookup dictionary, status, source)
+                    as returned by DataManager.load_data_by_type.
+        Return: new DataSnapshot instance.
+        Exceptions: N/A."""
+        generation = self.generation + 1
 
-        if event.src_path == self._file_path:
-            logger.debug("Path changed: %s", self._file_path)
-        else:
-            logger.debug('Not the path being observed.')
-            return
+        # Last-Modified has whole seconds; each generation is published
+        # at least a second after the last, even when file times are equal
+        # or move backwards, so If-Modified-Since never hides a change.
+        published = max(int(time.time()), self.published + 1)
 
-        if self._data_mgr != None:
-            try:
-                self._data_mgr.reload_datatype(self._data_type)
-            except RuntimeError, runtime_error:
-                logger.error(runtime_error)
+        item_list = dict(self.item_list)
+        item_lookup = dict(self.item_lookup)
+        item_status = dict(self.item_status)
+        item_source = dict(self.item_source)
 
+        for data_type_name, (items, lookup, status, source) in parts.items():
+            item_list[data_type_name] = ResultList(items, generation)
+            item_lookup[data_type_name] = lookup
+            item_status[data_type_name] = status
+            item_source[data_type_name] = source
 
-PWD_TYPENAME = PasswordData.__name__
-GRP_TYPENAME = GroupData.__name__
+        return DataSnapshot(generation, item_list, item_lookup, item_status, item_source,
+                            published)
+
+    def find(self, data_type_name, field, value):
+        """
+        Purpose: Return the records of a data type whose field has value,
+                 straight from the lookup tables of this snapshot.
+        Input Parameters:
+            data_type_name - name of data type to search.
+            field - name of field to match.
+            value - value of field to match.
+        Return: list of records, None if the type wasn't loaded or no
+                record matches.  The list must not be modified.
+        Exceptions: N/A."""
+        if self.item_status[data_type_name] is not None:
+            return None
+        return self.item_lookup[data_type_name].get(field, {}).get(value)
+
+    def last_modified(self):
+        """
+        Purpose: Return when the content of this snapshot last changed;
+                 when it was published.
+        Input Parameters: N/A
+        Return: whole seconds since the epoch, None if no data is loaded.
+        Exceptions: N/A."""
+        return self.published or None
+
+
+EMPTY_SNAPSHOT = DataSnapshot(
+    0,
+    {PWD_TYPENAME: ResultList(), GRP_TYPENAME: ResultList()},
+    {PWD_TYPENAME: {}, GRP_TYPENAME: {}},
+    {PWD_TYPENAME: None, GRP_TYPENAME: None},
+    {PWD_TYPENAME: {}, GRP_TYPENAME: {}},
+    0)
+
+# When more than this fraction of records change on reload, rebuild
+# lookup tables from scratch rather than patching them.
+PATCH_RATIO_LIMIT = 0.5
+
+# Smallest part of a source file parsed by one task of a parallel load;
+# files too small for two parts are parsed in process.
+LOAD_CHUNK_BYTES = 1024 * 1024
+
+
+def clear_table(model):
+    """
+    Purpose: Delete all rows of a model's table with a single statement,
+             without collecting rows for cascades or signals.
+    Input Parameters:
+        model - django model class whose table is cleared.
+    Return: N/A.
+    Exceptions: N/A."""
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % connection.ops.quote_name(model._meta.db_table))
+
+
+def bulk_insert(model, field_names, rows):
+    """
+    Purpose: Insert rows into a model's table with one executemany call,
+             bypassing per row model instance creation.
+    Input Parameters:
+        model - django model class whose table receives the rows.
+        field_names - names of model fields given in each row.
+        rows - list of tuples of field values in field_names order.
+    Return: N/A.
+    Exceptions: N/A."""
+    if not rows:
+        return
+
+    quote_name = connection.ops.quote_name
+    columns = [quote_name(model._meta.get_field(name).column) for name in field_names]
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        quote_name(model._meta.db_table), ', '.join(columns),
+        ', '.join(['%s'] * len(columns)))
+
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+@contextmanager
+def gc_paused():
+    """
+    Purpose: Pause the cyclic garbage collector while building many
+             records at once.  Records hold no reference cycles, and
+             collections triggered by each allocation threshold would
+             otherwise traverse every record already built.
+    Input Parameters: N/A
+    Return: N/A
+    Exceptions: N/A."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def parse_record(data_type, line):
+    """
+    Purpose: Given data type; parse one line of source file.
+    Input Parameters:
+        data_type - data type to create.
+        line - line of source file without line terminator.
+    Return: new data_type instance, None if line is malformed.
+    Exceptions: N/A."""
+    new_item = data_type()
+
+    line_vals = line.split(':')
+
+    if len(line_vals) == new_item.source_field_size:
+        new_item.load_from_list(line_vals)
+        return new_item
+
+    logger.error(
+        'Data omitted as it appears to be malformed: %s.', line)
+    return None
+
+
+def source_chunks(path, count, min_bytes=LOAD_CHUNK_BYTES):
+    """
+    Purpose: Split a source file into parts starting and ending at
+             line boundaries, for parsing by separate processes.
+    Input Parameters:
+        path - path of source file.
+        count - number of parts wanted.
+        min_bytes - smallest part wanted, default = LOAD_CHUNK_BYTES.
+    Return: list of (start, end) byte offsets in file order.
+    Exceptions: EnvironmentError if the file can't be read."""
+    with open(path) as data_file:
+        size = os.fstat(data_file.fileno()).st_size
+        count = max(1, min(count, size // max(1, min_bytes)))
+        chunks = []
+        start = 0
+        for part in xrange(1, count + 1):
+            if start >= size:
+                break
+            end = size * part // count
+            if end < size:
+                # Extend to the end of the line the split falls in.
+                data_file.seek(max(end - 1, start))
+                data_file.readline()
+                end = data_file.tell()
+            if end > start:
+                chunks.append((start, end))
+                start = end
+        return chunks
+
+
+def parse_chunk(args):
+    """
+    Purpose: Parse part of a source file and index it; run in a worker
+             process of a parallel load.
+    Input Parameters:
+        args - tuple of (data type, path, start, end) where start and
+               end are byte offsets as returned by source_chunks.
+    Return: tuple of (lines, lookup) encoded by marshal, which returns
+            it to the parent far faster than pickle.  lines lists the well
+            formed lines without line terminator in file order, and lookup
+            maps each field name and value to the positions in lines
+            registered under it.
+    Exceptions: EnvironmentError if the file can't be read."""
+    data_type, path, start, end = args
+    lines = []
+    lookup = {}
+
+    with gc_paused(), open(path) as data_file:
+        data_file.seek(start)
+        position = start
+        while position < end:
+            line = data_file.readline()
+            if not line:
+                break
+            position += len(line)
+
+            line = line.rstrip('\n')
+            item = parse_record(data_type, line)
+            if item is None:
+                continue
+
+            index = len(lines)
+            lines.append(line)
+            for key, val in item.search_values():
+                lookup.setdefault(key, {}).setdefault(val, []).append(index)
+
+    return marshal.dumps((lines, lookup))
+
+
+def iter_lines(data_file):
+    """
+    Purpose: Read an open file a line at a time, so that no more than
+             one line and the file's read buffer are held in memory.
+    Input Parameters:
+        data_file - file open for reading, closed once all lines are read
+                    or the generator is discarded.
+    Return: generator of lines without line terminator.
+    Exceptions: N/A."""
+    try:
+        for line in data_file:
+            yield line.rstrip('\n')
+    finally:
+        data_file.close()
+
+
+def file_digest(data_file):
+    """
+    Purpose: Hash the content of an open file through a read only
+             memory map, without copying it into memory.
+    Input Parameters:
+        data_file - file open for reading.
+    Return: md5 hex digest of the file content.
+    Exceptions: EnvironmentError if the file can't be mapped."""
+    digest = md5()
+    try:
+        mapped = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # Empty files can't be mapped.
+        return digest.hexdigest()
+
+    try:
+        digest.update(mapped)
+    finally:
+        mapped.close()
+    return digest.hexdigest()
+
+
+def index_items(items):
+    """
+    Purpose: Build lookup tables for a list of records.
+    Input Parameters:
+        items - list of BaseDataType instances in file order.
+    Return: lookup dictionary as filled in by prepare_search.
+    Exceptions: N/A."""
+    lookup = {}
+    for item in items:
+        item.prepare_search(lookup)
+    return lookup
+
+
+def patch_lookup(lookup, items, added, removed):
+    """
+    Purpose: Build lookup tables for the next snapshot by copying the
+             tables of the previous one and updating only the entries
+             touched by added or removed records.  The tables passed
+             in are left unchanged.
+    Input Parameters:
+        lookup - lookup dictionary of the previous snapshot.
+        items - list of all records of the next snapshot in file order.
+        added - list of records not present in the previous snapshot.
+        removed - list of records no longer present.
+    Return: lookup dictionary for the next snapshot.
+    Exceptions: N/A."""
+    if not lookup:
+        return index_items(items)
+
+    removed_ids = set(imap(id, removed))
+
+    additions = {}
+    for item in added:
+        for key_val in item.search_values():
+            additions.setdefault(key_val, []).append(item)
+
+    touched = set(additions)
+    for item in removed:
+        touched.update(item.search_values())
+
+    position = None
+    if additions:
+        position = dict(izip(imap(id, items), count()))
+
+    new_lookup = dict((key, dict(table)) for key, table in lookup.iteritems())
+
+    for key, val in touched:
+        table = new_lookup[key]
+        entries = [entry for entry in table.get(val, ()) if id(entry) not in removed_ids]
+
+        if (key, val) in additions:
+            # keep search results in file order.
+            entries.extend(additions[(key, val)])
+            entries.sort(key=lambda entry: position[id(entry)])
+
+        if entries:
+            table[val] = entries
+        elif val in table:
+            del table[val]
+
+    return new_lookup
 
 
 class DataManager(object):
     """
     This class handles loading of passwd and group files and
     provides methods for searching the data loaded.
+
+    Loaded data is published as a DataSnapshot.  Reloads build the
+    next snapshot off to the side and publish it with a single
+    reference swap, so searches never block or see partial data.
     """
 
-    def __init__(self):
+    def __init__(self, background=False, attached=None):
+        """
+        Input Parameters:
+            background - True to load data on a separate thread and return
+                         at once, see is_ready; default = False to load
+                         before returning.
+            attached - True to attach to the data published by a loader
+                       process, see attach_data, False to load the sources;
+                       default = None to follow PWDSVC_ATTACH_LOADER.
+        Exceptions: ImproperlyConfigured if attached without compiled
+                    indexes to attach to.
+        """
         self._file_path = {}
         self._file_path[PWD_TYPENAME] = settings.PWDSVC_PASSWORD_FILE_PATH
         self._file_path[GRP_TYPENAME] = settings.PWDSVC_GROUP_FILE_PATH
 
-        # Per type dictionary of lists that hold all data loaded.
-        self._item_list = {}
+        # True when snapshots are taken from the compiled indexes a loader
+        # process publishes, rather than from the sources themselves.
+        if attached is None:
+            attached = settings.PWDSVC_ATTACH_LOADER
+        if attached and not settings.PWDSVC_INDEX_DIR:
+            raise ImproperlyConfigured(
+                'PWDSVC_INDEX_DIR must be set to attach to a loader process.')
+        self._attached = attached
 
-        # Per type dictionary of dictionaries that allows for search of data
-        # without a database intance.
-        self._item_lookup = {}
+        # Currently published snapshot of all data loaded.
+        self._snapshot = EMPTY_SNAPSHOT
 
-        # Per type instances of server error codes raised on internal error
-        # such as misconfigured settings file (i.e. invalid passowrd file).
-        self._item_status = {}
+        # Serializes building and publishing of snapshots.
+        self._reload_lock = threading.Lock()
+
+        # Per type md5 digest of the source content last loaded.
+        self._source_digest = {}
+
+        # Runs reloads requested by file events on a worker thread.
+        reload_func = self.attach_datatype if attached else self.reload_datatype
+        self._scheduler = ReloadScheduler(reload_func, settings.PWDSVC_RELOAD_DELAY)
+
+        # Generation of the snapshot last written to the database,
+        # None when the database is not known to match any snapshot.
+        self._db_generation = None
 
-        # Per type instances of watchdog to monitor url for change while running.
-        self._item_watch = {}
+        # Set once the first snapshot of loaded data is published, and
+        # once the initial load has also been written to the database.
+        self._ready = threading.Event()
+        self._loaded = threading.Event()
 
-        self.init_data_type(PWD_TYPENAME)
-        self.init_data_type(GRP_TYPENAME)
+        # Error that ended the initial load early, None if there was none.
+        self._load_error = None
+
+        # Watches the files of all types for change while running.
+        self._watcher = FileWatcher(self.schedule_reload, settings.PWDSVC_WATCH_BACKEND,
+                                    settings.PWDSVC_WATCH_INTERVAL)
 
         self.data_to_model = {}
         self.data_to_model[PWD_TYPENAME] = 'Account'
         self.data_to_model[GRP_TYPENAME] = 'Group'
 
-        self.load_data()
+        # Processes parsing full loads in parallel, see load_parallel.
+        # Python 2 can only fork them, and a child forked while another
+        # thread holds a lock, such as the logging lock, inherits it held
+        # and deadlocks on it.  They are forked once here, before this
+        # manager starts its loader, watcher or scheduler threads.
+        self._pool = None
+        self._workers = settings.PWDSVC_LOAD_WORKERS
+        if not attached and self._workers > 1:
+            try:
+                self._pool = multiprocessing.Pool(self._workers)
+            except (EnvironmentError, RuntimeError), runtime_error:
+                logger.error('Load workers failed to start, loading in process: %s',
+                             runtime_error)
+
+        if background:
+            loader = threading.Thread(target=self.load_in_background, name='DataManagerLoad')
+            loader.daemon = True
+            loader.start()
+        else:
+            self.load_data()
 
     def get_class(self, data_type_name):
         """
@@ -332,65 +1022,158 @@ class DataManager(object):
         elif data_type_name == GRP_TYPENAME:
             return GroupData()
 
-    def init_data_type(self, data_type_name):
+    def is_ready(self):
+        """
+        Purpose: Determine if data has been loaded and can be searched
+                 in memory; the database may still be loading.
+        Input Parameters: N/A
+        Return: True once a snapshot of loaded data is published.
+        Exceptions: N/A."""
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout=None):
         """
-        Purpose: Initialize dictionaries indexed by datatype to support search.
+        Purpose: Wait for data to be loaded and searchable in memory.
         Input Parameters:
-            data_type_name - name of data type to use as index.
-        Return: N/A.
+            timeout - seconds to wait, default = None to wait until ready.
+        Return: True if ready.
+        Exceptions: N/A."""
+        return self._ready.wait(timeout)
+
+    def wait_loaded(self, timeout=None):
+        """
+        Purpose: Wait for the initial load, including the database,
+                 to finish or fail.
+        Input Parameters:
+            timeout - seconds to wait, default = None to wait until done.
+        Return: True if the initial load is over.
+        Exceptions: N/A."""
+        return self._loaded.wait(timeout)
+
+    def load_error(self):
+        """
+        Purpose: Return the error that ended the initial load early.
+        Input Parameters: N/A
+        Return: exception instance, None unless the load failed.
+        Exceptions: N/A."""
+        return self._load_error
+
+    def database_generation(self):
+        """
+        Purpose: Return the generation of the snapshot last written to
+                 the database; database searches reflect that snapshot.
+        Input Parameters: N/A
+        Return: generation number, None if the last update failed.
+        Exceptions: N/A."""
+        return self._db_generation
+
+    def get_snapshot(self):
+        """
+        Purpose: Return the currently published snapshot.  Callers
+                 making several searches that must agree with each
+                 other should pass the same snapshot to each one.
+        Input Parameters: N/A
+        Return: DataSnapshot instance.
         Exceptions: N/A."""
-        self._item_lookup[data_type_name] = {}
-        self._item_status[data_type_name] = None
-        self._item_list[data_type_name] = []
-        self._item_watch[data_type_name] = None
+        return self._snapshot
 
-    def search_with_params(self, data_type_name, dict_):
+    def search_with_params(self, data_type_name, dict_, snapshot=None):
         """
         Purpose: Given data type name and dictionary of params
                  find a list of matching BaseDataType instances.
+
+                 Each parameter selects a list of candidates from the
+                 lookup tables.  Only the shortest of these lists is
+                 walked, checking each candidate against the remaining
+                 parameters, so cost is bounded by the most selective
+                 parameter rather than the broadest.
+
+                 Numeric fields also accept ranges, as uid__gte=1000
+                 or gid__lt=100, and name, home and comment accept
+                 prefixes, as home__startswith=/srv/.  These select
+                 from an index of records sorted by that field.
         Input Parameters:
             data_type_name - name of data type to use as index.
             dict_ - OrderedDict containing parameters to use as
                     search criteria.
-        Return: list of BaseDataType (or subclassed) instances.
-        Exceptions: N/A."""
-        ret = []
+            snapshot - DataSnapshot to search, defaults to current.
+        Return: ResultList of BaseDataType (or subclassed) instances
+                in file order.
+        Exceptions: QueryError if unsupported fields are specified."""
+        if snapshot is None:
+            snapshot = self._snapshot
+
+        ret = ResultList(generation=snapshot.generation)
 
-        if self._item_status[data_type_name] != None:
-            raise self._item_status[data_type_name]
+        if snapshot.item_status[data_type_name] != None:
+            raise snapshot.item_status[data_type_name]
 
-        for key, value in dict_.iteritems():
-            logger.debug("Key: %s - Value: %s - data_type_name: %s",
-                         key, value, data_type_name)
+        lookup_dict = snapshot.item_lookup[data_type_name]
+        field_names = self.get_class(data_type_name).field_names
+
+        # Each predicate is (size, description, fetch, check); fetch
+        # returns the candidates it selects and check tests a record.
+        predicates = []
+
+        for key in dict_:
+            if '__' in key:
+                continue
 
             data_key = key
+            values = [dict_[key]]
             if key == 'member':
+                # Repeated member parameters must all match.
                 data_key = 'members'
+                if hasattr(dict_, 'getlist'):
+                    values = dict_.getlist(key)
 
-            new_matches = self.search(data_type_name, data_key, value)
-
-            if new_matches != None:
-                logger.debug(
-                    'Found a potential match on: %s = %s.', key, value)
+            if data_key not in lookup_dict:
+                error_msg = 'search_key not found: %s' % (key)
+                logger.error(error_msg)
+                raise QueryError(error_msg)
 
-                for match in new_matches:
-                    # found a candidate
-                    if match in ret:
-                        # already in results, don't add again
-                        continue
+            for value in values:
+                candidates = lookup_dict[data_key].get(value, ())
+                predicates.append((
+                    len(candidates), (key, value),
+                    lambda candidates=candidates: candidates,
+                    lambda item, key=data_key, value=value: item.match_field(key, value)))
 
-                    # compare all fields in query
-                    if match.compare_fields(dict_):
-                        # all fields match, add to results
-                        ret.append(match)
-                    else:
-                        logger.debug('Failed compare: %s - %s.',
-                                     match, dict_)
-                        continue
+        try:
+            ranges = parse_ranges(dict_.items(), field_names)
+        except QueryError, query_error:
+            logger.error(query_error)
+            raise
+
+        for field, bounds in ranges.iteritems():
+            index = snapshot.sorted_index(data_type_name, field)
+            predicates.append((
+                index.count(*bounds), (field, bounds),
+                lambda index=index, bounds=bounds: index.select(*bounds),
+                lambda item, field=field, bounds=bounds: in_bounds(
+                    field, getattr(item, field), bounds)))
+
+        if not predicates:
+            return ret
+
+        predicates.sort(key=lambda predicate: predicate[0])
+        logger.debug('Query plan for %s: %s', data_type_name,
+                     [(description, size) for size, description, _, _ in predicates])
+
+        candidates = predicates[0][2]()
+        checks = [check for _, _, _, check in predicates[1:]]
+
+        for candidate in candidates:
+            for check in checks:
+                if not check(candidate):
+                    break
+            else:
+                ret.append(candidate)
 
         return ret
 
-    def search(self, data_type_name, search_key=None, search_value=None):
+    def search(self, data_type_name, search_key=None, search_value=None,
+               snapshot=None):
         """
         Purpose: Given data type name, key, and value;
                  find a list of matching BaseDataType instances.
@@ -398,23 +1181,28 @@ class DataManager(object):
             data_type_name - name of data type to use as index.
             search_key - field name to use as search criteria.
             search_value - value to use as search criteria for specified key.
-        Return: list of BaseDataType (or subclassed) instances.
+            snapshot - DataSnapshot to search, defaults to current.
+        Return: ResultList of BaseDataType (or subclassed) instances,
+                must not be modified by the caller.
         Exceptions: N/A."""
-        ret = []
+        if snapshot is None:
+            snapshot = self._snapshot
+
+        ret = ResultList(generation=snapshot.generation)
 
-        if self._item_status[data_type_name] != None:
-            raise self._item_status[data_type_name]
+        if snapshot.item_status[data_type_name] != None:
+            raise snapshot.item_status[data_type_name]
 
         logger.debug('Search Key %s', search_key)
         if search_key != None:
             logger.debug('Searching type: %s', data_type_name)
-            lookup_dict = self._item_lookup[data_type_name]
+            lookup_dict = snapshot.item_lookup[data_type_name]
 
             if search_key in lookup_dict:
                 lookup = lookup_dict[search_key]
 
                 if search_value in lookup:
-                    ret = lookup[search_value]
+                    ret = ResultList(lookup[search_value], snapshot.generation)
                     logger.debug('Found items: %s', ret)
                 else:
                     logger.debug('search_value not found: %s', search_value)
@@ -424,137 +1212,907 @@ class DataManager(object):
                 logger.error(error_msg)
                 raise QueryError(error_msg)
         else:
-            ret = self._item_list[data_type_name]
+            ret = snapshot.item_list[data_type_name]
 
         return ret
 
+    def batch_search(self, data_type_name, search_key, search_values, snapshot=None):
+        """
+        Purpose: Given data type name, key and many values; find the
+                 record matching each value in one pass over the lookup
+                 table of the key.
+        Input Parameters:
+            data_type_name - name of data type to use as index.
+            search_key - field name to use as search criteria.
+            search_values - iterable of values to find.
+            snapshot - DataSnapshot to search, defaults to current.
+        Return: dictionary of each value to the first record matching it
+                in file order, None when no record matches.
+        Exceptions: QueryError if search_key is not a field of the type."""
+        if snapshot is None:
+            snapshot = self._snapshot
+
+        if snapshot.item_status[data_type_name] != None:
+            raise snapshot.item_status[data_type_name]
+
+        lookup = snapshot.item_lookup[data_type_name].get(search_key)
+        if lookup is None:
+            if search_key in self.get_class(data_type_name).field_names:
+                # Nothing loaded to index.
+                lookup = {}
+            else:
+                error_msg = 'search_key not found: %s' % (search_key)
+                logger.error(error_msg)
+                raise QueryError(error_msg)
+
+        # A plain dictionary allocates no object per value, so large
+        # batches don't set off garbage collection of the whole snapshot.
+        ret = {}
+        for value in search_values:
+            matches = lookup.get(value)
+            ret[value] = matches[0] if matches else None
+        return ret
+
+    def user_groups(self, search_key, search_value, snapshot=None):
+        """
+        Purpose: Given uid or name of an account, find the groups it
+                 belongs to through its primary gid or group membership.
+        Input Parameters:
+            search_key - 'uid' or 'name'.
+            search_value - value to use as search criteria for specified key.
+            snapshot - DataSnapshot to search, defaults to current.
+        Return: ResultList of GroupData instances, empty if no account
+                matches.  Must not be modified by the caller.
+        Exceptions: QueryError if search_key is not 'uid' or 'name'."""
+        if snapshot is None:
+            snapshot = self._snapshot
+
+        for data_type_name in (PWD_TYPENAME, GRP_TYPENAME):
+            if snapshot.item_status[data_type_name] != None:
+                raise snapshot.item_status[data_type_name]
+
+        if search_key not in ('uid', 'name'):
+            error_msg = 'search_key not found: %s' % (search_key)
+            logger.error(error_msg)
+            raise QueryError(error_msg)
+
+        ret = snapshot.user_groups(search_key, search_value)
+        if ret is None:
+            ret = ResultList(generation=snapshot.generation)
+        return ret
+
+    def schedule_reload(self, data_type):
+        """
+        Purpose: Given data type; reload it on the reload worker once no
+                 further change is reported for PWDSVC_RELOAD_DELAY
+                 seconds, so a burst of file events causes one reload.
+        Input Parameters:
+            data_type - data type to use as index.
+        Return: N/A
+        Exceptions: N/A."""
+        self._scheduler.request(data_type)
+
+    def watched_path(self, data_type_name):
+        """
+        Purpose: Given data type name; return the file whose changes
+                 reload it; the source, or when attached to a loader
+                 process the compiled index it publishes.
+        Input Parameters:
+            data_type_name - name of data type.
+        Return: path of file.
+        Exceptions: N/A."""
+        if self._attached:
+            return index_path(settings.PWDSVC_INDEX_DIR, data_type_name)
+        return self._file_path[data_type_name]
+
     def start_watchdog(self, data_type):
         """
-        Purpose: Given data type name; start a watchdog observer
-                 to monitor for file changes at configured path.
+        Purpose: Given data type; add its file to those the file watcher
+                 monitors for change, starting the watcher if needed.
         Input Parameters:
-            data_type_name - data type to use as index.
+            data_type - data type to use as index.
         Return: N/A
         Exceptions: N/A."""
+        self._watcher.watch(self.watched_path(data_type.__name__), data_type)
+        self._scheduler.start()
+        self._watcher.start()
 
-        data_type_name = data_type.__name__
-        path = self._file_path[data_type_name]
+    def stop_watchdog(self):
+        """
+        Purpose: Stop the file watcher and wait for its threads to end;
+                 data stays loaded but file changes are no longer
+                 reloaded automatically.
+        Input Parameters: N/A
+        Return: N/A
+        Exceptions: N/A."""
+        self._watcher.stop()
 
-        # observer already running, close it down.
-        if data_type_name in self._item_watch:
-            observer = self._item_watch[data_type_name]
-            if observer != None:
-                observer.join()
+        # Drop reloads still waiting on events already received.
+        self._scheduler.stop()
 
-        # create new watchdog and register by type
-        observer = Observer()
-        self._item_watch[data_type_name] = observer
+    def close(self):
+        """
+        Purpose: Stop the file watcher and end the processes parsing
+                 loads in parallel; data stays loaded but later loads
+                 parse in this process.
+        Input Parameters: N/A
+        Return: N/A
+        Exceptions: N/A."""
+        self.stop_watchdog()
+
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.terminate()
+            pool.join()
 
-        patterns = [path]
-        event_handler = DataFileEventHandler(patterns=patterns)
-        event_handler.init_callback(self, path, data_type)
-        observer.schedule(event_handler, os.path.split(path)
-                          [0], recursive=False)
-        observer.start()
+    def watch_stats(self):
+        """
+        Purpose: Report how files are watched for change and how quickly
+                 changes have been detected.
+        Input Parameters: N/A
+        Return: OrderedDict as returned by FileWatcher.stats.
+        Exceptions: N/A."""
+        return self._watcher.stats()
 
-    def load_model_by_type(self, data_type):
+    def load_model_by_type(self, data_type, snapshot=None):
         """
-        Purpose: Given data type name; clear and load
+        Purpose: Given data type name; clear and bulk load
                  the related data type into database.
         Input Parameters:
             data_type_name - data type to use as index.
-        Return: N/A
+            snapshot - DataSnapshot to load from, defaults to current.
+        Return: number of rows loaded.
         Exceptions: N/A."""
         data_type_name = data_type.__name__
+        if snapshot is None:
+            snapshot = self._snapshot
+
+        model = Account
+        key_field = 'uid'
+        if data_type_name == GRP_TYPENAME:
+            model = Group
+            key_field = 'gid'
+
+        clear_table(model)
+
+        # One row per key; the last line wins as it did with save().
+        rows = {}
+        for item in snapshot.item_list[data_type_name]:
+            rows[item.get_field(key_field)] = item.to_row()
 
-        if data_type_name in self.data_to_model:
-            if data_type_name == 'GroupData':
-                Group.objects.all().delete()
-            elif data_type_name == 'PasswordData':
-                Account.objects.all().delete()
+        bulk_insert(model, data_type.model_fields, rows.values())
+        return len(rows)
 
-            for item in self._item_list[data_type_name]:
-                new_model_instance = item.to_model()
-                new_model_instance.save()
+    def load_group_refs(self, snapshot=None):
+        """
+        Purpose: Clear and bulk load the member cross-references
+                 of every group to Account type.
+        Input Parameters:
+            snapshot - DataSnapshot to load from, defaults to current.
+        Return: number of rows loaded.
+        Exceptions: N/A."""
+        if snapshot is None:
+            snapshot = self._snapshot
+
+        clear_table(Group.members.through)
+        return self.insert_group_refs(snapshot.item_list[GRP_TYPENAME], snapshot)
+
+    def insert_group_refs(self, groups, snapshot):
+        """
+        Purpose: Bulk insert member cross-references of groups, resolving
+                 member names to accounts from the snapshot lookup tables.
+        Input Parameters:
+            groups - list of GroupData instances.
+            snapshot - DataSnapshot to load from.
+        Return: number of rows inserted.
+        Exceptions: N/A."""
+        name_lookup = snapshot.item_lookup[PWD_TYPENAME].get('name', {})
+        # Rows are inserted in member order, which searches list members in.
+        pairs = []
+        seen = set()
+        for group in groups:
+            gid = group.get_field('gid')
+            for member_name in group.member_names(self, snapshot):
+                if member_name in name_lookup:
+                    pair = (gid, name_lookup[member_name][0].get_field('uid'))
+                    if pair not in seen:
+                        seen.add(pair)
+                        pairs.append(pair)
+                else:
+                    logger.debug('Member %s of group %s has no account.', member_name, gid)
+
+        bulk_insert(Group.members.through, ('group', 'account'), pairs)
+        return len(pairs)
+
+    def load_models(self, snapshot):
+        """
+        Purpose: Clear and load all data types of a snapshot into
+                 database within a single transaction.
+        Input Parameters:
+            snapshot - DataSnapshot to load from.
+        Return: N/A
+        Exceptions: N/A."""
+        start = time.time()
+
+        with transaction.atomic():
+            rows = self.load_model_by_type(GroupData, snapshot)
+            rows += self.load_model_by_type(PasswordData, snapshot)
+            rows += self.load_group_refs(snapshot)
+            self.save_source_state()
+
+        elapsed = max(time.time() - start, 0.001)
+        logger.info('Loaded %d rows into database in %.2f seconds (%d rows/second).',
+                    rows, elapsed, rows / elapsed)
+
+    def sync_database(self):
+        """
+        Purpose: Write the current snapshot to the database in full,
+                 whether or not the database is known to hold it.
+        Input Parameters: N/A
+        Return: N/A
+        Exceptions: DatabaseError if the database can't be loaded."""
+        with self._reload_lock:
+            snapshot = self._snapshot
+            self._db_generation = None
+            self.load_models(snapshot)
+            self._db_generation = snapshot.generation
+
+    def save_source_state(self):
+        """
+        Purpose: Record the digests of the sources last loaded as the
+                 content of the database; call within the transaction
+                 writing that content.
+        Input Parameters: N/A
+        Return: N/A
+        Exceptions: DatabaseError if the state can't be written."""
+        SourceState.objects.all().delete()
+        SourceState.objects.bulk_create(
+            [SourceState(data_type=data_type_name, digest=digest or '')
+             for data_type_name, digest in self._source_digest.iteritems()])
+
+    def database_current(self):
+        """
+        Purpose: Determine if the database already holds the content of
+                 the sources last read, as when restarting with neither
+                 source changed.
+        Input Parameters: N/A
+        Return: True if every source was read and its digest matches the
+                one recorded with the database content.
+        Exceptions: N/A."""
+        if None in self._source_digest.viewvalues():
+            return False
 
-    def load_group_refs(self):
+        try:
+            saved = dict(SourceState.objects.values_list('data_type', 'digest'))
+        except DatabaseError, db_error:
+            logger.debug('No database source state: %s', db_error)
+            return False
+        return saved == self._source_digest
+
+    def load_group_members(self, gids, snapshot):
         """
-        For each GropuData instance load the member
-        cross-references to Account type.
+        Purpose: Replace the database member cross-references of the
+                 given groups with those found in snapshot.
+        Input Parameters:
+            gids - set of gid values of groups to update.
+            snapshot - DataSnapshot to load from.
+        Return: N/A
+        Exceptions: N/A."""
+        gid_lookup = snapshot.item_lookup[GRP_TYPENAME].get('gid', {})
+        gids = [gid for gid in gids if gid in gid_lookup]
+
+        for offset in range(0, len(gids), SQL_BATCH_SIZE):
+            batch = gids[offset:offset + SQL_BATCH_SIZE]
+            Group.members.through.objects.filter(group_id__in=batch).delete()
+
+        groups = []
+        for gid in gids:
+            groups.extend(gid_lookup[gid])
+        self.insert_group_refs(groups, snapshot)
+
+    def sync_model_changes(self, data_type, snapshot, added, removed):
         """
-        for item in self._item_list['GroupData']:
-            item.load_members(self)
+        Purpose: Apply records added and removed by a reload to the
+                 database, leaving unchanged rows untouched.
+        Input Parameters:
+            data_type - data type that was reloaded.
+            snapshot - DataSnapshot the reload published.
+            added - list of records not present in the previous snapshot.
+            removed - list of records no longer present.
+        Return: N/A
+        Exceptions: N/A."""
+        if data_type is GroupData:
+            removed_keys = set(item.get_field('gid') for item in removed)
+            removed_keys.difference_update(item.get_field('gid') for item in added)
+            removed_keys = list(removed_keys)
+
+            # Accounts keep their rows and other memberships; their
+            # primary gid is not cascaded, see Account.gid.
+            for offset in range(0, len(removed_keys), SQL_BATCH_SIZE):
+                batch = removed_keys[offset:offset + SQL_BATCH_SIZE]
+                Group.objects.filter(pk__in=batch).delete()
+
+            # Changed groups are updated in place so their accounts stay.
+            for item in added:
+                item.to_model().save()
+        else:
+            # Changed accounts are deleted and inserted again in bulk.
+            rows = {}
+            for item in added:
+                rows[item.get_field('uid')] = item.to_row()
+
+            removed_keys = set(item.get_field('uid') for item in removed)
+            removed_keys.update(rows)
+            removed_keys = list(removed_keys)
+
+            for offset in range(0, len(removed_keys), SQL_BATCH_SIZE):
+                batch = removed_keys[offset:offset + SQL_BATCH_SIZE]
+                Account.objects.filter(pk__in=batch).delete()
+
+            bulk_insert(Account, PasswordData.model_fields, rows.values())
+
+        # Find groups whose membership may have changed.
+        gids = set()
+        if data_type is GroupData:
+            gids.update(item.get_field('gid') for item in added)
+        else:
+            grp_members_lookup = snapshot.item_lookup[GRP_TYPENAME].get('members', {})
+            for item in chain(added, removed):
+                gids.add(item.get_field('gid'))
+                for group in grp_members_lookup.get(item.get_field('name'), ()):
+                    gids.add(group.get_field('gid'))
+
+        self.load_group_members(gids, snapshot)
 
-    def load_data_by_type(self, data_type):
+    def sync_models(self, data_type, snapshot, previous, added, removed):
         """
-        Purpose: Given data type name; start a watchdog observer
-                 to monitor for file changes at configured path.
+        Purpose: Bring the database in line with a newly published
+                 snapshot; incrementally when the database matches the
+                 previous snapshot, otherwise by a full reload.
         Input Parameters:
-            data_type_name - data type to use as index.
+            data_type - data type that was reloaded.
+            snapshot - DataSnapshot just published.
+            previous - DataSnapshot replaced by snapshot.
+            added - list of records added, None if not known.
+            removed - list of records removed, None if not known.
         Return: N/A
         Exceptions: N/A."""
+        try:
+            with transaction.atomic():
+                if added is None or self._db_generation != previous.generation:
+                    logger.debug('Full database load for generation %d.',
+                                 snapshot.generation)
+                    self.load_models(snapshot)
+                else:
+                    logger.debug('Applying %d added and %d removed %s records to database.',
+                                 len(added), len(removed), data_type.__name__)
+                    self.sync_model_changes(data_type, snapshot, added, removed)
+                    self.save_source_state()
+
+            self._db_generation = snapshot.generation
+        except DatabaseError, db_error:
+            # Searches served from the database will be stale until
+            # a later reload succeeds with a full database load.
+            self._db_generation = None
+            logger.error('Unable to update database: %s', db_error)
+
+    def read_source(self, data_type):
+        """
+        Purpose: Given data type; open the configured path for reading
+                 a line at a time.
+        Input Parameters:
+            data_type - data type to use as index.
+        Return: tuple of (iterable of lines without line terminator,
+                status, mtime, digest) where status is a PathError if the
+                file could not be read or None, mtime the modification
+                time of the file read or None and digest the md5 hex
+                digest of its content or None.
+        Exceptions: N/A."""
 
         data_type_name = data_type.__name__
         path = self._file_path[data_type_name]
         lines = []
+        status = None
+        mtime = None
+        digest = None
 
         try:
             logger.debug('Loading: %s', path)
-            with open(path) as data_file:
-                lines = data_file.readlines()
-        except RuntimeError, runtime_error:
-            self._item_status[data_type_name] = PathError(
+            data_file = open(path)
+            try:
+                mtime = os.fstat(data_file.fileno()).st_mtime
+                digest = file_digest(data_file)
+            except (EnvironmentError, RuntimeError):
+                data_file.close()
+                raise
+            lines = iter_lines(data_file)
+        except (EnvironmentError, RuntimeError), runtime_error:
+            status = PathError(
                 'Unabled to open path: "%s", on error: %s' % (path, runtime_error))
             # Site will stay up but data will be empty on queries
             # for this type will return PathError exception
             # with notice about invalid path value.
             logger.error(runtime_error)
 
-        if lines:
-            item_lookup = self._item_lookup[data_type_name]
+        return lines, status, mtime, digest
+
+    def parse_line(self, data_type, line):
+        """
+        Purpose: Given data type; parse one line of source file.
+        Input Parameters:
+            data_type - data type to create.
+            line - line of source file without line terminator.
+        Return: new data_type instance, None if line is malformed.
+        Exceptions: N/A."""
+        return parse_record(data_type, line)
+
+    def load_data_by_type(self, data_type, lines=None, status=None):
+        """
+        Purpose: Given data type; read and parse the configured path
+                 into records and lookup tables without publishing them.
+        Input Parameters:
+            data_type - data type to use as index.
+            lines - iterable of lines without line terminator as
+                    returned by read_source, default = None to read
+                    the configured path.
+            status - error reading lines passed in, default = None.
+        Return: tuple of (list of records, lookup dictionary, status, source)
+                where status is a PathError if the file could not be read
+                or None, and source maps the digest of each line to its
+                record, see line_digest.
+        Exceptions: N/A."""
+        if lines is None:
+            lines, status, _, _ = self.read_source(data_type)
 
+        if status is None and self._pool is not None:
+            content = self.load_parallel(data_type)
+            if content is not None:
+                return content
+
+        items = []
+        source = {}
+
+        with gc_paused():
             for line in lines:
-                new_item = data_type()
+                new_item = self.parse_line(data_type, line)
 
-                line_vals = line.replace('\n', '').split(':')
+                if new_item is not None:
+                    items.append(new_item)
+                    source[line_digest(line)] = new_item
 
-                if len(line_vals) == new_item.source_field_size:
-                    new_item.load_from_list(line_vals)
-                    self._item_list[data_type_name].append(new_item)
-                else:
-                    logger.error(
-                        'Data omitted as it appears to be malformed: %s.', line)
+            return items, index_items(items), status, source
+
+    def load_parallel(self, data_type, min_bytes=LOAD_CHUNK_BYTES):
+        """
+        Purpose: Given data type; parse and index parts of the configured
+                 path in the worker processes started with this manager,
+                 then merge the parts in file order.
+        Input Parameters:
+            data_type - data type to use as index.
+            min_bytes - smallest part parsed by one task,
+                        default = LOAD_CHUNK_BYTES.
+        Return: tuple as returned by load_data_by_type, None if the file
+                is too small to split, there are no worker processes or
+                it could not be loaded in parallel.
+        Exceptions: N/A."""
+        path = self._file_path[data_type.__name__]
+        pool = self._pool
+        if pool is None:
+            return None
+
+        try:
+            # Several parts per worker even out parts parsing slower.
+            chunks = source_chunks(path, self._workers * 4, min_bytes)
+            if len(chunks) < 2:
+                return None
+
+            parts = pool.imap(parse_chunk, [(data_type, path, start, end)
+                                            for start, end in chunks])
+            content = self.merge_chunks(data_type, parts)
+        except (EnvironmentError, RuntimeError), runtime_error:
+            logger.error('Parallel load of %s failed, loading in process: %s',
+                         path, runtime_error)
+            return None
+
+        logger.debug('Loaded %s in %d parts.', path, len(chunks))
+        return content
+
+    def merge_chunks(self, data_type, parts):
+        """
+        Purpose: Given data type and parsed parts of a file; build the
+                 records and merge the partial lookup tables of the parts.
+        Input Parameters:
+            data_type - data type to create.
+            parts - iterable of encoded parts as returned by
+                    parse_chunk, in file order.
+        Return: tuple as returned by load_data_by_type.
+        Exceptions: N/A."""
+        items = []
+        source = {}
+        lookup = {}
+
+        with gc_paused():
+            for part in parts:
+                lines, part_lookup = marshal.loads(part)
+                part_items = []
+                for line in lines:
+                    new_item = data_type()
+                    new_item.load_from_list(line.split(':'))
+                    part_items.append(new_item)
+                    source[line_digest(line)] = new_item
+                items.extend(part_items)
+
+                if part_items and not lookup:
+                    for key in data_type.field_names:
+                        lookup[key] = {}
+
+                for key, part_values in part_lookup.iteritems():
+                    values = lookup[key]
+                    for val, positions in part_values.iteritems():
+                        matches = [part_items[position] for position in positions]
+                        if val in values:
+                            values[val].extend(matches)
+                        else:
+                            values[val] = matches
+
+            return items, lookup, None, source
+
+    def diff_data_by_type(self, data_type, snapshot, lines):
+        """
+        Purpose: Given data type and newly read lines; build the content
+                 for the next snapshot reusing unchanged records of the
+                 previous one and patching its lookup tables.
+        Input Parameters:
+            data_type - data type to use as index.
+            snapshot - previous DataSnapshot.
+            lines - iterable of lines as returned by read_source.
+        Return: tuple of (content, added, removed) where content is as
+                returned by load_data_by_type, or None when the change
+                cannot be applied incrementally.
+        Exceptions: N/A."""
+        data_type_name = data_type.__name__
+        old_items = snapshot.item_list[data_type_name]
+        old_source = snapshot.item_source[data_type_name]
+
+        if len(old_source) != len(old_items):
+            # Duplicate lines can't be told apart by content.
+            return None
+
+        items = []
+        source = {}
+        added = []
+
+        for line in lines:
+            digest = line_digest(line)
+            if digest in source:
+                return None
+
+            item = old_source.get(digest)
+            if item is None:
+                item = self.parse_line(data_type, line)
+                if item is None:
+                    continue
+                added.append(item)
+
+            items.append(item)
+            source[digest] = item
+
+        removed = [old_source[digest] for digest in old_source.viewkeys() - source.viewkeys()]
+
+        if not added and not removed:
+            if items != old_items:
+                # Same records in new order; rebuild for file ordered results.
+                return None
+            lookup = snapshot.item_lookup[data_type_name]
+        elif len(added) + len(removed) > len(items) * PATCH_RATIO_LIMIT:
+            lookup = index_items(items)
+        else:
+            lookup = patch_lookup(snapshot.item_lookup[data_type_name],
+                                  items, added, removed)
 
-                # this builds out dictionaries to support search of data.
-                new_item.prepare_search(item_lookup)
+        return (items, lookup, None, source), added, removed
 
-    def reload_datatype(self, data_type):
+    def reload_datatype(self, data_type, superseded=None):
         """
-        Purpose: Given data type name; reload source path.
+        Purpose: Given data type name; reload source path and publish
+                 a new snapshot once it is completely built.  Only the
+                 lines changed since the last load are parsed, indexed
+                 and written to the database, and nothing is done when
+                 the content is the same as last loaded.
         Input Parameters:
             data_type - data type to use as index.
+            superseded - callable returning True once a newer change makes
+                         this reload pointless, checked before parsing and
+                         before publishing, default = None.
         Return: N/A
         Exceptions: N/A."""
         data_type_name = data_type.__name__
         logger.debug('Reloading type: %s.', data_type_name)
 
-        self.init_data_type(data_type_name)
-        self.load_data_by_type(data_type)
+        with self._reload_lock:
+            previous = self._snapshot
+            lines, status, mtime, digest = self.read_source(data_type)
+
+            if (status is None and previous.item_status[data_type_name] is None and
+                    digest == self._source_digest.get(data_type_name)):
+                logger.debug('Content of %s data unchanged.', data_type_name)
+                return
+
+            if superseded is not None and superseded():
+                logger.debug('Reload of %s superseded before parsing.', data_type_name)
+                return
+
+            changes = None
+            if status is None and previous.item_status[data_type_name] is None:
+                changes = self.diff_data_by_type(data_type, previous, lines)
+                if changes is None:
+                    # Lines are read once; start over for a full load.
+                    lines, status, mtime, digest = self.read_source(data_type)
+
+            if changes is None:
+                content = self.load_data_by_type(data_type, lines, status)
+                added = None
+                removed = None
+            else:
+                content, added, removed = changes
+                if not added and not removed:
+                    logger.debug('No change to %s data.', data_type_name)
+                    self._source_digest[data_type_name] = digest
+                    return
+
+            if superseded is not None and superseded():
+                logger.debug('Reload of %s superseded before publishing.', data_type_name)
+                return
+
+            snapshot = previous.replace_types({data_type_name: content})
+
+            # Single reference swap; readers see either the old
+            # or the new snapshot, never a partially built one.
+            self._snapshot = snapshot
+            self._source_digest[data_type_name] = digest
+            self._ready.set()
+            logger.debug('Published generation %d.', snapshot.generation)
+
+            self.sync_models(data_type, snapshot, previous, added, removed)
+
+            if status is None:
+                self.write_compiled(data_type, content, mtime, digest)
+
+    def read_compiled(self, data_type, mtime, digest):
+        """
+        Purpose: Given data type; rebuild its records and lookup tables
+                 from the compiled index if it was built from the source
+                 as last read.
+        Input Parameters:
+            data_type - data type to use as index.
+            mtime - modification time of source as read.
+            digest - md5 hex digest of source as read.
+        Return: tuple as returned by load_data_by_type, None if compiled
+                indexes are disabled or out of date.
+        Exceptions: N/A."""
+        directory = settings.PWDSVC_INDEX_DIR
+        if not directory:
+            return None
+
+        data_type_name = data_type.__name__
+        key = source_key(self._file_path[data_type_name], mtime, digest)
+        if key is None:
+            return None
+
+        with gc_paused():
+            return read_index(index_path(directory, data_type_name), key, data_type)
+
+    def write_compiled(self, data_type, content, mtime, digest):
+        """
+        Purpose: Given data type and its loaded content; save the
+                 compiled index read by later starts.
+        Input Parameters:
+            data_type - data type to use as index.
+            content - tuple as returned by load_data_by_type.
+            mtime - modification time of source as read.
+            digest - md5 hex digest of source as read.
+        Return: N/A
+        Exceptions: N/A."""
+        directory = settings.PWDSVC_INDEX_DIR
+        if not directory:
+            return
+
+        data_type_name = data_type.__name__
+        key = source_key(self._file_path[data_type_name], mtime, digest)
+        if key is None:
+            return
+
+        items, lookup, _, _ = content
+        with gc_paused():
+            write_index(index_path(directory, data_type_name), key, items, lookup)
+
+    def read_published(self, data_type):
+        """
+        Purpose: Given data type; rebuild its records and lookup tables
+                 from the compiled index published by the loader process,
+                 whatever source content it was built from.
+        Input Parameters:
+            data_type - data type to use as index.
+        Return: tuple of (content, mtime, digest) where content is as
+                returned by load_data_by_type and mtime and digest are
+                those of the source the loader read, None if no index of
+                the configured source has been published.
+        Exceptions: N/A."""
+        data_type_name = data_type.__name__
+        file_path = index_path(settings.PWDSVC_INDEX_DIR, data_type_name)
+        index = load_index(file_path)
+        if index is None:
+            return None
+
+        (path, _, mtime, digest), lines, fields = index
+        if path != self._file_path[data_type_name]:
+            logger.error('Compiled index %s was published for %s, not %s.',
+                         file_path, path, self._file_path[data_type_name])
+            return None
+
+        with gc_paused():
+            # The loader alone reloads the source, so line to record
+            # lookup of unchanged records is left out.
+            content = build_index(lines, fields, data_type, keep_source=False)
+        logger.debug('Attached to %s of %d records.', file_path, len(content[0]))
+        return content, mtime, digest
+
+    def publish_attached(self, parts, digests):
+        """
+        Purpose: Publish content read from compiled indexes as the next
+                 snapshot; call holding the reload lock.  Database searches
+                 are used only while the database holds the content of
+                 the same sources, as recorded by the loader process.
+        Input Parameters:
+            parts - dictionary of data type name to content.
+            digests - dictionary of data type name to source digest.
+        Return: N/A
+        Exceptions: N/A."""
+        snapshot = self._snapshot.replace_types(parts)
+        self._snapshot = snapshot
+        self._source_digest.update(digests)
+        if len(self._source_digest) == len(self._file_path):
+            self._ready.set()
+        logger.debug('Published generation %d.', snapshot.generation)
+
+        if self.database_current():
+            self._db_generation = snapshot.generation
+        else:
+            self._db_generation = None
+
+    def attach_datatype(self, data_type, superseded=None):
+        """
+        Purpose: Given data type; publish a new snapshot with the content
+                 the loader process last published for it, if it differs
+                 from the content attached before.
+        Input Parameters:
+            data_type - data type to use as index.
+            superseded - callable returning True once a newer index makes
+                         this one pointless, default = None.
+        Return: N/A
+        Exceptions: N/A."""
+        data_type_name = data_type.__name__
+
+        with self._reload_lock:
+            published = self.read_published(data_type)
+            if published is None:
+                return
+
+            content, _, digest = published
+            if digest == self._source_digest.get(data_type_name):
+                logger.debug('Published %s data unchanged.', data_type_name)
+                return
+
+            if superseded is not None and superseded():
+                logger.debug('Attach of %s superseded before publishing.', data_type_name)
+                return
+
+            self.publish_attached({data_type_name: content}, {data_type_name: digest})
+
+    def attach_data(self):
+        """
+        Purpose: Attach to the data published by a loader process, the
+                 pwdsvc_loader command, and follow what it publishes.  The
+                 loader alone parses and watches the sources and writes
+                 the database, so serving processes attached to it share
+                 one load and one reload per change.  Data is ready once
+                 both types have been published.
+        Input Parameters: N/A
+        Return: N/A
+        Exceptions: N/A."""
+        logger.debug('Attaching to published data.')
+
+        # Watch first so an index published meanwhile isn't missed.
+        self.start_watchdog(PasswordData)
+        self.start_watchdog(GroupData)
+
+        with self._reload_lock:
+            parts = {}
+            digests = {}
+            for data_type in (PasswordData, GroupData):
+                published = self.read_published(data_type)
+                if published is not None:
+                    name = data_type.__name__
+                    parts[name], _, digests[name] = published
+
+            if parts:
+                self.publish_attached(parts, digests)
+            if self.is_ready():
+                logger.info('Attached to data of generation %d.', self._snapshot.generation)
+            else:
+                logger.info('Waiting for the loader process to publish data.')
+
+        self._loaded.set()
 
     def load_data(self):
         """
         Purpose: Load all types of data and start monitoring files.
+                 Data can be searched in memory as soon as it is parsed,
+                 before it is written to the database.  When attached to
+                 a loader process, attach_data is run instead.
         Input Parameters: N/A
         Return: N/A
-        Exceptions: N/A."""
+        Exceptions: DatabaseError if the database can't be loaded."""
+        if self._attached:
+            self.attach_data()
+            return
+
         logger.debug('Start loading data.')
-        self.load_data_by_type(PasswordData)
-        self.load_data_by_type(GroupData)
+        with self._reload_lock:
+            parts = {}
+            parsed = []
+            for data_type in (PasswordData, GroupData):
+                lines, status, mtime, digest = self.read_source(data_type)
+
+                content = None
+                if status is None:
+                    content = self.read_compiled(data_type, mtime, digest)
+                if content is None:
+                    content = self.load_data_by_type(data_type, lines, status)
+                    if status is None:
+                        parsed.append((data_type, content, mtime, digest))
+
+                parts[data_type.__name__] = content
+                self._source_digest[data_type.__name__] = digest
+            self._snapshot = self._snapshot.replace_types(parts)
+            self._ready.set()
+            logger.info('Data ready in memory, generation %d.', self._snapshot.generation)
+
+            if self.database_current():
+                logger.info('Database already holds the current data.')
+            else:
+                self.load_models(self._snapshot)
+            self._db_generation = self._snapshot.generation
 
-        self.load_model_by_type(GroupData)
-        self.load_model_by_type(PasswordData)
-        self.load_group_refs()
+            for compiled in parsed:
+                self.write_compiled(*compiled)
 
         self.start_watchdog(PasswordData)
         self.start_watchdog(GroupData)
+        self._loaded.set()
         logger.debug('Done loading data.')
+
+    def load_in_background(self):
+        """
+        Purpose: Load data as load_data does, logging rather than raising
+                 errors; run on a separate thread.  Should the database
+                 fail to load, data is still served from memory.  Any
+                 other failure is recorded for load_error and ends the
+                 load, so waiting for it doesn't hang.
+        Input Parameters: N/A
+        Return: N/A
+        Exceptions: N/A."""
+        try:
+            self.load_data()
+        except DatabaseError, db_error:
+            logger.error('Unable to load database: %s', db_error)
+            self.start_watchdog(PasswordData)
+            self.start_watchdog(GroupData)
+            self._loaded.set()
+        except Exception, load_error:
+            logger.exception('Unable to load data: %s', load_error)
+            self._load_error = load_error
+            self._loaded.set()
+        finally:
+            # This thread's database connection isn't used again.
+            connection.close()
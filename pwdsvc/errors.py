@@ -10,6 +10,22 @@ class QueryError(RuntimeError):
     pass
 
 
+class SnapshotChangedError(RuntimeError):
+    """
+    This class when raised conveys that a request continues from a
+    page of results taken from a snapshot that has since been replaced.
+    """
+    pass
+
+
+class DatabaseBusyError(RuntimeError):
+    """
+    This class when raised conveys that every database search slot
+    stayed taken for as long as a request may wait for one.
+    """
+    pass
+
+
 class PathError(RuntimeError):
     """
     This class when raised conveys that an exceptional
@@ -0,0 +1,173 @@
+"""
+This module provides a WSGI application answering the most frequent
+requests, lookups of one user or group and of the groups of a user and
+the listings of all users and groups, straight from the in-memory
+snapshot, in any format but ndjson.  These are dictionary hits, with
+bodies joined from encodings cached with the records or, for listings,
+encoded once per snapshot, so the URL resolving and middleware of the Django request
+stack would otherwise cost far more than the lookup itself.  Every other request,
+and any lookup that would not answer 200 or 304, is passed on to the
+Django application it wraps, which answers it as before.  So are all
+requests while the views search the database, whose groups list their
+members differently than the snapshot does.
+"""
+import re
+from django.conf import settings
+from django.urls import reverse
+from django.utils.http import http_date, parse_etags, quote_etag
+from pwdsvc import views
+from pwdsvc.data import PWD_TYPENAME, GRP_TYPENAME, DataManager
+from pwdsvc.formats import NDJSON, negotiate
+
+# Conditional request headers only the Django view handles.
+DJANGO_CONDITIONS = ('HTTP_IF_MODIFIED_SINCE', 'HTTP_IF_MATCH', 'HTTP_IF_UNMODIFIED_SINCE')
+
+
+def etag_matches(etag, if_none_match):
+    """
+    Purpose: Determine if an If-None-Match header matches an ETag,
+             comparing weakly as the Django view does.
+    Input Parameters:
+        etag - quoted ETag of the response.
+        if_none_match - value of the If-None-Match header.
+    Return: True if the response is not modified.
+    Exceptions: N/A."""
+    etags = parse_etags(if_none_match)
+    if '*' in etags:
+        return True
+    # Only a leading W/ marks a weak ETag; the quoted tag is compared as is.
+    opaque_tags = [tag[2:] if tag.startswith('W/') else tag for tag in etags]
+    return (etag[2:] if etag.startswith('W/') else etag) in opaque_tags
+
+
+class FastPathApplication(object):
+    """
+    This class is a WSGI application answering GET /users, /groups,
+    /users/<uid>, /groups/<gid> and /users/<uid>/groups from the current
+    snapshot,
+    with the same body, ETag and Last-Modified as their Django views
+    searching memory, and passing all other requests to the application
+    it wraps.  Its
+    responses skip Django middleware.
+    """
+
+    def __init__(self, application):
+        """
+        Input Parameters:
+            application - Django WSGI application answering other requests.
+        """
+        self.application = application
+
+        users_path = re.escape(reverse('users'))
+        groups_path = re.escape(reverse('groups'))
+        self._users = re.compile(r'^%s/(\d+)$' % (users_path))
+        self._user_groups = re.compile(r'^%s/(\d+)/groups$' % (users_path))
+        self._groups = re.compile(r'^%s/(\d+)$' % (groups_path))
+        self._listings = {reverse('users'): PWD_TYPENAME, reverse('groups'): GRP_TYPENAME}
+
+        self.content_type = str('%s; charset=%s' % (settings.DEFAULT_CONTENT_TYPE,
+                                                    settings.DEFAULT_CHARSET))
+
+    def lookup(self, path, snapshot, response_format):
+        """
+        Purpose: Find the body of the response to a lookup path.
+        Input Parameters:
+            path - requested path.
+            snapshot - DataSnapshot to answer from.
+            response_format - formats.ResponseFormat to encode the body in.
+        Return: encoded body of the response, None if the path isn't a
+                lookup or its view would not answer 200.
+        Exceptions: N/A."""
+        data_type_name = self._listings.get(path)
+        if data_type_name is not None:
+            if snapshot.item_status[data_type_name] is not None:
+                return None
+            return self.encode_list(snapshot.item_list[data_type_name], response_format)
+
+        match = self._users.match(path)
+        if match is not None:
+            found = snapshot.find(PWD_TYPENAME, 'uid', match.group(1))
+            if found is None or len(found) != 1:
+                return None
+            return response_format.encode_record(found[0])
+
+        match = self._groups.match(path)
+        if match is not None:
+            found = snapshot.find(GRP_TYPENAME, 'gid', match.group(1))
+            if found is None or len(found) != 1:
+                return None
+            return response_format.encode_record(found[0])
+
+        match = self._user_groups.match(path)
+        if match is not None:
+            if snapshot.item_status[PWD_TYPENAME] is not None:
+                return None
+            if snapshot.item_status[GRP_TYPENAME] is not None:
+                return None
+
+            found = snapshot.user_groups('uid', match.group(1))
+            return self.encode_list(found, response_format)
+
+        return None
+
+    def encode_list(self, result_list, response_format):
+        """
+        Purpose: Encode a list of results into one body as its view would.
+        Input Parameters:
+            result_list - ResultList to encode.
+            response_format - formats.ResponseFormat to encode the body in.
+        Return: encoded body, None if the list is empty or its view would
+                stream it, see PWDSVC_STREAMING_THRESHOLD.
+        Exceptions: N/A."""
+        threshold = settings.PWDSVC_STREAMING_THRESHOLD
+        if not result_list or not (result_list.is_encoded(response_format) or
+                                   threshold is None or len(result_list) <= threshold):
+            return None
+        return result_list.encode(response_format)
+
+    def __call__(self, environ, start_response):
+        """
+        Purpose: Answer a lookup from memory, or pass the request on.
+        Input Parameters:
+            environ - WSGI environment of the request.
+            start_response - WSGI callable starting the response.
+        Return: iterable of the response body.
+        Exceptions: N/A."""
+        if (environ.get('REQUEST_METHOD') != 'GET' or environ.get('QUERY_STRING') or
+                not views.DATAMGR.is_ready()):
+            return self.application(environ, start_response)
+
+        snapshot = views.DATAMGR.get_snapshot()
+        if views.search_engine(snapshot) != DataManager.__name__:
+            return self.application(environ, start_response)
+        if any(header in environ for header in DJANGO_CONDITIONS):
+            return self.application(environ, start_response)
+
+        # Negotiated as the views negotiate the ETag; ndjson is streamed.
+        response_format = negotiate(environ.get('HTTP_ACCEPT', ''))
+        if response_format is NDJSON:
+            return self.application(environ, start_response)
+
+        path = environ.get('SCRIPT_NAME', '') + environ.get('PATH_INFO', '')
+        body = self.lookup(path, snapshot, response_format)
+        if body is None:
+            return self.application(environ, start_response)
+
+        # WSGI headers are native strings; Django's helpers return unicode.
+        etag = str(quote_etag(views.request_etag(snapshot.generation, path,
+                                                 response_format.name,
+                                                 DataManager.__name__)))
+        headers = [('ETag', etag), ('Vary', 'Accept')]
+        mtime = snapshot.last_modified()
+        if mtime is not None:
+            headers.append(('Last-Modified', str(http_date(int(mtime)))))
+
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and etag_matches(etag, if_none_match):
+            start_response('304 Not Modified', headers)
+            return []
+
+        headers.append(('Content-Type', str(response_format.content_type or self.content_type)))
+        headers.append(('Content-Length', str(len(body))))
+        start_response('200 OK', headers)
+        return [body]
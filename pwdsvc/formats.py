@@ -0,0 +1,337 @@
+"""
+This module provides the formats responses are encoded in, negotiated
+from the Accept header of a request: json, the default; newline
+delimited json; msgpack; and lines of the passwd and group files as
+printed by getent.  Records cache their encoding in each format, so
+each record of a snapshot is encoded at most once per format and
+responses are joined from the cached strings.
+"""
+import json
+import struct
+from itertools import izip
+
+# msgpack encodings of nil and of the headers of short strings, maps
+# and arrays; longer ones carry their size in the following bytes.
+MSGPACK_NIL = '\xc0'
+FIXSTR, FIXMAP, FIXARRAY = 0xa0, 0x80, 0x90
+
+
+def pack_str(value):
+    """
+    Purpose: Encode a string as msgpack str.
+    Input Parameters:
+        value - utf-8 encoded or unicode string.
+    Return: msgpack encoding as a string.
+    Exceptions: N/A."""
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    size = len(value)
+    if size < 32:
+        return chr(FIXSTR | size) + value
+    if size < 0x100:
+        return '\xd9' + chr(size) + value
+    if size < 0x10000:
+        return struct.pack('>BH', 0xda, size) + value
+    return struct.pack('>BI', 0xdb, size) + value
+
+
+def pack_map_header(size):
+    """
+    Purpose: Encode the header of a msgpack map.
+    Input Parameters: size - number of key and value pairs that follow.
+    Return: msgpack encoding as a string.
+    Exceptions: N/A."""
+    if size < 16:
+        return chr(FIXMAP | size)
+    if size < 0x10000:
+        return struct.pack('>BH', 0xde, size)
+    return struct.pack('>BI', 0xdf, size)
+
+
+def pack_array_header(size):
+    """
+    Purpose: Encode the header of a msgpack array.
+    Input Parameters: size - number of values that follow.
+    Return: msgpack encoding as a string.
+    Exceptions: N/A."""
+    if size < 16:
+        return chr(FIXARRAY | size)
+    if size < 0x10000:
+        return struct.pack('>BH', 0xdc, size)
+    return struct.pack('>BI', 0xdd, size)
+
+
+def pack_fields(names, values):
+    """
+    Purpose: Encode fields of a record as a msgpack map of name to value.
+             Records hold strings alone, so this subset of msgpack is
+             written directly rather than through the msgpack package,
+             whose Python 2 packer is pure Python and several times
+             slower than json.
+    Input Parameters:
+        names - field names in output order.
+        values - string value of each field.
+    Return: msgpack encoding as a string.
+    Exceptions: N/A."""
+    return pack_map_header(len(names)) + ''.join(
+        [pack_str(name) + pack_str(value) for name, value in izip(names, values)])
+
+
+class ResponseFormat(object):
+    """
+    This class describes a format of response bodies; the media types
+    it is asked for by, its content type and how lists of records are
+    framed in it.  Sub-classes encode records.
+    """
+
+    name = None
+    media_types = ()
+    # None for the DEFAULT_CONTENT_TYPE of Django responses.
+    content_type = None
+    # Placed between the encodings of records in a list.
+    separator = ''
+
+    def record(self, item):
+        """
+        Purpose: Return the cached encoding of a record.
+        Input Parameters: item - BaseDataType instance.
+        Return: encoded record as a string.
+        Exceptions: N/A."""
+        raise NotImplementedError
+
+    def encode_record(self, item):
+        """
+        Purpose: Encode the body of a response holding one record.
+        Input Parameters: item - BaseDataType instance.
+        Return: encoded record as a string.
+        Exceptions: N/A."""
+        return self.record(item)
+
+    def head(self, count):
+        """
+        Purpose: Return the encoding preceding a list of records.
+        Input Parameters: count - number of records in the list.
+        Return: string.
+        Exceptions: N/A."""
+        return ''
+
+    def tail(self, count):
+        """
+        Purpose: Return the encoding following a list of records.
+        Input Parameters: count - number of records in the list.
+        Return: string.
+        Exceptions: N/A."""
+        return ''
+
+    def encode_list(self, items):
+        """
+        Purpose: Encode a list of records, joining their cached encodings.
+        Input Parameters: items - list of BaseDataType instances.
+        Return: encoded list as a string.
+        Exceptions: N/A."""
+        return '%s%s%s' % (self.head(len(items)),
+                           self.separator.join([self.record(item) for item in items]),
+                           self.tail(len(items)))
+
+    def iter_list(self, items, chunk_size=500):
+        """
+        Purpose: Generate the same encoding as encode_list in pieces of
+                 chunk_size records, without building the whole list.
+        Input Parameters:
+            items - list of BaseDataType instances.
+            chunk_size - number of records joined per piece.
+        Return: generator of strings.
+        Exceptions: N/A."""
+        yield self.head(len(items))
+        for offset in xrange(0, len(items), chunk_size):
+            chunk = self.separator.join([self.record(item)
+                                         for item in items[offset:offset + chunk_size]])
+            if offset:
+                chunk = self.separator + chunk
+            yield chunk
+        yield self.tail(len(items))
+
+    def encode_batch(self, found):
+        """
+        Purpose: Encode the results of a batch request.
+        Input Parameters:
+            found - list of (list name, values in request order, dictionary
+                    of value to record or None).
+        Return: encoded results as a string.
+        Exceptions: N/A."""
+        raise NotImplementedError
+
+
+class JsonFormat(ResponseFormat):
+    """
+    This class encodes json, records as objects and lists as arrays.
+    """
+
+    name = 'json'
+    media_types = ('application/json',)
+    separator = ', '
+
+    def record(self, item):
+        return item.to_json()
+
+    def head(self, count):
+        return '['
+
+    def tail(self, count):
+        return ']'
+
+    def encode_batch(self, found):
+        """
+        Purpose: Encode the results of a batch request as a json object of
+                 each list name to an object of each value to its record,
+                 null when not found.
+        Input Parameters:
+            found - list of (list name, values in request order, dictionary
+                    of value to record or None).
+        Return: json encoded results as a string.
+        Exceptions: N/A."""
+        parts = []
+        for list_name, values, records in found:
+            entries = ', '.join(['%s: %s' % (json.dumps(value),
+                                             'null' if records[value] is None
+                                             else records[value].to_json())
+                                 for value in values])
+            parts.append('%s: {%s}' % (json.dumps(list_name), entries))
+        return '{%s}' % (', '.join(parts))
+
+
+class NdjsonFormat(JsonFormat):
+    """
+    This class encodes lists as newline delimited json, one record
+    per line.  Other responses are not offered in it.
+    """
+
+    name = 'ndjson'
+    media_types = ('application/x-ndjson', 'application/ndjson')
+    content_type = 'application/x-ndjson'
+    separator = '\n'
+
+    def head(self, count):
+        return ''
+
+    def tail(self, count):
+        return '\n' if count else ''
+
+
+class MsgpackFormat(ResponseFormat):
+    """
+    This class encodes msgpack, records as maps of field name to value
+    and lists as arrays.
+    """
+
+    name = 'msgpack'
+    media_types = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+    content_type = 'application/msgpack'
+
+    def record(self, item):
+        return item.to_msgpack()
+
+    def head(self, count):
+        return pack_array_header(count)
+
+    def encode_batch(self, found):
+        """
+        Purpose: Encode the results of a batch request as a msgpack map
+                 of each list name to a map of each value to its record,
+                 nil when not found.
+        Input Parameters:
+            found - list of (list name, values in request order, dictionary
+                    of value to record or None).
+        Return: msgpack encoded results as a string.
+        Exceptions: N/A."""
+        parts = [pack_map_header(len(found))]
+        for list_name, values, records in found:
+            parts.append(pack_str(list_name))
+            parts.append(pack_map_header(len(values)))
+            for value in values:
+                parts.append(pack_str(value))
+                parts.append(MSGPACK_NIL if records[value] is None
+                             else records[value].to_msgpack())
+        return ''.join(parts)
+
+
+class LinesFormat(ResponseFormat):
+    """
+    This class encodes records as lines of the passwd or group file,
+    one per line, as printed by getent.
+    """
+
+    name = 'lines'
+    media_types = ('text/plain',)
+    content_type = 'text/plain; charset=utf-8'
+    separator = '\n'
+
+    def record(self, item):
+        return item.to_line()
+
+    def tail(self, count):
+        return '\n' if count else ''
+
+    def encode_batch(self, found):
+        """
+        Purpose: Encode the records found by a batch request as lines,
+                 in request order; values not found are left out, as
+                 getent does.
+        Input Parameters:
+            found - list of (list name, values in request order, dictionary
+                    of value to record or None).
+        Return: lines as a string.
+        Exceptions: N/A."""
+        items = [records[value] for _, values, records in found for value in values
+                 if records[value] is not None]
+        return self.encode_list(items)
+
+    def encode_record(self, item):
+        return self.record(item) + '\n'
+
+
+JSON = JsonFormat()
+NDJSON = NdjsonFormat()
+MSGPACK = MsgpackFormat()
+LINES = LinesFormat()
+
+# Formats of list responses, preferred in this order when the Accept
+# header names none; json is the default.
+LIST_FORMATS = (JSON, NDJSON, MSGPACK, LINES)
+
+# Formats of responses holding one record or a batch of them.
+RECORD_FORMATS = (JSON, MSGPACK, LINES)
+
+
+def negotiate(accept, formats=LIST_FORMATS):
+    """
+    Purpose: Choose the format of a response from the Accept header of
+             its request; the format whose media type is given the
+             highest quality, the first listed of equals.  Wildcards
+             name no format, so json is chosen unless another is named.
+    Input Parameters:
+        accept - value of Accept header.
+        formats - ResponseFormats offered, the first being the default,
+                  default = LIST_FORMATS.
+    Return: ResponseFormat.
+    Exceptions: N/A."""
+    chosen, chosen_quality = formats[0], 0.0
+    for media_range in accept.split(','):
+        params = media_range.split(';')
+        media_type = params[0].strip().lower()
+        quality = 1.0
+        for param in params[1:]:
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        if quality <= chosen_quality:
+            continue
+        for response_format in formats:
+            if media_type in response_format.media_types:
+                chosen, chosen_quality = response_format, quality
+                break
+    return chosen
@@ -0,0 +1,251 @@
+"""
+This module provides the pwdsvc_benchmark management command to
+measure the cost of loading and serving synthetic passwd data.
+"""
+import gc
+import httplib
+import json
+import os
+import threading
+import time
+import resource
+from SocketServer import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.urls import reverse
+from pwdsvc.data import PWD_TYPENAME, PasswordData, index_items
+from pwdsvc.formats import JSON, NDJSON, MSGPACK, LINES, LIST_FORMATS
+from pwdsvc.results import ResultList
+
+try:
+    import msgpack
+except ImportError:
+    # Only needed to time decoding msgpack.
+    msgpack = None
+
+
+def resident_bytes():
+    """
+    Purpose: Return resident memory size of this process.
+    Input Parameters: N/A.
+    Return: size in bytes.
+    Exceptions: N/A."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except EnvironmentError:
+        # Peak rather than current size; close enough for growth only.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def synthetic_passwd_lines(count):
+    """
+    Purpose: Generate lines of a passwd file with unique names, uids
+             and homes and a few thousand shared primary groups.
+    Input Parameters:
+        count - number of lines to generate.
+    Return: list of lines without line terminators.
+    Exceptions: N/A."""
+    return ['user%07d:x:%d:%d:User %d:/home/user%07d:/bin/bash' %
+            (i, 10000 + i, 5000 + (i % 4000), i, i) for i in xrange(count)]
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """
+    WSGI server handling each connection on its own thread.
+    """
+    daemon_threads = True
+    # Clients connect at once; don't refuse them.
+    request_queue_size = 1024
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """
+    WSGI request handler not logging each request.
+    """
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    """
+    Runs one of the available benchmarks against synthetic data.
+    """
+    help = 'Measure memory and time used by pwdsvc on synthetic data.'
+
+    # Checks import the URLconf, which would load the configured files.
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmark', choices=['memory', 'serving', 'formats'],
+                            help='Benchmark to run.')
+        parser.add_argument('--users', type=int, default=1000000,
+                            help='Number of synthetic passwd lines.')
+        parser.add_argument('--clients', type=int, default=64,
+                            help='Number of concurrent clients when serving.')
+        parser.add_argument('--requests', type=int, default=100,
+                            help='Number of requests per client when serving.')
+
+    def handle(self, *args, **options):
+        if options['benchmark'] == 'serving':
+            self.bench_serving(options['clients'], options['requests'])
+        else:
+            getattr(self, 'bench_%s' % options['benchmark'])(options['users'])
+
+    def bench_memory(self, count):
+        """
+        Purpose: Report memory per record for parsed records and for
+                 the lookup tables built on them.
+        Input Parameters:
+            count - number of synthetic passwd lines to load.
+        Return: N/A.
+        Exceptions: N/A."""
+        lines = synthetic_passwd_lines(count)
+
+        gc.collect()
+        start_bytes = resident_bytes()
+        start = time.time()
+
+        items = []
+        for line in lines:
+            item = PasswordData()
+            item.load_from_list(line.split(':'))
+            items.append(item)
+
+        gc.collect()
+        record_bytes = resident_bytes() - start_bytes
+        record_secs = time.time() - start
+
+        lookup = index_items(items)
+
+        gc.collect()
+        index_bytes = resident_bytes() - start_bytes - record_bytes
+
+        self.stdout.write('records: %d, %.2fs' % (count, record_secs))
+        self.stdout.write('record memory: %.1f MB, %d bytes/record' %
+                          (record_bytes / 1e6, record_bytes / count))
+        self.stdout.write('index memory: %.1f MB, %d bytes/record' %
+                          (index_bytes / 1e6, index_bytes / count))
+        del lookup
+
+    def bench_formats(self, count):
+        """
+        Purpose: Report the size of a listing in each response format,
+                 the time to encode it with records encoded for the first
+                 time and again from their cached encodings, and the
+                 time to decode it where a decoder is available.
+        Input Parameters:
+            count - number of synthetic passwd lines to encode.
+        Return: N/A.
+        Exceptions: N/A."""
+        items = []
+        for line in synthetic_passwd_lines(count):
+            item = PasswordData()
+            item.load_from_list(line.split(':'))
+            items.append(item)
+
+        decoders = {
+            JSON.name: json.loads,
+            NDJSON.name: lambda body: [json.loads(line) for line in body.splitlines()],
+            LINES.name: lambda body: [line.split(':') for line in body.splitlines()],
+        }
+        if msgpack is not None:
+            decoders[MSGPACK.name] = msgpack.unpackb
+
+        for response_format in LIST_FORMATS:
+            start = time.time()
+            body = ResultList(items).encode(response_format)
+            encode_secs = time.time() - start
+
+            start = time.time()
+            ResultList(items).encode(response_format)
+            cached_secs = time.time() - start
+
+            decode = decoders.get(response_format.name)
+            if decode is None:
+                decoded = 'no decoder'
+            else:
+                start = time.time()
+                decode(body)
+                decoded = 'decode %.2fs' % (time.time() - start)
+
+            self.stdout.write('%s: %.1f MB, %d bytes/record, encode %.2fs, '
+                              'cached %.3fs, %s' %
+                              (response_format.name, len(body) / 1e6, len(body) / count,
+                               encode_secs, cached_secs, decoded))
+
+    def bench_serving(self, clients, requests):
+        """
+        Purpose: Report throughput of GET /users/<uid> over HTTP with many
+                 concurrent clients, through the Django application and
+                 through the fast path answering lookups from memory.
+                 Serves the configured passwd and group files.
+        Input Parameters:
+            clients - number of concurrent clients.
+            requests - number of requests sent by each client.
+        Return: N/A.
+        Exceptions: N/A."""
+        from pwdsvc import views
+        from pwdsvc.fastpath import FastPathApplication
+
+        views.DATAMGR.wait_loaded()
+        uids = views.DATAMGR.get_snapshot().item_lookup[PWD_TYPENAME]['uid'].keys()[:1000]
+        paths = [reverse('users_by_uid', args=[uid]) for uid in uids]
+
+        django_app = get_wsgi_application()
+        for name, application in (('django', django_app),
+                                  ('fast path', FastPathApplication(django_app))):
+            rate, failed = self.serve_requests(application, paths, clients, requests)
+            self.stdout.write('%s: %d clients, %.0f requests/second, %d failed' %
+                              (name, clients, rate, failed))
+        views.DATAMGR.close()
+
+    def serve_requests(self, application, paths, clients, requests):
+        """
+        Purpose: Serve application on a local port and time clients
+                 requesting paths concurrently.
+        Input Parameters:
+            application - WSGI application to serve.
+            paths - paths requested in turn by each client.
+            clients - number of concurrent clients.
+            requests - number of requests sent by each client.
+        Return: tuple of (requests answered per second, requests not
+                answered 200).
+        Exceptions: N/A."""
+        server = make_server('127.0.0.1', 0, application, server_class=ThreadingWSGIServer,
+                             handler_class=QuietRequestHandler)
+        serving = threading.Thread(target=server.serve_forever)
+        serving.daemon = True
+        serving.start()
+        port = server.server_address[1]
+
+        failures = []
+        def client(offset):
+            failed = 0
+            for i in xrange(requests):
+                try:
+                    connection = httplib.HTTPConnection('127.0.0.1', port, timeout=60)
+                    connection.request('GET', paths[(offset + i) % len(paths)])
+                    response = connection.getresponse()
+                    response.read()
+                    connection.close()
+                    if response.status != 200:
+                        failed += 1
+                except (EnvironmentError, httplib.HTTPException):
+                    failed += 1
+            failures.append(failed)
+
+        threads = [threading.Thread(target=client, args=(offset,))
+                   for offset in xrange(clients)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+
+        server.shutdown()
+        server.server_close()
+        return clients * requests / elapsed, sum(failures)
@@ -0,0 +1,50 @@
+"""
+This module provides the pwdsvc_loader management command, which loads
+and watches the passwd and group files once for every serving process
+on the host attached to it with PWDSVC_ATTACH_LOADER.
+"""
+import os.path
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from pwdsvc.compiled import index_path
+from pwdsvc.data import DataManager, PasswordData, GroupData
+
+
+class Command(BaseCommand):
+    """
+    Loads the passwd and group files and the database, then reloads
+    them on change, publishing each snapshot as compiled indexes in
+    PWDSVC_INDEX_DIR for attached serving processes.
+    """
+    help = 'Load and watch the passwd and group files for attached serving processes.'
+
+    # Checks import the URLconf, which would load the configured files.
+    requires_system_checks = False
+
+    def handle(self, *args, **options):
+        directory = settings.PWDSVC_INDEX_DIR
+        if not directory:
+            raise CommandError('PWDSVC_INDEX_DIR must be set to publish data.')
+
+        data_mgr = DataManager(attached=False)
+        snapshot = data_mgr.get_snapshot()
+        for data_type in (PasswordData, GroupData):
+            data_type_name = data_type.__name__
+            path = index_path(directory, data_type_name)
+            if snapshot.item_status[data_type_name] is not None:
+                self.stderr.write('%s: %s' % (data_type_name,
+                                              snapshot.item_status[data_type_name]))
+            elif not os.path.exists(path):
+                self.stderr.write('%s data could not be published to %s.' %
+                                  (data_type_name, path))
+
+        self.stdout.write('Published generation %d to %s.' % (snapshot.generation, directory))
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            data_mgr.close()
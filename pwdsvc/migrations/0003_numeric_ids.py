@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 02:36
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pwdsvc', '0002_auto_20180902_0214'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='gid_number',
+            field=models.IntegerField(db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='uid_number',
+            field=models.IntegerField(db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='gid_number',
+            field=models.IntegerField(db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 09:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pwdsvc', '0003_numeric_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SourceState',
+            fields=[
+                ('data_type', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('digest', models.CharField(max_length=32)),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 03:53
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pwdsvc', '0004_sourcestate'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='account',
+            name='gid',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='pwdsvc.Group'),
+        ),
+    ]
@@ -4,18 +4,37 @@ loaded content via database queries.
 """
 from __future__ import unicode_literals
 import json
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
+from itertools import izip
 # Get an instance of a logger.
 import logging
 logger = logging.getLogger(__name__)
 
 from pwdsvc.errors import QueryError, PathError
+from pwdsvc.results import ResultList
+from pwdsvc.query import NUMERIC_FIELDS, parse_ranges
 
 from django.db import models
+from django.db.models import Count, Q
+from django.utils.encoding import force_text
+
+# Largest number of values bound into one SQL IN clause; kept below
+# the default SQLite limit on host parameters.
+SQL_BATCH_SIZE = 500
 
 # Create your models here.
 
 
+def members_csv(names):
+    """
+    Purpose: Join member names in the csv form returned for groups
+             held in the database, each name followed by a comma.
+    Input Parameters: names - iterable of account names.
+    Return: string
+    Exceptions: N/A."""
+    return ''.join('%s,' % (name) for name in names)
+
+
 class Account(models.Model):
     """
     This class implements the structure and functionality
@@ -26,11 +45,17 @@ class Account(models.Model):
 
     name = models.CharField(max_length=32)
     uid = models.CharField(primary_key=True, max_length=10)
-    gid = models.ForeignKey('Group')
+    # An account keeps its primary gid when the group line is removed,
+    # so the reference is neither constrained nor cascaded on delete.
+    gid = models.ForeignKey('Group', on_delete=models.DO_NOTHING, db_constraint=False)
     comment = models.TextField()
     home = models.TextField()
     shell = models.TextField()
 
+    # Numeric copies of uid and gid for indexed range queries.
+    uid_number = models.IntegerField(null=True, db_index=True)
+    gid_number = models.IntegerField(null=True, db_index=True)
+
     def __str__(self):
         """
         Purpose: Return this classes fields in json
@@ -41,8 +66,8 @@ class Account(models.Model):
         """
         fields = OrderedDict()
         fields['name'] = self.name
-        fields['uid'] = "%d" % self.uid
-        fields['gid'] = "%d" % self.gid.pk
+        fields['uid'] = "%s" % self.uid
+        fields['gid'] = "%s" % self.gid_id
         fields['comment'] = self.comment
         fields['home'] = self.home
         fields['shell'] = self.shell
@@ -59,7 +84,7 @@ class Account(models.Model):
         fields = OrderedDict()
         fields['name'] = self.name
         fields['uid'] = self.uid
-        fields['gid'] = self.gid.pk
+        fields['gid'] = "%s" % self.gid_id
         fields['comment'] = self.comment
         fields['home'] = self.home
         fields['shell'] = self.shell
@@ -78,6 +103,9 @@ class Group(models.Model):
     gid = models.CharField(primary_key=True, max_length=10)
     members = models.ManyToManyField(Account)
 
+    # Numeric copy of gid for indexed range queries.
+    gid_number = models.IntegerField(null=True, db_index=True)
+
     def __str__(self):
         """
         Purpose: Return this classes fields in json
@@ -89,10 +117,7 @@ class Group(models.Model):
         fields = OrderedDict()
         fields['name'] = self.name
         fields['gid'] = "%s" % self.gid
-        members_str = ''
-        for member in self.members.all():
-            members_str += '%s,' % (member.name)
-        fields['members'] = members_str
+        fields['members'] = members_csv(member.name for member in self.members.all())
 
         return json.dumps(fields, sort_keys=False)
 
@@ -107,26 +132,114 @@ class Group(models.Model):
         fields = OrderedDict()
         fields['name'] = self.name
         fields['gid'] = self.gid
+        fields['members'] = members_csv(member.name for member in self.members.all())
+
+        return fields
 
-        members_str = ''
-        for member in self.members.all():
-            members_str += '%s,' % (member.name)
 
-        fields['members'] = members_str
+class SourceState(models.Model):
+    """
+    This class records the digest of the source file each data type
+    was last written to the database from.  It is updated in the same
+    transaction as the tables, so a restart can tell whether they
+    already hold the current content.
+    """
 
-        return fields
+    data_type = models.CharField(primary_key=True, max_length=32)
+    digest = models.CharField(max_length=32)
 
 
 class DataBaseSearch(object):
     """
     Provides search methods that match data.DataManager but use
     django database functionalities internall to perform search.
+
+    Results are built from values_list projections rather than model
+    instances, and group members are fetched for all matching groups
+    in a single query, so every search costs a constant number of
+    queries no matter how many rows match.
     """
 
+    # Columns projected for each data type, keyed by record field name.
+    account_columns = (('name', 'name'), ('uid', 'uid'), ('gid', 'gid_id'),
+                       ('comment', 'comment'), ('home', 'home'), ('shell', 'shell'))
+    group_columns = (('name', 'name'), ('gid', 'gid'))
+
     def __init__(self, data_manager):
         self.data_mgr = data_manager
 
-    def search_with_params(self, data_type_name, dict_):
+    def page_query_set(self, query_set, page):
+        """
+        Purpose: Limit query set to a page of rows, followed by the first
+                 row of the next page if there is one.
+        Input Parameters:
+            query_set - QuerySet of Account or Group rows.
+            page - results.Page to return, None for all rows.
+        Return: QuerySet
+        Exceptions: N/A."""
+        if page is None:
+            return query_set
+        # Pages need a stable order to follow each other.
+        return query_set.order_by('pk')[page.offset:page.offset + page.limit + 1]
+
+    def get_query_set(self, data_type_name):
+        """
+        Purpose: Return a query set of all rows for data type.
+        Input Parameters: data_type_name - name of data type.
+        Return: QuerySet of Account or Group.
+        Exceptions: N/A."""
+        if data_type_name == 'PasswordData':
+            return Account.objects.all()
+        return Group.objects.all()
+
+    def build_results(self, data_type_name, query_set, generation):
+        """
+        Purpose: Run query set and convert its rows to data type instances.
+                 Every matching record is built before the results are
+                 returned, so unlike searches of memory, whose records
+                 the snapshot already holds, a large result allocates
+                 all of its records even when its response is streamed.
+        Input Parameters:
+            data_type_name - name of data type to build.
+            query_set - QuerySet of Account or Group rows to convert.
+            generation - snapshot generation the results belong to.
+        Return: ResultList of BaseDataType (or subclassed) instances.
+        Exceptions: N/A."""
+        ret = ResultList(generation=generation)
+
+        if data_type_name == 'PasswordData':
+            columns = self.account_columns
+        else:
+            columns = self.group_columns
+        field_names = [field_name for field_name, _ in columns]
+        # Rows are converted as they are read rather than listed first.
+        rows = query_set.values_list(*[column for _, column in columns]).iterator()
+
+        members = None
+        if data_type_name == 'GroupData':
+            # One query for members of every matching group, kept in
+            # the order they were inserted.
+            members = defaultdict(list)
+            member_rows = Group.members.through.objects.filter(
+                group__in=query_set.values('pk')).order_by('pk').values_list(
+                    'group_id', 'account__name')
+            # Older schemas store gid columns as integers, key by string.
+            for gid, name in member_rows:
+                members["%s" % gid].append(name)
+
+        for row in rows:
+            fields = dict(izip(field_names, row))
+            fields['gid'] = "%s" % fields['gid']
+            if members is not None:
+                fields['members'] = members_csv(members.get(fields['gid'], ()))
+
+            new_data = self.data_mgr.get_class(data_type_name)
+            new_data.from_dict(fields)
+            ret.append(new_data)
+
+        return ret
+
+    def search_with_params(self, data_type_name, dict_, page=None):
         """
         Purpose: Given data type name and dictionary of params
                  find a list of matching BaseDataType instances.
@@ -134,54 +247,62 @@ class DataBaseSearch(object):
             data_type_name - name of data type to use as index.
             dict_ - OrderedDict containing parameters to use as
                     search criteria.
+            page - results.Page to return, default = None for all results.
         Return: list of BaseDataType (or subclassed) instances.
-        Exceptions: N/A."""
-        ret = []
+        Exceptions: QueryError if unsupported parameters are specified."""
+        snapshot = self.data_mgr.get_snapshot()
 
-        if self.data_mgr._item_status[data_type_name] != None:
-            raise self.data_mgr._item_status[data_type_name]
+        if snapshot.item_status[data_type_name] != None:
+            raise snapshot.item_status[data_type_name]
 
+        field_names = self.data_mgr.get_class(data_type_name).field_names
         member_list = []
         kwargs = {}
         for key, value in dict_.iteritems():
             logger.debug("Key: %s - Value: %s - data_type_name: %s",
                          key, value, data_type_name)
 
-            data_key = key
-            if key == 'member':
+            if '__' in key:
+                continue
+            elif key == 'member' and 'members' in field_names:
                 member_list = dict_.getlist(key)
+            elif key in field_names and key != 'members':
+                kwargs[key] = value
             else:
-                kwargs[data_key] = value
+                error_msg = 'search_key not found: %s' % (key)
+                logger.error(error_msg)
+                raise QueryError(error_msg)
 
-        query_set = None
+        try:
+            ranges = parse_ranges(dict_.items(), field_names)
+        except QueryError, query_error:
+            logger.error(query_error)
+            raise
 
-        if member_list:
-            # query_set = Group.objects.filter(members__name=member_list)
-            query_set = []
-            for member in member_list:
-                query_set_int = Group.objects.filter(members__name=member)
-                if query_set != None:
-                    for item in query_set_int:
-                        if item not in query_set:
-                            query_set.append(item)
-
-            if query_set and kwargs:
-                query_set = query_set_int.filter(**kwargs)
+        # Ranges of ids compare the indexed integer copy of each id,
+        # prefixes compare text as the range of strings starting with it.
+        for field, (low, high) in ranges.iteritems():
+            if field in NUMERIC_FIELDS:
+                field = '%s_number' % (field)
+            if low is not None:
+                kwargs['%s__gte' % (field)] = low
+            if high is not None:
+                kwargs['%s__lt' % (field)] = high
 
-        else:
-            if data_type_name == 'PasswordData':
-                query_set = Account.objects.filter(**kwargs)
-            elif data_type_name == 'GroupData':
-                query_set = Group.objects.filter(**kwargs)
+        query_set = self.get_query_set(data_type_name).filter(**kwargs)
 
-        for item in query_set:
-            new_data = self.data_mgr.get_class(data_type_name)
-            new_data.from_dict(item.to_dict())
-            ret.append(new_data)
+        if member_list:
+            # Groups containing every member: keep groups joined to all
+            # of the distinct names asked for.
+            member_names = set(member_list)
+            query_set = query_set.filter(members__name__in=member_names).annotate(
+                matched_members=Count('members__name', distinct=True)).filter(
+                    matched_members=len(member_names))
 
-        return ret
+        query_set = self.page_query_set(query_set, page)
+        return self.build_results(data_type_name, query_set, snapshot.generation)
 
-    def search(self, data_type_name, search_key=None, search_value=None):
+    def search(self, data_type_name, search_key=None, search_value=None, page=None):
         """
         Purpose: Given data type name, key, and value;
                  find a list of matching BaseDataType instances.
@@ -189,49 +310,101 @@ class DataBaseSearch(object):
             data_type_name - name of data type to use as index.
             search_key - field name to use as search criteria.
             search_value - value to use as search criteria for specified key.
+            page - results.Page to return, default = None for all results.
         Return: list of BaseDataType (or subclassed) instances.
         Exceptions: N/A."""
-        ret = []
+        snapshot = self.data_mgr.get_snapshot()
 
-        if self.data_mgr._item_status[data_type_name] != None:
-            raise self.data_mgr._item_status[data_type_name]
+        if snapshot.item_status[data_type_name] != None:
+            raise snapshot.item_status[data_type_name]
 
         logger.debug('Search Key %s', search_key)
+        query_set = self.get_query_set(data_type_name)
         if search_key != None:
             logger.debug('Searching type: %s', data_type_name)
-            lookup_dict = self.data_mgr._item_lookup[data_type_name]
+            lookup_dict = snapshot.item_lookup[data_type_name]
 
             if search_key in lookup_dict:
                 kwargs = {}
-                kwargs[search_key] = search_value
-
-                query_set = None
-                if data_type_name == 'PasswordData':
-                    query_set = Account.objects.filter(**kwargs)
-                elif data_type_name == 'GroupData':
-                    query_set = Group.objects.filter(**kwargs)
-
-                if query_set:
-                    for item in query_set:
-                        new_data = self.data_mgr.get_class(data_type_name)
-                        new_data.from_dict(item.to_dict())
-                        ret.append(new_data)
-
+                if search_key == 'members':
+                    # Group members are matched by account name.
+                    kwargs['members__name'] = search_value
+                    query_set = query_set.filter(**kwargs).distinct()
+                else:
+                    kwargs[search_key] = search_value
+                    query_set = query_set.filter(**kwargs)
             else:
                 error_msg = 'search_key not found: %s' % (search_key)
                 logger.error(error_msg)
                 raise QueryError(error_msg)
-        else:
-            query_set = None
-            if data_type_name == 'PasswordData':
-                query_set = Account.objects.all()
-            elif data_type_name == 'GroupData':
-                query_set = Group.objects.all()
-
-            if query_set:
-                for item in query_set:
-                    new_data = self.data_mgr.get_class(data_type_name)
-                    new_data.from_dict(item.to_dict())
-                    ret.append(new_data)
 
+        query_set = self.page_query_set(query_set, page)
+        return self.build_results(data_type_name, query_set, snapshot.generation)
+
+    def batch_search(self, data_type_name, search_key, search_values):
+        """
+        Purpose: Given data type name, key and many values; find the
+                 record matching each value with IN queries of up to
+                 SQL_BATCH_SIZE values each.
+        Input Parameters:
+            data_type_name - name of data type to use as index.
+            search_key - 'name', or 'uid' or 'gid' identifying the type.
+            search_values - iterable of values to find.
+        Return: dictionary of each value to the first record matching it
+                by primary key, None when no record matches.
+        Exceptions: QueryError if search_key is not supported."""
+        snapshot = self.data_mgr.get_snapshot()
+
+        if snapshot.item_status[data_type_name] != None:
+            raise snapshot.item_status[data_type_name]
+
+        if data_type_name == 'PasswordData':
+            supported = ('uid', 'name')
+        else:
+            supported = ('gid', 'name')
+        if search_key not in supported:
+            error_msg = 'search_key not found: %s' % (search_key)
+            logger.error(error_msg)
+            raise QueryError(error_msg)
+
+        values = list(search_values)
+        ret = dict.fromkeys(values)
+        # Rows hold unicode while values may be utf-8 encoded, so match
+        # both as unicode and answer under the value as given.
+        value_of = dict((force_text(value), value) for value in values)
+        for offset in xrange(0, len(values), SQL_BATCH_SIZE):
+            kwargs = {'%s__in' % (search_key): values[offset:offset + SQL_BATCH_SIZE]}
+            query_set = self.get_query_set(data_type_name).filter(**kwargs).order_by('pk')
+            for record in self.build_results(data_type_name, query_set, snapshot.generation):
+                value = value_of.get(force_text(record.get_field(search_key)))
+                if value is not None and ret[value] is None:
+                    ret[value] = record
         return ret
+
+    def user_groups(self, search_key, search_value, page=None):
+        """
+        Purpose: Given uid or name of an account, find the groups it
+                 belongs to through its primary gid or group membership.
+        Input Parameters:
+            search_key - 'uid' or 'name'.
+            search_value - value to use as search criteria for specified key.
+            page - results.Page to return, default = None for all results.
+        Return: ResultList of GroupData instances, each group once.
+        Exceptions: QueryError if search_key is not 'uid' or 'name'."""
+        snapshot = self.data_mgr.get_snapshot()
+
+        for data_type_name in ('PasswordData', 'GroupData'):
+            if snapshot.item_status[data_type_name] != None:
+                raise snapshot.item_status[data_type_name]
+
+        if search_key == 'uid':
+            condition = Q(members__pk=search_value) | Q(account__pk=search_value)
+        elif search_key == 'name':
+            condition = Q(members__name=search_value) | Q(account__name=search_value)
+        else:
+            error_msg = 'search_key not found: %s' % (search_key)
+            logger.error(error_msg)
+            raise QueryError(error_msg)
+
+        query_set = self.page_query_set(Group.objects.filter(condition).distinct(), page)
+        return self.build_results('GroupData', query_set, snapshot.generation)
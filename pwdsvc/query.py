@@ -0,0 +1,161 @@
+"""
+Provides parsing of query parameters shared by the in memory and
+database search engines.  A parameter is either a field name, for an
+exact match, or a field name and operator joined by a double underscore
+such as uid__gte.
+"""
+import sys
+from collections import OrderedDict
+from pwdsvc.errors import QueryError
+
+# Fields holding numeric ids, which support range operators.
+NUMERIC_FIELDS = ('uid', 'gid')
+
+# Operators selecting a range of numeric ids.
+RANGE_OPERATORS = ('gt', 'gte', 'lt', 'lte')
+
+# Fields holding free text, which support prefix matches.
+TEXT_FIELDS = ('name', 'home', 'comment')
+
+# Operators selecting text by prefix.
+PREFIX_OPERATORS = ('startswith',)
+
+
+def split_param(key):
+    """
+    Purpose: Split query parameter into field name and operator.
+    Input Parameters: key - name of query parameter.
+    Return: tuple of (field name, operator), operator is None
+            for an exact match.
+    Exceptions: N/A."""
+    field, separator, operator = key.partition('__')
+    if not separator:
+        return key, None
+    return field, operator
+
+
+def to_int(value):
+    """
+    Purpose: Convert field value to integer for numeric comparison.
+    Input Parameters: value - string value of field.
+    Return: integer value, None if value is not a number.
+    Exceptions: N/A."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def field_key(field, value):
+    """
+    Purpose: Convert field value to the key ranges of that field compare.
+    Input Parameters:
+        field - name of field.
+        value - string value of field.
+    Return: integer for numeric fields, None if not a number;
+            unicode string for other fields.
+    Exceptions: N/A."""
+    if field in NUMERIC_FIELDS:
+        return to_int(value)
+    if isinstance(value, unicode):
+        return value
+    return value.decode('utf-8', 'replace')
+
+
+def prefix_bounds(prefix):
+    """
+    Purpose: Convert a prefix to bounds of the strings starting with it.
+    Input Parameters: prefix - unicode string.
+    Return: tuple of (low, high) as for range_bounds.
+    Exceptions: N/A."""
+    # Strings starting with prefix sort before prefix with its last
+    # character incremented.
+    high = prefix.rstrip(unichr(sys.maxunicode))
+    if not high:
+        return prefix, None
+    return prefix, high[:-1] + unichr(ord(high[-1]) + 1)
+
+
+def range_bounds(key, operator, value):
+    """
+    Purpose: Convert a range operator and value to bounds of the
+             integers it selects.
+    Input Parameters:
+        key - name of query parameter, used to report errors.
+        operator - one of RANGE_OPERATORS.
+        value - string value of query parameter.
+    Return: tuple of (low, high); low is included and high excluded,
+            either is None when that side is unbounded.
+    Exceptions: QueryError if value is not an integer."""
+    bound = to_int(value)
+    if bound is None:
+        raise QueryError('Integer value expected for %s: %s' % (key, value))
+
+    if operator == 'gt':
+        return bound + 1, None
+    elif operator == 'gte':
+        return bound, None
+    elif operator == 'lt':
+        return None, bound
+    return None, bound + 1
+
+
+def merge_bounds(bounds, other):
+    """
+    Purpose: Intersect two ranges of keys.
+    Input Parameters:
+        bounds - tuple of (low, high) as returned by range_bounds.
+        other - tuple of (low, high) as returned by range_bounds.
+    Return: tuple of (low, high) selecting integers in both ranges.
+    Exceptions: N/A."""
+    lows = [low for low in (bounds[0], other[0]) if low is not None]
+    highs = [high for high in (bounds[1], other[1]) if high is not None]
+    return (max(lows) if lows else None, min(highs) if highs else None)
+
+
+def in_bounds(field, value, bounds):
+    """
+    Purpose: Determine if a field value lies within a range.
+    Input Parameters:
+        field - name of field.
+        value - string value of field.
+        bounds - tuple of (low, high) as returned by parse_ranges.
+    Return: True if value is within bounds.
+    Exceptions: N/A."""
+    key = field_key(field, value)
+    if key is None:
+        return False
+    low, high = bounds
+    return (low is None or key >= low) and (high is None or key < high)
+
+
+def parse_ranges(params, field_names):
+    """
+    Purpose: Collect the range and prefix operators of query parameters,
+             combining those given for the same field.  A prefix selects
+             the range of strings starting with it.
+    Input Parameters:
+        params - iterable of (key, value) query parameters.
+        field_names - fields of the data type being searched.
+    Return: OrderedDict of field name to (low, high) bounds, compared
+            with keys as returned by field_key.
+    Exceptions: QueryError if an operator or field is not supported."""
+    ranges = OrderedDict()
+    for key, value in params:
+        field, operator = split_param(key)
+        if operator is None:
+            continue
+
+        if field not in field_names:
+            raise QueryError('search_key not found: %s' % (key))
+        elif operator in RANGE_OPERATORS and field in NUMERIC_FIELDS:
+            bounds = range_bounds(key, operator, value)
+        elif operator in PREFIX_OPERATORS and field in TEXT_FIELDS:
+            bounds = prefix_bounds(field_key(field, value))
+        else:
+            raise QueryError('search_key not found: %s' % (key))
+
+        if field in ranges:
+            bounds = merge_bounds(ranges[field], bounds)
+        ranges[field] = bounds
+    return ranges
@@ -0,0 +1,109 @@
+"""
+Provides common result types.
+"""
+from collections import namedtuple
+from pwdsvc.formats import JSON, NDJSON
+
+# Position and size of a requested page of results, the generation of
+# the snapshot earlier pages were taken from (None on a first page) and
+# the search engine expected to answer, whose order pages follow.
+Page = namedtuple('Page', ('offset', 'limit', 'generation', 'search_type'))
+
+
+class ResultList(list):
+    """
+    This class is a list of search results that also carries the
+    generation number of the data snapshot the results were taken from.
+    """
+
+    # Snapshots may hold one list per account, keep each one small.
+    __slots__ = ('generation', '_encoded')
+
+    def __init__(self, items=(), generation=0):
+        list.__init__(self, items)
+        self.generation = generation
+        # Format name to encoded body, None until first encoded.
+        self._encoded = None
+
+    def encode(self, response_format):
+        """
+        Purpose: Return the results encoded in a format, joining the
+                 cached encoding of each result.  Each format is encoded
+                 once; the list must not be changed after this is called.
+        Input Parameters: response_format - formats.ResponseFormat to encode.
+        Return: encoded results as a string.
+        Exceptions: N/A"""
+        if self._encoded is None:
+            self._encoded = {}
+        body = self._encoded.get(response_format.name)
+        if body is None:
+            body = response_format.encode_list(self)
+            self._encoded[response_format.name] = body
+        return body
+
+    def to_json(self):
+        """
+        Purpose: Return json array of the results, see encode.
+        Input Parameters: N/A
+        Return: json encoded array as a string.
+        Exceptions: N/A"""
+        return self.encode(JSON)
+
+    def page(self, page):
+        """
+        Purpose: Return the results of a page, followed by the first
+                 result of the next page if there is one.
+        Input Parameters: page - Page to return.
+        Return: ResultList of at most page.limit + 1 results.
+        Exceptions: N/A"""
+        return ResultList(self[page.offset:page.offset + page.limit + 1], self.generation)
+
+    def is_encoded(self, response_format=JSON):
+        """
+        Purpose: Determine if encode has already encoded these results.
+        Input Parameters:
+            response_format - formats.ResponseFormat, default = JSON.
+        Return: True if the encoded body is cached.
+        Exceptions: N/A"""
+        return self._encoded is not None and response_format.name in self._encoded
+
+    def encoded_size(self, response_format=JSON):
+        """
+        Purpose: Return the size of the results encoded in a format,
+                 encoding them if needed.
+        Input Parameters:
+            response_format - formats.ResponseFormat, default = JSON.
+        Return: length of the encoded body.
+        Exceptions: N/A"""
+        return len(self.encode(response_format))
+
+    def iter_encoded(self, response_format, chunk_size=500):
+        """
+        Purpose: Generate the same body as encode in pieces of chunk_size
+                 results, without building the whole body.
+        Input Parameters:
+            response_format - formats.ResponseFormat to encode.
+            chunk_size - number of results encoded per piece.
+        Return: generator of strings.
+        Exceptions: N/A"""
+        return response_format.iter_list(self, chunk_size)
+
+    def iter_json(self, chunk_size=500):
+        """
+        Purpose: Generate the same json array as to_json in pieces of
+                 chunk_size results, without building the whole array.
+        Input Parameters:
+            chunk_size - number of results encoded per piece.
+        Return: generator of strings.
+        Exceptions: N/A"""
+        return self.iter_encoded(JSON, chunk_size)
+
+    def iter_ndjson(self, chunk_size=500):
+        """
+        Purpose: Generate newline delimited json, one result per line,
+                 in pieces of chunk_size results.
+        Input Parameters:
+            chunk_size - number of results encoded per piece.
+        Return: generator of strings.
+        Exceptions: N/A"""
+        return self.iter_encoded(NDJSON, chunk_size)
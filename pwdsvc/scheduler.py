@@ -0,0 +1,130 @@
+"""
+This module provides a worker that runs reloads of changed files
+outside of the threads reporting the changes.
+"""
+import threading
+import time
+# Get an instance of a logger.
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ReloadScheduler(object):
+    """
+    This class runs reloads on a dedicated worker thread.  Requests for
+    the same key arriving within delay seconds of each other are
+    coalesced into one reload, started once delay passes without another
+    request.  A request arriving while its key is reloading marks that
+    reload superseded, and the reload is run again after the delay.
+    """
+
+    def __init__(self, reload_func, delay):
+        """
+        Input Parameters:
+            reload_func - callable taking a key and a callable returning
+                          True once the reload has been superseded.
+            delay - seconds to wait for further requests before reloading.
+        """
+        self.delay = delay
+        self._reload_func = reload_func
+
+        self._condition = threading.Condition()
+        # Key to time its reload is due.
+        self._due = {}
+        # Key to number of requests received, compared by superseded checks.
+        self._requests = {}
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        """
+        Purpose: Start the worker thread if not already running.
+        Input Parameters: N/A
+        Return: N/A
+        Exceptions: N/A."""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name='ReloadScheduler')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """
+        Purpose: Drop pending reloads and stop the worker thread once
+                 any reload in progress completes.
+        Input Parameters: N/A
+        Return: N/A
+        Exceptions: N/A."""
+        with self._condition:
+            self._running = False
+            self._due.clear()
+            thread = self._thread
+            self._thread = None
+            self._condition.notify_all()
+
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def request(self, key):
+        """
+        Purpose: Ask for key to be reloaded after delay seconds,
+                 postponing a reload already waiting for it.
+        Input Parameters: key - key passed to reload_func.
+        Return: N/A
+        Exceptions: N/A."""
+        with self._condition:
+            self._due[key] = time.time() + self.delay
+            self._requests[key] = self._requests.get(key, 0) + 1
+            self._condition.notify_all()
+
+    def pending(self):
+        """
+        Purpose: Determine if reloads are waiting to run.
+        Input Parameters: N/A
+        Return: True if any key has a reload due.
+        Exceptions: N/A."""
+        with self._condition:
+            return bool(self._due)
+
+    def _next_due(self):
+        """
+        Purpose: Wait for the next reload to become due.
+        Input Parameters: N/A
+        Return: tuple of (key, request count), None once stopped.
+        Exceptions: N/A."""
+        with self._condition:
+            while self._running:
+                if not self._due:
+                    self._condition.wait()
+                    continue
+
+                key = min(self._due, key=self._due.get)
+                wait = self._due[key] - time.time()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+
+                del self._due[key]
+                return key, self._requests[key]
+        return None
+
+    def _run(self):
+        """
+        Purpose: Worker thread loop running reloads as they become due.
+        Input Parameters: N/A
+        Return: N/A
+        Exceptions: N/A."""
+        while True:
+            due = self._next_due()
+            if due is None:
+                return
+
+            key, count = due
+            superseded = lambda key=key, count=count: self._requests.get(key) != count
+            try:
+                self._reload_func(key, superseded)
+            except Exception, error: # pylint: disable=broad-except
+                # Keep the worker alive for later changes.
+                logger.exception('Reload of %s failed: %s', key, error)
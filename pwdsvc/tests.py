@@ -1,16 +1,37 @@
 """ This module provides unit test coverage for
     the PasswordService project. 
 """
+import json
 import logging
 import os
 import os.path
+import shutil
+import tempfile
+import threading
 import time
-from django.test import TestCase
+from unittest import skipUnless
+from django.test import RequestFactory, TestCase, override_settings
 from django.conf import settings
+from django.http import QueryDict
 
 # Test Views
 from django.urls import reverse
-from pwdsvc.data import PWD_TYPENAME, GRP_TYPENAME, DataManager
+from pwdsvc.models import Account, Group, DataBaseSearch
+from pwdsvc.data import PWD_TYPENAME, GRP_TYPENAME, DataManager, PasswordData, GroupData
+from pwdsvc.data import source_chunks
+from pwdsvc.errors import QueryError
+from pwdsvc.cache import ResultCache, canonical_params
+from pwdsvc.compiled import line_digest
+from pwdsvc.formats import (JSON, NDJSON, MSGPACK, LINES, RECORD_FORMATS, negotiate,
+                            pack_array_header, pack_map_header, pack_str)
+from pwdsvc.results import ResultList
+from pwdsvc.scheduler import ReloadScheduler
+from pwdsvc.watcher import FileWatcher
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 logger = logging.getLogger(__name__)
 
@@ -96,6 +117,176 @@ class UserData(object):
 USER_DATA = UserData()
 
 
+def tearDownModule():
+    """Stop the threads of the data manager the views load."""
+    from pwdsvc import views
+
+    views.DATAMGR.close()
+
+
+class RecordTests(TestCase):
+    """Test behaviour of the compact record types."""
+
+    def test_password_record(self):
+        """Check field access, comparison and json output of passwd records."""
+        record = PasswordData()
+        record.load_from_list('AAAA:x:100:1000:A User:/home/AAAA:/bin/bash'.split(':'))
+
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertEqual(record.get_field('uid'), '100')
+        self.assertEqual(record.get_field('members'), None)
+        self.assertTrue(record.compare_fields(QueryDict('name=AAAA&gid=1000')))
+        self.assertFalse(record.compare_fields(QueryDict('name=AAAA&gid=1001')))
+        self.assertEqual(repr(record),
+                         '{"name": "AAAA", "uid": "100", "gid": "1000", '
+                         '"comment": "A User", "home": "/home/AAAA", "shell": "/bin/bash"}')
+
+    def test_group_record(self):
+        """Check member comparison of group records."""
+        record = GroupData()
+        record.load_from_list('users:x:999:AAAA,BBBB'.split(':'))
+
+        self.assertTrue(record.compare_fields(QueryDict('member=AAAA&member=BBBB')))
+        self.assertFalse(record.compare_fields(QueryDict('member=AAAA&member=CCCC')))
+        self.assertEqual(repr(record), '{"name": "users", "gid": "999", "members": "AAAA,BBBB"}')
+
+    def test_group_member_set(self):
+        """Check repeated member names register the group once."""
+        record = GroupData()
+        record.load_from_list('users:x:999:AAAA,BBBB,AAAA'.split(':'))
+
+        self.assertEqual(record.member_set, frozenset(['AAAA', 'BBBB']))
+        self.assertEqual([value for key, value in record.search_values()
+                          if key == 'members'].count('AAAA'), 1)
+        self.assertEqual(record.get_field('members'), 'AAAA,BBBB,AAAA')
+
+        record.from_dict({'name': 'users', 'gid': '999', 'members': 'CCCC'})
+        self.assertTrue(record.match_field('members', 'CCCC'))
+        self.assertFalse(record.match_field('members', 'AAAA'))
+
+
+class ResultCacheTests(TestCase):
+    """Test bounds and invalidation of the search result cache."""
+
+    def results(self, generation, *names):
+        """Return ResultList of group records with names."""
+        result_list = ResultList(generation=generation)
+        for name in names:
+            record = GroupData()
+            record.load_from_list([name, 'x', '1', ''])
+            result_list.append(record)
+        return result_list
+
+    def test_canonical_params(self):
+        """Check equivalent queries share a key."""
+        self.assertEqual(canonical_params(QueryDict('member=b&name=g&member=a')),
+                         canonical_params(QueryDict('name=g&member=a&member=b&member=a')))
+        self.assertNotEqual(canonical_params(QueryDict('name=g')),
+                            canonical_params(QueryDict('name=h')))
+
+    def test_lru_eviction(self):
+        """Check least recently used entries are evicted by count and size."""
+        cache = ResultCache(2, 10000)
+        cache.put('a', self.results(1, 'a'))
+        cache.put('b', self.results(1, 'b'))
+        self.assertEqual(cache.get(1, 'a')[0].name, 'a')
+
+        cache.put('c', self.results(1, 'c'))
+        self.assertEqual(cache.get(1, 'b'), None)
+        self.assertTrue(cache.get(1, 'a') is not None)
+        self.assertEqual(cache.evictions, 1)
+
+        size = len(self.results(1, 'a').to_json())
+        cache = ResultCache(10, size * 2)
+        cache.put('a', self.results(1, 'a'))
+        cache.put('b', self.results(1, 'b'))
+        cache.put('c', self.results(1, 'c'))
+        self.assertEqual(cache.get(1, 'a'), None)
+        self.assertEqual(cache.stats()['bytes'], size * 2)
+
+        # Results larger than the byte bound are not cached.
+        cache.put('big', self.results(1, 'a', 'b', 'c'))
+        self.assertEqual(cache.get(1, 'big'), None)
+
+    def test_generation_invalidates(self):
+        """Check results are dropped when the generation changes."""
+        cache = ResultCache(10, 10000)
+        cache.put('a', self.results(1, 'a'))
+        self.assertTrue(cache.get(1, 'a') is not None)
+        self.assertEqual(cache.get(2, 'a'), None)
+
+        # Late results of an old generation are not kept.
+        cache.put('a', self.results(1, 'a'))
+        self.assertEqual(cache.get(2, 'a'), None)
+        self.assertEqual(cache.stats()['invalidations'], 1)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 2)
+
+
+class FormatTests(TestCase):
+    """Test negotiation and encoding of response formats."""
+
+    def test_negotiate(self):
+        """Check the format given the highest quality is chosen, json by default."""
+        self.assertIs(negotiate(''), JSON)
+        self.assertIs(negotiate('*/*'), JSON)
+        self.assertIs(negotiate('text/html,application/xhtml+xml,*/*;q=0.8'), JSON)
+        self.assertIs(negotiate('application/msgpack'), MSGPACK)
+        self.assertIs(negotiate('application/x-ndjson, application/json'), NDJSON)
+        self.assertIs(negotiate('application/json;q=0.5, text/plain'), LINES)
+        self.assertIs(negotiate('text/plain;q=0, application/x-msgpack;q=0.1'), MSGPACK)
+        self.assertIs(negotiate('text/plain;q=bad'), JSON)
+
+        # Formats not offered are not chosen.
+        self.assertIs(negotiate('application/x-ndjson', RECORD_FORMATS), JSON)
+
+    def test_msgpack_headers(self):
+        """Check msgpack sizes at the bounds of each encoding."""
+        self.assertEqual(pack_str(''), '\xa0')
+        self.assertEqual(pack_str('a' * 31)[:1], '\xbf')
+        self.assertEqual(pack_str('a' * 32)[:2], '\xd9\x20')
+        self.assertEqual(pack_str('a' * 256)[:3], '\xda\x01\x00')
+        self.assertEqual(pack_str('a' * 0x10000)[:5], '\xdb\x00\x01\x00\x00')
+        self.assertEqual(pack_str(u'\xe9'), '\xa2\xc3\xa9')
+        self.assertEqual(pack_map_header(15), '\x8f')
+        self.assertEqual(pack_map_header(16), '\xde\x00\x10')
+        self.assertEqual(pack_array_header(0x10000), '\xdd\x00\x01\x00\x00')
+
+    def test_record_encodings(self):
+        """Check records and lists encoded as msgpack and as lines."""
+        record = GroupData()
+        record.load_from_list('users:x:999:AAAA,BBBB'.split(':'))
+        self.assertEqual(record.to_msgpack(),
+                         '\x83\xa4name\xa5users\xa3gid\xa3999\xa7members\xa9AAAA,BBBB')
+        self.assertTrue(record.to_msgpack() is record.to_msgpack())
+        self.assertEqual(record.to_line(), 'users:x:999:AAAA,BBBB')
+
+        # Groups read from the database hold unicode, members followed by commas.
+        record.from_dict({'name': u'caf\xe9', 'gid': u'999', 'members': u'AAAA,'})
+        self.assertEqual(record.to_line(), 'caf\xc3\xa9:x:999:AAAA')
+
+        record = PasswordData()
+        record.load_from_list('AAAA:x:100:1000:A User:/home/AAAA:/bin/bash'.split(':'))
+        self.assertEqual(record.to_line(), 'AAAA:x:100:1000:A User:/home/AAAA:/bin/bash')
+
+        result_list = ResultList([record, record], 1)
+        self.assertEqual(result_list.encode(LINES), (record.to_line() + '\n') * 2)
+        self.assertEqual(''.join(result_list.iter_encoded(MSGPACK, 1)),
+                         result_list.encode(MSGPACK))
+        self.assertFalse(result_list.is_encoded(JSON))
+        self.assertEqual(ResultList().encode(LINES), '')
+
+    @skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack_decodes(self):
+        """Check msgpack encodings decode to the json values with the msgpack package."""
+        record = PasswordData()
+        record.load_from_list(['A' * 40, 'x', '100', '1000', 'c' * 300, '/home/AAAA',
+                               '/bin/bash'])
+        result_list = ResultList([record] * 20, 1)
+        self.assertEqual(msgpack.unpackb(result_list.encode(MSGPACK), raw=False),
+                         json.loads(result_list.to_json()))
+
+
 class FileUpdate(TestCase):
     """Test loading data and custom location and see if it reloads when changed."""
     def setUp(self):
@@ -105,6 +296,9 @@ class FileUpdate(TestCase):
         # Load the data manager.
         self.data_mgr = DataManager()
 
+    def tearDown(self):
+        self.data_mgr.close()
+
     def test_data_loaded(self):
         """Check to see if expected pwd data is initially loaded."""
         users = self.data_mgr.search(PWD_TYPENAME)
@@ -136,18 +330,1034 @@ class FileUpdate(TestCase):
 
         logging.info('Finished test_data_reloaded.')
 
+    def test_data_renamed_over(self):
+        """Check that a new file renamed over the watched path is loaded."""
+        USER_DATA.write_data(5)
+        self.data_mgr.reload_datatype(PasswordData)
+
+        # Replace the file the way editors and vipw do.
+        new_path = USER_DATA.pwd_path + '.new'
+        with open(new_path, 'w') as new_file:
+            new_file.writelines(USER_DATA.pwd_data[:2])
+        os.rename(new_path, USER_DATA.pwd_path)
+
+        for _ in range(50):
+            if len(self.data_mgr.search(PWD_TYPENAME)) == 2:
+                break
+            time.sleep(0.1)
+        self.assertEqual(len(self.data_mgr.search(PWD_TYPENAME)), 2)
+
+
+class ReloadSchedulerTests(TestCase):
+    """Test coalescing and restarting of scheduled reloads."""
+    def test_burst_coalesced(self):
+        """Check that requests within the delay cause a single reload."""
+        reloads = []
+        scheduler = ReloadScheduler(lambda key, superseded: reloads.append(key), 0.1)
+        scheduler.start()
+        try:
+            for _ in range(5):
+                scheduler.request('passwd')
+            scheduler.request('group')
+            time.sleep(0.5)
+        finally:
+            scheduler.stop()
+
+        self.assertEqual(sorted(reloads), ['group', 'passwd'])
+        self.assertFalse(scheduler.pending())
+
+    def test_superseded_reload_restarted(self):
+        """Check that a request during a reload supersedes it and reloads again."""
+        checks = []
+
+        def reload_func(key, superseded):
+            if not checks:
+                # A change arrives while the first reload is building.
+                scheduler.request(key)
+            checks.append(superseded())
+
+        scheduler = ReloadScheduler(reload_func, 0.1)
+        scheduler.start()
+        try:
+            scheduler.request('passwd')
+            time.sleep(0.6)
+        finally:
+            scheduler.stop()
+
+        self.assertEqual(checks, [True, False])
+
+class FileWatcherTests(TestCase):
+    """Test watching files with native events and by polling."""
+    def setUp(self):
+        USER_DATA.write_data(3)
+        self.changed = []
+        self.reported = threading.Event()
+
+    def callback(self, key):
+        self.changed.append(key)
+        self.reported.set()
+
+    def test_poll_detects_change(self):
+        """Check that polling alone reports a change once, with its latency."""
+        watcher = FileWatcher(self.callback, 'poll', 0.05)
+        watcher.watch(USER_DATA.pwd_path, PWD_TYPENAME)
+        watcher.watch(USER_DATA.grp_path + '.missing', GRP_TYPENAME)
+        watcher.start()
+        try:
+            USER_DATA.write_data(4)
+            os.utime(USER_DATA.pwd_path, None)
+            self.assertTrue(self.reported.wait(5))
+            time.sleep(0.2)
+        finally:
+            watcher.stop()
+
+        self.assertEqual(self.changed, [PWD_TYPENAME])
+        stats = watcher.stats()
+        self.assertFalse(stats['events'] or stats['polling'])
+        self.assertEqual(stats['poll']['changes'], 1)
+        self.assertTrue(0 <= stats['poll']['last_latency'] < 5)
+
+    def test_native_restart(self):
+        """Check that a stopped watcher ends its threads and can be started again."""
+        watcher = FileWatcher(self.callback, 'native')
+        watcher.watch(USER_DATA.pwd_path, PWD_TYPENAME)
+        threads = threading.active_count()
+
+        for _ in range(2):
+            watcher.start()
+            self.assertTrue(watcher.stats()['events'])
+            self.assertFalse(watcher.stats()['polling'])
+            watcher.stop()
+            self.assertFalse(watcher.running())
+            self.assertEqual(threading.active_count(), threads)
+
+        watcher.start()
+        try:
+            USER_DATA.write_data(5)
+            self.assertTrue(self.reported.wait(5))
+        finally:
+            watcher.stop()
+        self.assertEqual(self.changed[0], PWD_TYPENAME)
+        self.assertTrue(watcher.stats()['native']['changes'] > 0)
+
+
+class SnapshotTests(TestCase):
+    """Test that reloads publish complete snapshots with new generations."""
+    def setUp(self):
+        USER_DATA.write_data(3)
+        self.data_mgr = DataManager()
+
+    def tearDown(self):
+        self.data_mgr.close()
+
+    def test_generation_reported(self):
+        """Check that search results carry the snapshot generation."""
+        snapshot = self.data_mgr.get_snapshot()
+        users = self.data_mgr.search(PWD_TYPENAME)
+        self.assertEqual(users.generation, snapshot.generation)
+
+        params = QueryDict('name=AAAA')
+        users = self.data_mgr.search_with_params(PWD_TYPENAME, params)
+        self.assertEqual(users.generation, snapshot.generation)
+
+    def test_reload_keeps_old_snapshot(self):
+        """Check that a reload swaps in a new snapshot leaving the old intact."""
+        old_snapshot = self.data_mgr.get_snapshot()
+
+        self.data_mgr.stop_watchdog()
+        USER_DATA.write_data(5)
+        self.data_mgr.reload_datatype(PasswordData)
+
+        new_snapshot = self.data_mgr.get_snapshot()
+        self.assertTrue(new_snapshot.generation > old_snapshot.generation)
+        self.assertEqual(len(old_snapshot.item_list[PWD_TYPENAME]), 3)
+        self.assertEqual(len(new_snapshot.item_list[PWD_TYPENAME]), 5)
+
+        # Each generation is published a whole second after the last.
+        self.assertTrue(new_snapshot.last_modified() >= old_snapshot.last_modified() + 1)
+
+        users = self.data_mgr.search(PWD_TYPENAME, 'name', 'EEEE', old_snapshot)
+        self.assertEqual(len(users), 0)
+        users = self.data_mgr.search(PWD_TYPENAME, 'name', 'EEEE')
+        self.assertEqual(len(users), 1)
+
+        # Group data is carried over unchanged into the new generation.
+        self.assertTrue(new_snapshot.item_lookup[GRP_TYPENAME] is
+                        old_snapshot.item_lookup[GRP_TYPENAME])
+
+    def test_listing_json_cached(self):
+        """Check listing json is encoded once per generation."""
+        body = self.data_mgr.search(PWD_TYPENAME).to_json()
+        self.assertTrue(self.data_mgr.search(PWD_TYPENAME).to_json() is body)
+        self.assertEqual(body, '[%s]' % ', '.join(
+            [repr(user) for user in self.data_mgr.search(PWD_TYPENAME)]))
+
+        self.data_mgr.stop_watchdog()
+        USER_DATA.write_data(4)
+        self.data_mgr.reload_datatype(PasswordData)
+
+        new_body = self.data_mgr.search(PWD_TYPENAME).to_json()
+        self.assertNotEqual(new_body, body)
+        self.assertTrue(new_body.startswith(body[:-1]))
+
+
+class DatabaseLoadTests(TestCase):
+    """Test bulk loading of data into the database."""
+    def setUp(self):
+        USER_DATA.write_data(3)
+        self.data_mgr = DataManager()
+        self.data_mgr.stop_watchdog()
+
+    def tearDown(self):
+        self.data_mgr.close()
+
+    def test_rows_loaded(self):
+        """Check accounts, groups and memberships are all loaded."""
+        self.assertEqual(Account.objects.count(), len(USER_DATA.pwd_data))
+        self.assertEqual(Group.objects.count(), len(USER_DATA.grp_data))
+
+        account = Account.objects.get(uid='100')
+        self.assertEqual(account.name, 'AAAA')
+        self.assertEqual(account.gid.name, 'AAAA')
+        self.assertEqual(account.home, '/home/AAAA')
+
+        # Members listed in the group file plus those with primary gid.
+        self.assertEqual(Group.objects.get(gid='999').members.count(), 3)
+        self.assertEqual(Group.objects.get(gid='1000').members.get().name, 'AAAA')
+        self.assertEqual(Group.objects.get(gid='0').members.count(), 0)
+
+
+class DataBaseSearchTests(TestCase):
+    """Test database searches run a constant number of queries."""
+    def setUp(self):
+        USER_DATA.write_data(5)
+        self.data_mgr = DataManager()
+        self.data_mgr.stop_watchdog()
+        self.db_search = DataBaseSearch(self.data_mgr)
+
+    def tearDown(self):
+        self.data_mgr.close()
+
+    def names(self, results):
+        """Return sorted names of results."""
+        return sorted(item.get_field('name') for item in results)
+
+    def test_account_queries(self):
+        """Check account listings and searches take one query."""
+        with self.assertNumQueries(1):
+            users = self.db_search.search(PWD_TYPENAME)
+        self.assertEqual(self.names(users), USER_DATA.user_names[:5])
+
+        with self.assertNumQueries(1):
+            users = self.db_search.search_with_params(
+                PWD_TYPENAME, QueryDict('shell=/bin/bash&gid=1001'))
+        self.assertEqual(users[0].get_field('gid'), '1001')
+        self.assertEqual(users[0].get_field('home'), '/home/BBBB')
+
+    def test_group_queries(self):
+        """Check group listings fetch members in one extra query."""
+        with self.assertNumQueries(2):
+            groups = self.db_search.search(GRP_TYPENAME)
+        self.assertEqual(len(groups), len(USER_DATA.grp_data))
+
+        groups = dict((item.get_field('name'), item) for item in groups)
+        self.assertEqual(groups['AAAA'].get_field('members'), 'AAAA,')
+        self.assertEqual(groups['test_users'].member_set,
+                         frozenset(USER_DATA.user_names[:5] + ['']))
+
+    def test_member_order(self):
+        """Check groups list their members in the order of the group file."""
+        USER_DATA.write_data(MAX_USER_SIZE)
+        with override_settings(PWDSVC_LOAD_WORKERS=2):
+            self.data_mgr = DataManager()
+        self.data_mgr.stop_watchdog()
+        self.db_search = DataBaseSearch(self.data_mgr)
+
+        groups = self.db_search.search(GRP_TYPENAME, 'gid', '999')
+        self.assertEqual(groups[0].get_field('members'),
+                         ''.join('%s,' % (name) for name in USER_DATA.user_names))
+
+    def test_member_queries(self):
+        """Check multi member searches are resolved in one query."""
+        with self.assertNumQueries(2):
+            groups = self.db_search.search_with_params(
+                GRP_TYPENAME, QueryDict('member=AAAA&member=EEEE'))
+        self.assertEqual(self.names(groups), ['test_users'])
+
+        groups = self.db_search.search_with_params(
+            GRP_TYPENAME, QueryDict('member=AAAA'))
+        self.assertEqual(self.names(groups), ['AAAA', 'test_users'])
+
+        groups = self.db_search.search_with_params(
+            GRP_TYPENAME, QueryDict('member=AAAA&member=EEEE&gid=1000'))
+        self.assertEqual(len(groups), 0)
+
+        groups = self.db_search.search(GRP_TYPENAME, 'members', 'BBBB')
+        self.assertEqual(self.names(groups), ['BBBB', 'test_users'])
+
+        self.assertRaises(QueryError, self.db_search.search_with_params,
+                          GRP_TYPENAME, QueryDict('member=AAAA&planet=mars'))
+
+    def test_range_queries(self):
+        """Check uid and gid ranges compare ids as integers."""
+        with self.assertNumQueries(1):
+            users = self.db_search.search_with_params(
+                PWD_TYPENAME, QueryDict('uid__gte=101&uid__lt=103'))
+        self.assertEqual(self.names(users), ['BBBB', 'CCCC'])
+
+        groups = self.db_search.search_with_params(
+            GRP_TYPENAME, QueryDict('gid__lte=2'))
+        self.assertEqual(self.names(groups), ['bin', 'daemon', 'root'])
+
+        # Ordered as strings '999' would sort above '1000'.
+        groups = self.db_search.search_with_params(
+            GRP_TYPENAME, QueryDict('gid__gt=998&gid__lt=1001'))
+        self.assertEqual(self.names(groups), ['AAAA', 'test_users'])
+
+        self.assertRaises(QueryError, self.db_search.search_with_params,
+                          PWD_TYPENAME, QueryDict('home__lt=/home'))
+
+    def test_prefix_queries(self):
+        """Check prefixes of text fields match case sensitively."""
+        users = self.db_search.search_with_params(
+            PWD_TYPENAME, QueryDict('home__startswith=/home/B&uid__lt=102'))
+        self.assertEqual(self.names(users), ['BBBB'])
+
+        users = self.db_search.search_with_params(
+            PWD_TYPENAME, QueryDict('name__startswith=a'))
+        self.assertEqual(len(users), 0)
+
+        groups = self.db_search.search_with_params(
+            GRP_TYPENAME, QueryDict('name__startswith=test_'))
+        self.assertEqual(self.names(groups), ['test_users'])
+
+    def test_user_groups(self):
+        """Check groups of a user are found in one query, each group once."""
+        with self.assertNumQueries(2):
+            groups = self.db_search.user_groups('uid', '100')
+        self.assertEqual(self.names(groups), ['AAAA', 'test_users'])
+
+        groups = self.db_search.user_groups('name', 'BBBB')
+        self.assertEqual(self.names(groups), ['BBBB', 'test_users'])
+        self.assertEqual(len(self.db_search.user_groups('uid', '9999')), 0)
+
+
+class QueryPlanTests(TestCase):
+    """Test searches combining several parameters."""
+    def setUp(self):
+        USER_DATA.write_data(5)
+        self.data_mgr = DataManager()
+        self.data_mgr.stop_watchdog()
+
+    def tearDown(self):
+        self.data_mgr.close()
+
+    def names(self, results):
+        """Return names of results in order."""
+        return [item.get_field('name') for item in results]
+
+    def test_combined_params(self):
+        """Check all parameters must match and results keep file order."""
+        results = self.data_mgr.search_with_params(
+            PWD_TYPENAME, QueryDict('shell=/bin/bash'))
+        self.assertEqual(self.names(results), USER_DATA.user_names[:5])
+
+        results = self.data_mgr.search_with_params(
+            PWD_TYPENAME, QueryDict('shell=/bin/bash&gid=1001'))
+        self.assertEqual(self.names(results), ['BBBB'])
+
+        results = self.data_mgr.search_with_params(
+            PWD_TYPENAME, QueryDict('shell=/bin/bash&gid=1001&name=AAAA'))
+        self.assertEqual(len(results), 0)
+
+        results = self.data_mgr.search_with_params(
+            PWD_TYPENAME, QueryDict('shell=/bin/sh&gid=1001'))
+        self.assertEqual(len(results), 0)
+
+    def test_member_params(self):
+        """Check repeated member parameters must all be group members."""
+        results = self.data_mgr.search_with_params(
+            GRP_TYPENAME, QueryDict('member=AAAA&member=EEEE'))
+        self.assertEqual(self.names(results), ['test_users'])
+
+        results = self.data_mgr.search_with_params(
+            GRP_TYPENAME, QueryDict('member=AAAA&member=FFFF'))
+        self.assertEqual(len(results), 0)
+
+    def test_range_params(self):
+        """Check uid and gid ranges select from the sorted index in file order."""
+        results = self.data_mgr.search_with_params(
+            PWD_TYPENAME, QueryDict('uid__lt=102'))
+        self.assertEqual(self.names(results), ['AAAA', 'BBBB'])
+
+        results = self.data_mgr.search_with_params(
+            PWD_TYPENAME, QueryDict('uid__gte=101&uid__lte=102'))
+        self.assertEqual(self.names(results), ['BBBB', 'CCCC'])
+
+        results = self.data_mgr.search_with_params(
+            PWD_TYPENAME, QueryDict('gid__gt=1002&shell=/bin/bash'))
+        self.assertEqual(self.names(results), ['DDDD', 'EEEE'])
+
+        results = self.data_mgr.search_with_params(
+            GRP_TYPENAME, QueryDict('gid__lt=1000'))
+        self.assertEqual(self.names(results), ['root', 'bin', 'daemon', 'test_users'])
+
+        results = self.data_mgr.search_with_params(
+            PWD_TYPENAME, QueryDict('uid__gt=104'))
+        self.assertEqual(len(results), 0)
+
+        for query in ('uid__gte=abc', 'name__gt=A', 'uid__in=1', 'uid__lt'):
+            self.assertRaises(QueryError, self.data_mgr.search_with_params,
+                              PWD_TYPENAME, QueryDict(query))
+        self.assertRaises(QueryError, self.data_mgr.search_with_params,
+                          GRP_TYPENAME, QueryDict('uid__lt=100'))
+
+    def test_prefix_params(self):
+        """Check prefixes of text fields compose with other params in file order."""
+        results = self.data_mgr.search_with_params(
+            PWD_TYPENAME, QueryDict('home__startswith=/home/'))
+        self.assertEqual(self.names(results), USER_DATA.user_names[:5])
+
+        results = self.data_mgr.search_with_params(
+            PWD_TYPENAME, QueryDict('home__startswith=/home/C&shell=/bin/bash'))
+        self.assertEqual(self.names(results), ['CCCC'])
+
+        results = self.data_mgr.search_with_params(
+            PWD_TYPENAME, QueryDict('comment__startswith=D&uid__lt=103'))
+        self.assertEqual(len(results), 0)
+
+        results = self.data_mgr.search_with_params(
+            GRP_TYPENAME, QueryDict('name__startswith=d'))
+        self.assertEqual(self.names(results), ['daemon'])
+
+        results = self.data_mgr.search_with_params(
+            GRP_TYPENAME, QueryDict('name__startswith='))
+        self.assertEqual(len(results), len(USER_DATA.grp_data))
+
+        for query in ('shell__startswith=/bin', 'uid__startswith=1', 'name__lt=B'):
+            self.assertRaises(QueryError, self.data_mgr.search_with_params,
+                              PWD_TYPENAME, QueryDict(query))
+
+    def test_user_groups(self):
+        """Check primary and member groups of a user are indexed once each."""
+        groups = self.data_mgr.user_groups('uid', '100')
+        self.assertEqual(self.names(groups), ['AAAA', 'test_users'])
+        self.assertTrue(self.data_mgr.user_groups('name', 'AAAA') is groups)
+        self.assertEqual(len(self.data_mgr.user_groups('uid', '9999')), 0)
+        self.assertRaises(QueryError, self.data_mgr.user_groups, 'home', '/home/AAAA')
+
+        # A primary group also listing the user is only returned once.
+        with open(USER_DATA.grp_path) as grp_file:
+            grp_data = grp_file.read()
+        with open(USER_DATA.grp_path, 'w') as grp_file:
+            grp_file.write(grp_data.replace('AAAA:x:1000:\n', 'AAAA:x:1000:AAAA\n'))
+        self.data_mgr.reload_datatype(GroupData)
+
+        groups = self.data_mgr.user_groups('uid', '100')
+        self.assertEqual(self.names(groups), ['AAAA', 'test_users'])
+
+    def test_unsupported_param(self):
+        """Check unknown parameters are rejected."""
+        self.assertRaises(QueryError, self.data_mgr.search_with_params,
+                          PWD_TYPENAME, QueryDict('name=AAAA&planet=mars'))
+
+
+class IncrementalReloadTests(TestCase):
+    """Test that reloads only parse and index the lines that changed."""
+    def setUp(self):
+        USER_DATA.write_data(3)
+        self.data_mgr = DataManager()
+
+        # Reload explicitly rather than racing file events.
+        self.data_mgr.stop_watchdog()
+
+    def tearDown(self):
+        self.data_mgr.close()
+
+    def test_unchanged_records_reused(self):
+        """Check that unchanged records carry over and changes are indexed."""
+        old_user = self.data_mgr.search(PWD_TYPENAME, 'name', 'AAAA')[0]
+
+        USER_DATA.write_data(4)
+        self.data_mgr.reload_datatype(PasswordData)
+
+        self.assertTrue(self.data_mgr.search(PWD_TYPENAME, 'name', 'AAAA')[0] is old_user)
+        self.assertEqual(len(self.data_mgr.search(PWD_TYPENAME, 'name', 'DDDD')), 1)
+
+        # Lines are remembered by digest rather than kept.
+        source = self.data_mgr.get_snapshot().item_source[PWD_TYPENAME]
+        self.assertEqual(sorted(source),
+                         sorted(line_digest(line.rstrip('\n')) for line in USER_DATA.pwd_data))
+
+        # Shell is shared by all users, results should stay in file order.
+        names = [user.get_field('name') for user in
+                 self.data_mgr.search(PWD_TYPENAME, 'shell', '/bin/bash')]
+        self.assertEqual(names, USER_DATA.user_names[:4])
+
+        USER_DATA.write_data(2)
+        self.data_mgr.reload_datatype(PasswordData)
+
+        self.assertEqual(len(self.data_mgr.search(PWD_TYPENAME, 'name', 'CCCC')), 0)
+        self.assertEqual(len(self.data_mgr.search(PWD_TYPENAME, 'name', 'DDDD')), 0)
+        self.assertEqual(len(self.data_mgr.search(PWD_TYPENAME, 'shell', '/bin/bash')), 2)
+
+    def test_database_changes_applied(self):
+        """Check that a reload applies added and removed rows to the database."""
+        USER_DATA.write_data(4)
+        self.data_mgr.reload_datatype(PasswordData)
+        self.data_mgr.reload_datatype(GroupData)
+
+        self.assertEqual(Account.objects.count(), 4)
+        self.assertEqual(Group.objects.get(gid='999').members.count(), 4)
+        self.assertEqual(Group.objects.get(gid='1003').members.get().name, 'DDDD')
+
+        USER_DATA.write_data(2)
+        self.data_mgr.reload_datatype(GroupData)
+        self.data_mgr.reload_datatype(PasswordData)
+
+        self.assertEqual(Account.objects.count(), 2)
+        self.assertFalse(Group.objects.filter(gid='1003').exists())
+        self.assertEqual(Group.objects.get(gid='999').members.count(), 2)
+
+    def test_primary_group_removed(self):
+        """Check that removing a primary group keeps its accounts and their memberships."""
+        self.data_mgr.sync_database()
+        self.assertEqual(Group.objects.get(gid='999').members.count(), 3)
+
+        # AAAA's primary group 1000 is removed; AAAA stays in test_users.
+        with open(USER_DATA.grp_path, 'w') as grp_file:
+            grp_file.writelines([line for line in USER_DATA.grp_data
+                                 if not line.startswith('AAAA:')])
+        self.data_mgr.reload_datatype(GroupData)
+
+        self.assertEqual(self.data_mgr.database_generation(),
+                         self.data_mgr.get_snapshot().generation)
+        self.assertFalse(Group.objects.filter(gid='1000').exists())
+        self.assertEqual(Account.objects.get(name='AAAA').gid_id, '1000')
+        self.assertEqual(sorted(Group.objects.get(gid='999').members.values_list(
+            'name', flat=True)), USER_DATA.user_names[:3])
+
+    def test_unchanged_content_not_parsed(self):
+        """Check that content matching the last load is skipped by digest."""
+        def fail_diff(*args):
+            self.fail('Unchanged content was diffed: %s' % (args,))
+        self.data_mgr.diff_data_by_type = fail_diff
+
+        # Rewrite identical content, updating the modification time.
+        USER_DATA.write_data(3)
+        self.data_mgr.reload_datatype(PasswordData)
+        self.data_mgr.reload_datatype(GroupData)
+
+    def test_superseded_reload_not_published(self):
+        """Check that a superseded reload leaves the snapshot in place."""
+        snapshot = self.data_mgr.get_snapshot()
+
+        USER_DATA.write_data(4)
+        self.data_mgr.reload_datatype(PasswordData, lambda: True)
+        self.assertTrue(self.data_mgr.get_snapshot() is snapshot)
+
+        self.data_mgr.reload_datatype(PasswordData)
+        self.assertEqual(len(self.data_mgr.search(PWD_TYPENAME)), 4)
+
+    def test_unchanged_file_keeps_snapshot(self):
+        """Check that reloading identical content publishes nothing new."""
+        snapshot = self.data_mgr.get_snapshot()
+
+        self.data_mgr.reload_datatype(PasswordData)
+        self.data_mgr.reload_datatype(GroupData)
+
+        self.assertTrue(self.data_mgr.get_snapshot() is snapshot)
+
+
+class ParallelLoadTests(TestCase):
+    """Test loading parts of a file in worker processes."""
+    def setUp(self):
+        USER_DATA.write_data(MAX_USER_SIZE)
+        with override_settings(PWDSVC_LOAD_WORKERS=2):
+            self.data_mgr = DataManager()
+        self.data_mgr.stop_watchdog()
+
+    def tearDown(self):
+        self.data_mgr.close()
+
+    def test_chunks_split_at_lines(self):
+        """Check that parts cover the file and end at line boundaries."""
+        with open(USER_DATA.pwd_path) as pwd_file:
+            content = pwd_file.read()
+
+        chunks = source_chunks(USER_DATA.pwd_path, 4, 1)
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(chunks[0][0], 0)
+        self.assertEqual(chunks[-1][1], len(content))
+        for (_, end), (start, _) in zip(chunks, chunks[1:]):
+            self.assertEqual(end, start)
+            self.assertEqual(content[end - 1], '\n')
+
+        # Parts are never smaller than asked for, so small files aren't split.
+        self.assertEqual(len(source_chunks(USER_DATA.pwd_path, 4, len(content))), 1)
+
+    def test_parallel_matches_serial(self):
+        """Check that a parallel load builds the same records and lookups in file order."""
+        for data_type in (PasswordData, GroupData):
+            items, lookup, status, source = self.data_mgr.load_parallel(data_type, 64)
+            serial_items, serial_lookup, _, serial_source = \
+                self.data_mgr.load_data_by_type(data_type)
+
+            self.assertIsNone(status)
+            self.assertEqual([item.to_dict() for item in items],
+                             [item.to_dict() for item in serial_items])
+            self.assertEqual(sorted(source), sorted(serial_source))
+            self.assertEqual(sorted(lookup), sorted(serial_lookup))
+            for key, values in serial_lookup.iteritems():
+                self.assertEqual(sorted(lookup[key]), sorted(values))
+                for val, matches in values.iteritems():
+                    self.assertEqual([item.to_dict() for item in lookup[key][val]],
+                                     [item.to_dict() for item in matches])
+
+    def test_workers_closed(self):
+        """Check that closed and single process managers load in process."""
+        self.data_mgr.close()
+        self.assertIsNone(self.data_mgr.load_parallel(PasswordData, 64))
+        self.assertEqual(len(self.data_mgr.load_data_by_type(PasswordData)[0]), MAX_USER_SIZE)
+
+        data_mgr = DataManager()
+        data_mgr.close()
+        self.assertIsNone(data_mgr.load_parallel(PasswordData, 64))
+
+
+class CompiledIndexTests(TestCase):
+    """Test restarting from compiled indexes and the recorded database state."""
+    class RestartManager(DataManager):
+        """Data manager failing any parse or database load at start."""
+        def load_data_by_type(self, data_type, lines=None, status=None):
+            raise AssertionError('Source of %s parsed.' % (data_type.__name__))
+
+        def load_models(self, snapshot):
+            raise AssertionError('Database reloaded.')
+
+    def setUp(self):
+        USER_DATA.write_data(5)
+        self.data_mgr = DataManager()
+        self.data_mgr.stop_watchdog()
+
+    def tearDown(self):
+        self.data_mgr.close()
+
+    def test_restart_unchanged(self):
+        """Check that a restart with unchanged sources parses and loads nothing."""
+        restarted = self.RestartManager()
+        restarted.stop_watchdog()
+
+        for data_type_name in (PWD_TYPENAME, GRP_TYPENAME):
+            self.assertEqual([item.to_dict() for item in restarted.search(data_type_name)],
+                             [item.to_dict() for item in self.data_mgr.search(data_type_name)])
+
+        snapshot = restarted.get_snapshot()
+        self.assertEqual(snapshot.item_lookup[PWD_TYPENAME]['name']['CCCC'][0].get_field('uid'),
+                         '102')
+        self.assertEqual(len(snapshot.item_lookup[PWD_TYPENAME]['shell']['/bin/bash']), 5)
+        self.assertEqual(len(snapshot.item_lookup[GRP_TYPENAME]['members']['AAAA']), 1)
+        self.assertEqual(len(restarted.search_with_params(PWD_TYPENAME, {'uid__gte': '103'})), 2)
+
+        # Incremental reloads carry on from the compiled records.
+        USER_DATA.write_data(4)
+        restarted.reload_datatype(PasswordData)
+        self.assertEqual(Account.objects.count(), 4)
+
+    def test_restart_changed(self):
+        """Check that changed sources are parsed and loaded again."""
+        USER_DATA.write_data(6)
+        with self.assertRaises(AssertionError):
+            self.RestartManager()
+
+        restarted = DataManager()
+        restarted.stop_watchdog()
+        self.assertEqual(len(restarted.search(PWD_TYPENAME)), 6)
+        self.assertEqual(Account.objects.count(), 6)
+
+
+class AttachedLoaderTests(TestCase):
+    """Test serving processes attached to the data a loader process publishes."""
+    class WorkerManager(DataManager):
+        """Data manager failing any read of the sources or database load."""
+        def read_source(self, data_type):
+            raise AssertionError('Source of %s read.' % (data_type.__name__))
+
+        def load_models(self, snapshot):
+            raise AssertionError('Database loaded.')
+
+    def setUp(self):
+        USER_DATA.write_data(3)
+        self.loader = DataManager(attached=False)
+        self.loader.stop_watchdog()
+
+    def tearDown(self):
+        self.loader.close()
+
+    def test_attached_follows_loader(self):
+        """Check that attached data matches the loader's through reloads."""
+        worker = self.WorkerManager(attached=True)
+        worker.stop_watchdog()
+
+        self.assertTrue(worker.is_ready())
+        for data_type_name in (PWD_TYPENAME, GRP_TYPENAME):
+            self.assertEqual([item.to_dict() for item in worker.search(data_type_name)],
+                             [item.to_dict() for item in self.loader.search(data_type_name)])
+        self.assertEqual(len(worker.user_groups('name', 'AAAA')), 2)
+        self.assertEqual(worker.database_generation(), worker.get_snapshot().generation)
+
+        USER_DATA.write_data(5)
+        self.loader.reload_datatype(PasswordData)
+        worker.attach_datatype(PasswordData)
+        self.assertEqual(len(worker.search(PWD_TYPENAME, 'shell', '/bin/bash')), 5)
+        self.assertEqual(worker.database_generation(), worker.get_snapshot().generation)
+
+        # Nothing new is published for an index already attached.
+        snapshot = worker.get_snapshot()
+        worker.attach_datatype(PasswordData)
+        worker.attach_datatype(GroupData)
+        self.assertTrue(worker.get_snapshot() is snapshot)
+
+    def test_attached_before_published(self):
+        """Check that a worker started before the loader is ready once it publishes."""
+        directory = tempfile.mkdtemp()
+        try:
+            with override_settings(PWDSVC_INDEX_DIR=directory):
+                worker = self.WorkerManager(attached=True)
+                try:
+                    self.assertFalse(worker.is_ready())
+
+                    loader = DataManager(attached=False)
+                    loader.close()
+                    self.assertTrue(worker.wait_ready(10))
+                finally:
+                    worker.close()
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual(len(worker.search(PWD_TYPENAME)), 3)
+        self.assertEqual(len(worker.search(GRP_TYPENAME)), len(self.loader.search(GRP_TYPENAME)))
+
+
+class BlockedManager(DataManager):
+    """Data manager loading in the background once released."""
+    def __init__(self):
+        self.release = threading.Event()
+        DataManager.__init__(self, background=True)
+
+    def read_source(self, data_type):
+        self.release.wait(10)
+        return DataManager.read_source(self, data_type)
+
+    def load_models(self, snapshot):
+        # Loads from the loader thread would escape the test transaction.
+        pass
+
+
+class BackgroundLoadTests(TestCase):
+    """Test loading data in the background."""
+    def test_ready_before_loaded(self):
+        """Check that data is searchable once published, not before."""
+        USER_DATA.write_data(3)
+        data_mgr = BlockedManager()
+        try:
+            self.assertFalse(data_mgr.is_ready())
+            self.assertFalse(data_mgr.wait_ready(0.1))
+            self.assertEqual(len(data_mgr.search(PWD_TYPENAME)), 0)
+
+            data_mgr.release.set()
+            self.assertTrue(data_mgr.wait_ready(10))
+            self.assertEqual(len(data_mgr.search(PWD_TYPENAME)), 3)
+
+            self.assertTrue(data_mgr.wait_loaded(10))
+        finally:
+            data_mgr.release.set()
+            data_mgr.wait_loaded(10)
+            data_mgr.close()
+
+    def test_load_failure_recorded(self):
+        """Check that a failed load ends, leaving the error for /ready."""
+        from pwdsvc import views
+
+        class FailingManager(BlockedManager):
+            def load_data_by_type(self, data_type, lines=None, status=None):
+                raise IOError('Disk on fire.')
+
+        loaded_mgr = views.DATAMGR
+        views.DATAMGR = FailingManager()
+        try:
+            views.DATAMGR.release.set()
+            self.assertTrue(views.DATAMGR.wait_loaded(10))
+            self.assertFalse(views.DATAMGR.is_ready())
+            self.assertTrue(isinstance(views.DATAMGR.load_error(), IOError))
+
+            response = self.client.get(reverse('ready'))
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(json.loads(response.content)['error'], 'Disk on fire.')
+        finally:
+            views.DATAMGR.close()
+            views.DATAMGR = loaded_mgr
+
+
 class ViewTests(TestCase):
     """Test loading views."""
 
     def setUp(self):
         """Re-initialize data to known state."""
+        from pwdsvc import views
+
         USER_DATA.write_data(3)
+        views.DATAMGR.wait_loaded(10)
+
+        # Reload now rather than waiting out the file event delay.
+        views.DATAMGR.reload_datatype(PasswordData)
+        views.DATAMGR.reload_datatype(GroupData)
+
+        # Writes from other threads escape this test's transaction.
+        views.DATAMGR.sync_database()
 
     def test_users(self):
         """Test loading GET /users."""
         response = self.client.get(reverse('users'))
         self.assertEqual(response.status_code, 200)
 
+    def test_users_streamed(self):
+        """Test large GET /users results are streamed as the same json."""
+        from pwdsvc import views
+        views.DATAMGR.wait_loaded(10)
+
+        for search_type in ('DataManager', 'DataBaseSearch'):
+            with self.settings(PWDSVC_SEARCH=search_type):
+                body = self.client.get(reverse('users')).content
+
+                with self.settings(PWDSVC_STREAMING_THRESHOLD=1):
+                    response = self.client.get(reverse('users'))
+
+            self.assertEqual(response.status_code, 200)
+            if response.streaming:
+                self.assertEqual(''.join(response.streaming_content), body)
+            else:
+                # Already encoded listing is served from cache instead.
+                self.assertEqual(response.content, body)
+
+        # Memory searches stream records the snapshot already holds, while
+        # database searches build every record before streaming any.
+        snapshot = views.DATAMGR.get_snapshot()
+        users = views.DATAMGR.search(PWD_TYPENAME, snapshot=snapshot)
+        self.assertTrue(users[0] is snapshot.item_list[PWD_TYPENAME][0])
+        users = DataBaseSearch(views.DATAMGR).search(PWD_TYPENAME)
+        self.assertTrue(isinstance(users, ResultList))
+        self.assertEqual(len(users), len(snapshot.item_list[PWD_TYPENAME]))
+
+    def test_users_ndjson(self):
+        """Test GET /users as newline delimited json."""
+        response = self.client.get(reverse('users'), HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        lines = ''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), len(USER_DATA.pwd_data))
+        names = set(json.loads(line)['name'] for line in lines)
+        self.assertEqual(names, set(USER_DATA.user_names[:len(lines)]))
+
+    def test_formats(self):
+        """Test lists and records negotiated as lines and as msgpack."""
+        response = self.client.get(reverse('users'), HTTP_ACCEPT='text/plain')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertEqual(response['Vary'], 'Accept')
+        self.assertEqual(sorted(response.content.splitlines(True)), USER_DATA.pwd_data)
+
+        response = self.client.get(reverse('groups_by_gid', args=['0']),
+                                   HTTP_ACCEPT='text/plain')
+        self.assertEqual(response.content, USER_DATA.grp_data[0])
+
+        url = reverse('users_query') + '?gid=1001'
+        json_response = self.client.get(url)
+        response = self.client.get(url, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertNotEqual(response['ETag'], json_response['ETag'])
+        if msgpack is not None:
+            self.assertEqual(msgpack.unpackb(response.content, raw=False),
+                             json.loads(json_response.content))
+
+    def test_users_paged(self):
+        """Test GET /users a page at a time by following Link headers."""
+        # Let file events from setUp settle so the snapshot stays put.
+        time.sleep(0.5)
+
+        url = reverse('users') + '?limit=2'
+        names = []
+        pages = 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = json.loads(response.content)
+            self.assertTrue(len(page) <= 2)
+            names.extend(user['name'] for user in page)
+            pages += 1
+
+            url = None
+            if response.has_header('Link'):
+                url = response['Link'][1:response['Link'].index('>')]
+                self.assertIn('limit=2', url)
+
+        self.assertEqual(pages, 2)
+        self.assertEqual(sorted(names), USER_DATA.user_names[:3])
+
+        # Search parameters are kept, paging parameters are not searched.
+        response = self.client.get(reverse('groups_query') + '?member=AAAA&limit=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)), 1)
+        self.assertIn('member=AAAA', response['Link'])
+
+    @override_settings(PWDSVC_SEARCH='DataManager')
+    def test_query_paged_searched_once(self):
+        """Test pages of a query are sliced from one search of memory."""
+        from pwdsvc import views
+        time.sleep(0.5)
+
+        searches = []
+        search_with_params = views.DATAMGR.search_with_params
+        def counted_search(*args, **kwargs):
+            searches.append(args)
+            return search_with_params(*args, **kwargs)
+
+        views.DATAMGR.search_with_params = counted_search
+        try:
+            url = reverse('users_query') + '?shell=/bin/bash&limit=1'
+            names = []
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                names.extend(user['name'] for user in json.loads(response.content))
+                url = None
+                if response.has_header('Link'):
+                    url = response['Link'][1:response['Link'].index('>')]
+        finally:
+            del views.DATAMGR.search_with_params
+
+        self.assertEqual(names, USER_DATA.user_names[:3])
+        self.assertEqual(len(searches), 1)
+
+    def test_users_paged_errors(self):
+        """Test invalid limits and cursors of replaced snapshots are refused."""
+        for limit in ('0', '-1', 'ten'):
+            response = self.client.get(reverse('users') + '?limit=%s' % (limit))
+            self.assertEqual(response.status_code, 404)
+
+        response = self.client.get(reverse('users') + '?limit=1&cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+        # Imported here so views loads its data into the test database.
+        from pwdsvc import views
+        generation = views.DATAMGR.get_snapshot().generation
+        cursor = views.encode_cursor(generation - 1, 1, settings.PWDSVC_SEARCH)
+        response = self.client.get(reverse('users') + '?limit=1&cursor=%s' % (cursor))
+        self.assertEqual(response.status_code, 410)
+
+        # Pages follow the order of the engine the cursor was issued by.
+        views.DATAMGR.wait_loaded(10)
+        with override_settings(PWDSVC_SEARCH='DataManager'):
+            response = self.client.get(reverse('users') + '?limit=1')
+            link = response['Link'][1:response['Link'].index('>')]
+        with override_settings(PWDSVC_SEARCH='DataBaseSearch'):
+            response = self.client.get(link)
+            self.assertEqual(response.status_code, 410)
+        with override_settings(PWDSVC_SEARCH='DataManager'):
+            response = self.client.get(link)
+            self.assertEqual(response.status_code, 200)
+
+    def test_conditional_get(self):
+        """Test unchanged data is answered with 304 Not Modified."""
+        # Imported here so views loads its data into the test database.
+        from pwdsvc import views
+        # Let file events from setUp settle so the snapshot stays put.
+        time.sleep(0.5)
+
+        response = self.client.get(reverse('users'))
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        last_modified = response['Last-Modified']
+
+        response = self.client.get(reverse('users'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, '')
+
+        response = self.client.get(reverse('users'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        # Other queries and formats have their own ETag.
+        response = self.client.get(reverse('users') + '?limit=1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        response = self.client.get(reverse('users'), HTTP_IF_NONE_MATCH=etag,
+                                   HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+
+        # A reload changes the ETag and Last-Modified, even when the file
+        # is given back its old modification time.
+        stat = os.stat(USER_DATA.pwd_path)
+        USER_DATA.write_data(4)
+        os.utime(USER_DATA.pwd_path, (stat.st_atime, stat.st_mtime - 60))
+        views.DATAMGR.reload_datatype(PasswordData)
+        response = self.client.get(reverse('users'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('users'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_ready_and_live(self):
+        """Test GET /ready and /live before and after data is loaded."""
+        from pwdsvc import views
+
+        response = self.client.get(reverse('ready'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(json.loads(response.content)['ready'])
+        self.assertEqual(json.loads(response.content)['error'], None)
+
+        loaded_mgr = views.DATAMGR
+        views.DATAMGR = BlockedManager()
+        try:
+            response = self.client.get(reverse('ready'))
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '1')
+
+            response = self.client.get(reverse('users'))
+            self.assertEqual(response.status_code, 503)
+
+            response = self.client.get(reverse('live'))
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(json.loads(response.content)['ready'])
+            self.assertEqual(json.loads(response.content)['watch']['backend'],
+                             settings.PWDSVC_WATCH_BACKEND)
+
+            views.DATAMGR.release.set()
+            self.assertTrue(views.DATAMGR.wait_ready(10))
+            response = self.client.get(reverse('ready'))
+            self.assertEqual(response.status_code, 200)
+        finally:
+            views.DATAMGR.release.set()
+            views.DATAMGR.wait_loaded(10)
+            views.DATAMGR.close()
+            views.DATAMGR = loaded_mgr
+
+    def test_cache_stats(self):
+        """Test repeated queries are answered from the result cache."""
+        url = reverse('groups_query')
+        with self.settings(PWDSVC_SEARCH='DataManager'):
+            self.client.get(url + '?member=AAAA&member=BBBB')
+            before = json.loads(self.client.get(reverse('cache_stats')).content)
+
+            response = self.client.get(url + '?member=BBBB&member=AAAA')
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, 'test_users')
+
+        after = json.loads(self.client.get(reverse('cache_stats')).content)
+        if after['generation'] == before['generation']:
+            # Unless file events from setUp reloaded the data meanwhile.
+            self.assertEqual(after['hits'], before['hits'] + 1)
+
     def test_groups(self):
         """Test loading the /groups."""
         response = self.client.get(reverse('groups'))
@@ -197,6 +1407,16 @@ class ViewTests(TestCase):
             #response = self.client.get(invalid_query)
             #self.assertEqual(response.status_code, 404)
 
+        range_query = url + '?uid__gte=100&uid__lt=102'
+        response = self.client.get(range_query)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)), 2)
+
+        prefix_query = url + '?home__startswith=/home/&name__startswith=C'
+        response = self.client.get(prefix_query)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'CCCC')
+
     def test_grp_params(self):
         """Test loading the GET /groups/query."""
         url = reverse('groups_query')
@@ -248,6 +1468,12 @@ class ViewTests(TestCase):
 
             self.assertEqual(response.status_code, 200)
             self.assertContains(response, 'test_users')
+            self.assertEqual(len(json.loads(response.content)), 2)
+
+        # negative test should 404
+        url = reverse('users_uid_groups', args=[9999])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
 
     def test_user_uid(self):
         """Test loading GET /users/<uid>."""
@@ -272,3 +1498,231 @@ class ViewTests(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, 404)
 
+
+
+class BatchTests(TestCase):
+    """Test looking up many users and groups in one request."""
+
+    def setUp(self):
+        from pwdsvc import views
+
+        USER_DATA.write_data(5)
+        views.DATAMGR.wait_loaded(10)
+        views.DATAMGR.reload_datatype(PasswordData)
+        views.DATAMGR.reload_datatype(GroupData)
+        views.DATAMGR.sync_database()
+
+    def post(self, name, body):
+        return self.client.post(reverse(name), json.dumps(body),
+                                content_type='application/json')
+
+    def test_batch_lookups(self):
+        """Check that each value is answered, with null for values not found."""
+        for search_type in ('DataManager', 'DataBaseSearch'):
+            with override_settings(PWDSVC_SEARCH=search_type):
+                response = self.post('users_batch', {'uids': ['104', 100, '9999'],
+                                                     'names': ['CCCC', 'ZZZZ']})
+                self.assertEqual(response.status_code, 200)
+                content = json.loads(response.content)
+                self.assertEqual(content['uids']['104']['name'], 'EEEE')
+                self.assertEqual(content['uids']['100']['name'], 'AAAA')
+                self.assertIsNone(content['uids']['9999'])
+                self.assertEqual(content['names']['CCCC']['uid'], '102')
+                self.assertIsNone(content['names']['ZZZZ'])
+
+                response = self.post('groups_batch', {'gids': ['999', '5'],
+                                                      'names': ['BBBB']})
+                self.assertEqual(response.status_code, 200)
+                content = json.loads(response.content)
+                self.assertEqual(content['gids']['999']['name'], 'test_users')
+                self.assertEqual(sorted(content['gids']['999']['members'].split(',')[:-1]),
+                                 USER_DATA.user_names[:5])
+                self.assertIsNone(content['gids']['5'])
+                self.assertEqual(content['names']['BBBB']['gid'], '1001')
+                self.assertNotIn('uids', content)
+
+                # As lines, values not found are left out.
+                response = self.client.post(reverse('users_batch'),
+                                            json.dumps({'uids': ['101', '9999'],
+                                                        'names': ['AAAA']}),
+                                            content_type='application/json',
+                                            HTTP_ACCEPT='text/plain')
+                self.assertEqual(response.content, USER_DATA.pwd_data[1] + USER_DATA.pwd_data[0])
+
+    def test_batch_non_ascii(self):
+        """Check that names outside ascii are found by both search engines."""
+        from pwdsvc import views
+
+        with open(USER_DATA.pwd_path, 'a') as pwd_file:
+            pwd_file.write(u'Zo\xeb:x:150:1000:Zo\xeb:/home/zoe:/bin/bash\n'.encode('utf-8'))
+        views.DATAMGR.reload_datatype(PasswordData)
+        views.DATAMGR.sync_database()
+
+        for search_type in ('DataManager', 'DataBaseSearch'):
+            with override_settings(PWDSVC_SEARCH=search_type):
+                response = self.post('users_batch', {'names': [u'Zo\xeb', 'AAAA']})
+                self.assertEqual(response.status_code, 200)
+                content = json.loads(response.content)
+                self.assertEqual(content['names'][u'Zo\xeb']['uid'], '150')
+                self.assertEqual(content['names']['AAAA']['uid'], '100')
+
+    def test_batch_errors(self):
+        """Check that malformed batches are refused."""
+        for body in ([], {'gids': ['1']}, {'uids': '100'}, {'uids': [True]},
+                     {'uids': [{'uid': '100'}]}):
+            self.assertEqual(self.post('users_batch', body).status_code, 400)
+
+        response = self.client.post(reverse('groups_batch'), '{',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        with override_settings(PWDSVC_BATCH_LIMIT=2):
+            response = self.post('users_batch', {'uids': ['100'], 'names': ['AAAA', 'BBBB']})
+            self.assertEqual(response.status_code, 400)
+
+        self.assertEqual(self.client.get(reverse('users_batch')).status_code, 405)
+
+
+class FastPathTests(TestCase):
+    """Test answering lookups ahead of the Django request stack."""
+
+    def setUp(self):
+        from pwdsvc import views
+        from pwdsvc.fastpath import FastPathApplication
+
+        USER_DATA.write_data(3)
+        views.DATAMGR.wait_loaded(10)
+        views.DATAMGR.reload_datatype(PasswordData)
+        views.DATAMGR.reload_datatype(GroupData)
+        views.DATAMGR.sync_database()
+
+        self.passed_on = []
+        self.application = FastPathApplication(self.django_application)
+
+    def django_application(self, environ, start_response):
+        self.passed_on.append(environ['PATH_INFO'])
+        start_response('404 Not Found', [])
+        return ['']
+
+    def get(self, path, **headers):
+        """Request path from the fast path, returning status, headers and body."""
+        environ = RequestFactory().get(path, **headers).environ
+        started = []
+        body = ''.join(self.application(environ, lambda status, headers:
+                                        started.append((status, dict(headers)))))
+        return started[0][0], started[0][1], body
+
+    def test_lookups_match_views(self):
+        """Check that lookups answer the body and headers of their views, from
+           memory when the views search memory and passed on otherwise."""
+        from django.core.wsgi import get_wsgi_application
+        from pwdsvc.fastpath import FastPathApplication
+
+        django_application = get_wsgi_application()
+        def passing_on(environ, start_response):
+            self.passed_on.append(environ['PATH_INFO'])
+            return django_application(environ, start_response)
+        self.application = FastPathApplication(passing_on)
+
+        for search_type in ('DataManager', 'DataBaseSearch'):
+            self.passed_on = []
+            paths = []
+            with override_settings(PWDSVC_SEARCH=search_type):
+                for name, args in (('users_by_uid', ['101']), ('groups_by_gid', ['999']),
+                                   ('users_uid_groups', ['102']), ('users', []),
+                                   ('groups', [])):
+                    for accept in ('', 'application/msgpack', 'text/plain'):
+                        path = reverse(name, args=args)
+                        paths.append(path)
+                        status, headers, body = self.get(path, HTTP_ACCEPT=accept)
+                        response = self.client.get(path, HTTP_ACCEPT=accept)
+
+                        self.assertEqual(status, '200 OK')
+                        self.assertEqual(body, response.content)
+                        for header in ('ETag', 'Last-Modified', 'Content-Type', 'Vary'):
+                            self.assertEqual(headers[header], response[header])
+                        for value in headers.values():
+                            self.assertTrue(type(value) is str)
+
+                        status, _, body = self.get(path, HTTP_IF_NONE_MATCH=headers['ETag'],
+                                                   HTTP_ACCEPT=accept)
+                        self.assertEqual(status, '304 Not Modified')
+                        self.assertEqual(body, '')
+
+            if search_type == 'DataManager':
+                self.assertEqual(self.passed_on, [])
+            else:
+                self.assertEqual(self.passed_on, [path for path in paths for _ in range(2)])
+
+    def test_etag_matches(self):
+        """Check that If-None-Match compares ETags weakly, removing only a leading W/."""
+        from pwdsvc.fastpath import etag_matches
+
+        self.assertTrue(etag_matches('"abc"', '"abc"'))
+        self.assertTrue(etag_matches('"abc"', 'W/"abc"'))
+        self.assertTrue(etag_matches('W/"abc"', '"xyz", "abc"'))
+        self.assertTrue(etag_matches('"abc"', '*'))
+        self.assertFalse(etag_matches('"abc"', '"abd"'))
+        self.assertFalse(etag_matches('"W/"', '"/"'))
+        self.assertFalse(etag_matches('"abc/W"', '"abc"'))
+
+    @override_settings(PWDSVC_SEARCH='DataManager')
+    def test_other_requests_passed_on(self):
+        """Check that misses and other requests reach the Django application."""
+        self.get(reverse('users_by_uid', args=['9999']))
+        self.get(reverse('users') + '?limit=2')
+        self.get(reverse('users_by_uid', args=['101']), HTTP_ACCEPT='application/x-ndjson')
+        self.get(reverse('users_by_uid', args=['101']),
+                 HTTP_IF_MODIFIED_SINCE='Thu, 01 Jan 1970 00:00:00 GMT')
+        self.assertEqual(self.passed_on, [reverse('users_by_uid', args=['9999']),
+                                          reverse('users'),
+                                          reverse('users_by_uid', args=['101']),
+                                          reverse('users_by_uid', args=['101'])])
+
+    def test_busy_database_searches(self):
+        """Check that searches wait for a free database slot, and are answered
+           503 Service Unavailable rather than from memory when none frees."""
+        from pwdsvc import views
+        from pwdsvc.errors import DatabaseBusyError
+
+        snapshot = views.DATAMGR.get_snapshot()
+        slots = views.DB_SEARCH_SLOTS
+        views.DB_SEARCH_SLOTS = views.SearchSlots(1)
+        try:
+            with override_settings(PWDSVC_SEARCH='DataBaseSearch', PWDSVC_DB_SEARCH_WAIT=0.1):
+                with views.search_slot(snapshot) as search_type:
+                    self.assertEqual(search_type, 'DataBaseSearch')
+                    with self.assertRaises(DatabaseBusyError):
+                        with views.search_slot(snapshot):
+                            pass
+
+                    for path in (reverse('users_query') + '?uid=101',
+                                 reverse('users_by_uid', args=['101']),
+                                 reverse('groups_by_gid', args=['999']),
+                                 reverse('users_uid_groups', args=['102'])):
+                        response = self.client.get(path)
+                        self.assertEqual(response.status_code, 503)
+                        self.assertEqual(response['Retry-After'], '%d' % views.RETRY_AFTER_SECONDS)
+                    response = self.client.post(reverse('users_batch'), json.dumps({'uids': ['101']}),
+                                                content_type='application/json')
+                    self.assertEqual(response.status_code, 503)
+
+                # A waiting search takes the slot once the search holding it is done.
+                held, released = threading.Event(), threading.Event()
+                def hold_slot():
+                    with views.search_slot(snapshot):
+                        held.set()
+                        released.wait()
+                holder = threading.Thread(target=hold_slot)
+                holder.start()
+                try:
+                    held.wait()
+                    threading.Timer(0.02, released.set).start()
+                    response = self.client.get(reverse('users_query') + '?uid=101')
+                finally:
+                    released.set()
+                    holder.join()
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(json.loads(response.content)[0]['name'], 'BBBB')
+        finally:
+            views.DB_SEARCH_SLOTS = slots
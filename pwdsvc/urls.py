@@ -11,7 +11,12 @@ urlpatterns = [
     url(r'^users/(\d+)$', views.users_by_uid, name='users_by_uid'),
     url(r'^users/(\d+)/groups$', views.users_uid_groups, name='users_uid_groups'),
     url(r'^users/query$', views.users_query, name='users_query'),
+    url(r'^users/batch$', views.users_batch, name='users_batch'),
     url(r'^groups$', views.groups, name='groups'),
     url(r'^groups/(\d+)', views.groups_by_gid, name='groups_by_gid'),
     url(r'^groups/query$', views.groups_query, name='groups_query'),
+    url(r'^groups/batch$', views.groups_batch, name='groups_batch'),
+    url(r'^cache$', views.cache_stats, name='cache_stats'),
+    url(r'^ready$', views.ready, name='ready'),
+    url(r'^live$', views.live, name='live'),
 ]
@@ -1,96 +1,668 @@
 """ This module generates responses to HTTP invocations routed to functions here-in.
     See per function documentation for details."""
+import base64
+import json
 import logging
-from django.http import HttpResponse
-from django.http import Http404
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from hashlib import md5
+from django.http import HttpResponse, HttpResponseGone, StreamingHttpResponse
+from django.http import HttpResponseBadRequest, Http404
 from django.core.exceptions import ImproperlyConfigured
 from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_POST
+from pwdsvc.cache import ResultCache, canonical_params
 from pwdsvc.data import QueryError, PathError, PasswordData, GroupData, DataManager
+from pwdsvc.errors import SnapshotChangedError, DatabaseBusyError
+from pwdsvc.formats import JSON, NDJSON, LIST_FORMATS, RECORD_FORMATS, negotiate
 from pwdsvc.models import Group, Account, DataBaseSearch
+from pwdsvc.results import Page, ResultList
 
 logger = logging.getLogger(__name__)
 
-# Load an instance of the file monitor and search engine.
-DATAMGR = DataManager()
+# Load an instance of the file monitor and search engine; loading runs
+# in the background so requests are accepted, see ready_required.
+DATAMGR = DataManager(background=True)
 
-def search_results_handler(result_list):
+# Results of recent searches, dropped when the data is reloaded.
+RESULT_CACHE = ResultCache(settings.PWDSVC_CACHE_ENTRIES, settings.PWDSVC_CACHE_BYTES)
+
+# Query parameters selecting a page of a list rather than search criteria.
+PAGE_PARAMS = ('limit', 'cursor')
+
+# Seconds clients are asked to wait before retrying while data loads.
+RETRY_AFTER_SECONDS = 1
+
+# Per type lists accepted in the body of batch requests, and the field
+# the values of each are looked up by.
+BATCH_FIELDS = {
+    PasswordData.__name__: (('uids', 'uid'), ('names', 'name')),
+    GroupData.__name__: (('gids', 'gid'), ('names', 'name')),
+}
+
+
+
+class SearchSlots(object):
+    """
+    This class bounds the number of searches running at once, like a
+    semaphore whose acquire gives up after a timeout.
+    """
+
+    def __init__(self, count):
+        self.free = count
+        self.condition = threading.Condition()
+
+    def acquire(self, timeout):
+        """
+        Purpose: Take a slot, waiting for one to be released if all are taken.
+        Input Parameters: timeout - seconds to wait for a free slot.
+        Return: True when a slot was taken, False when none freed in time.
+        Exceptions: N/A"""
+        deadline = time.time() + timeout
+        with self.condition:
+            while not self.free:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            self.free -= 1
+            return True
+
+    def release(self):
+        """
+        Purpose: Release a slot taken by acquire, waking a waiting request.
+        Input Parameters: N/A
+        Return: N/A
+        Exceptions: N/A"""
+        with self.condition:
+            self.free += 1
+            self.condition.notify()
+
+
+# Bounds the requests searching the database at once, see search_slot.
+DB_SEARCH_SLOTS = None
+if settings.PWDSVC_DB_SEARCHES:
+    DB_SEARCH_SLOTS = SearchSlots(settings.PWDSVC_DB_SEARCHES)
+
+
+def request_format(request, formats=LIST_FORMATS):
+    """
+    Purpose: Choose the format of a response from the Accept header of
+             its request, see formats.negotiate.
+    Input Parameters:
+        request - HTTP request info passed in from framework.
+        formats - ResponseFormats offered, default = LIST_FORMATS.
+    Return: formats.ResponseFormat.
+    Exceptions: N/A"""
+    return negotiate(request.META.get('HTTP_ACCEPT', ''), formats)
+
+
+def encoded_response(content, response_format, streaming=False):
+    """
+    Purpose: Build a response with the content type of its format,
+             varying with the Accept header it was negotiated from.
+    Input Parameters:
+        content - encoded body, or iterable of its pieces when streaming.
+        response_format - formats.ResponseFormat content is encoded in.
+        streaming - True to stream content, default = False.
+    Return: HttpResponse or StreamingHttpResponse
+    Exceptions: N/A"""
+    kwargs = {}
+    if response_format.content_type is not None:
+        kwargs['content_type'] = response_format.content_type
+    if streaming:
+        response = StreamingHttpResponse(content, **kwargs)
+    else:
+        response = HttpResponse(content, **kwargs)
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
+def encode_cursor(generation, offset, search_type):
     """
-    Purpose: Raise Http404 if results are empty.
+    Purpose: Encode the position of the next page of a list.
     Input Parameters:
-        result_list - list of search reults to scan for content.
-    Return: HttpResponse
+        generation - generation of the snapshot the list was taken from.
+        offset - index of the first result of the next page.
+        search_type - search engine the list was taken from.
+    Return: opaque cursor string.
+    Exceptions: N/A"""
+    return base64.urlsafe_b64encode('%d:%d:%s' % (generation, offset,
+                                                  search_type)).rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Purpose: Decode a cursor made by encode_cursor.
+    Input Parameters:
+        cursor - opaque cursor string.
+    Return: tuple of (generation, offset, search_type).
+    Exceptions: QueryError if cursor is not valid."""
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        generation, offset, search_type = base64.urlsafe_b64decode(
+            str(cursor) + padding).split(':')
+        generation, offset = int(generation), int(offset)
+    except (TypeError, ValueError, UnicodeError):
+        raise QueryError('Invalid cursor: %s' % (cursor))
+
+    if offset < 0:
+        raise QueryError('Invalid cursor: %s' % (cursor))
+    return generation, offset, search_type
+
+
+def read_page(request, snapshot):
+    """
+    Purpose: Read the limit and cursor parameters of a list request.
+             A cursor without a limit continues with pages of
+             PWDSVC_PAGE_LIMIT results.
+    Input Parameters:
+        request - HTTP request info passed in from framework.
+        snapshot - DataSnapshot the request is served from.
+    Return: Page, None when all results are requested.
+    Exceptions: Http404 on invalid limit or cursor,
+                SnapshotChangedError if the cursor was taken from
+                another snapshot, see also search_slot."""
+    limit = request.GET.get('limit')
+    cursor = request.GET.get('cursor')
+    if limit is None and cursor is None:
+        return None
+
+    if limit is None:
+        limit = settings.PWDSVC_PAGE_LIMIT
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise Http404('Invalid limit: %s' % (request.GET['limit']))
+
+    if cursor is None:
+        return Page(0, limit, None, search_engine(snapshot))
+
+    try:
+        generation, offset, search_type = decode_cursor(cursor)
+    except QueryError, query_error:
+        raise Http404(query_error)
+
+    if generation != snapshot.generation:
+        raise SnapshotChangedError(
+            'Snapshot changed since cursor was issued, restart from the first page.')
+    return Page(offset, limit, generation, search_type)
+
+
+def query_params(request):
+    """
+    Purpose: Return the search criteria of a query request.
+    Input Parameters:
+        request - HTTP request info passed in from framework.
+    Return: QueryDict of parameters other than PAGE_PARAMS.
+    Exceptions: N/A"""
+    if not any(key in request.GET for key in PAGE_PARAMS):
+        return request.GET
+
+    params = request.GET.copy()
+    for key in PAGE_PARAMS:
+        params.pop(key, None)
+    return params
+
+
+def snapshot_etag(request, *args, **kwargs):
+    """
+    Purpose: Compute the ETag of a response from the generation of the
+             current snapshot and a hash of the requested path, query,
+             negotiated format and the search engine answering; the
+             engines render groups differently.  Unchanged while the
+             data is not reloaded.
+    Input Parameters:
+        request - HTTP request info passed in from framework.
+        args, kwargs - arguments of the view, included in the path.
+    Return: ETag string.
+    Exceptions: N/A"""
+    snapshot = DATAMGR.get_snapshot()
+    return request_etag(snapshot.generation, request.get_full_path(),
+                        request_format(request).name, search_engine(snapshot))
+
+
+def request_etag(generation, full_path, format_name, search_type):
+    """
+    Purpose: Compute the ETag of a response, see snapshot_etag.
+    Input Parameters:
+        generation - generation of the snapshot answering the request.
+        full_path - requested path and query string.
+        format_name - name of the ResponseFormat negotiated.
+        search_type - name of the search engine answering, see search_engine.
+    Return: ETag string.
+    Exceptions: N/A"""
+    request_key = '%s %s %s' % (full_path, format_name, search_type)
+    return '%d-%s' % (generation, md5(request_key.encode('utf-8')).hexdigest()[:16])
+
+
+def snapshot_last_modified(request, *args, **kwargs):
+    """
+    Purpose: Compute the Last-Modified time of a response; when the
+             snapshot was published, see DataSnapshot.last_modified.
+    Input Parameters:
+        request - HTTP request info passed in from framework.
+        args, kwargs - arguments of the view, unused.
+    Return: datetime in UTC, None if no file has been read.
+    Exceptions: N/A"""
+    mtime = DATAMGR.get_snapshot().last_modified()
+    if mtime is None:
+        return None
+    return datetime.utcfromtimestamp(mtime)
+
+
+# Answers If-None-Match and If-Modified-Since with 304 Not Modified
+# before the view runs any search.
+snapshot_condition = condition(etag_func=snapshot_etag,
+                               last_modified_func=snapshot_last_modified)
+
+
+def service_status():
+    """
+    Purpose: Report the progress of loading data.
+    Input Parameters: N/A
+    Return: OrderedDict of whether data can be searched, the error that
+            ended loading early if any, the generation of the snapshot
+            searched, whether the database holds it and how quickly file
+            changes are detected.
+    Exceptions: N/A"""
+    generation = DATAMGR.get_snapshot().generation
+    load_error = DATAMGR.load_error()
+    status = OrderedDict()
+    status['ready'] = DATAMGR.is_ready()
+    status['error'] = None if load_error is None else str(load_error)
+    status['generation'] = generation
+    status['database'] = DATAMGR.database_generation() == generation
+    status['watch'] = DATAMGR.watch_stats()
+    return status
+
+
+def not_ready_response():
+    """
+    Purpose: Build the response to requests arriving before data is loaded.
+    Input Parameters: N/A
+    Return: HttpResponse 503 Service Unavailable with Retry-After header.
+    Exceptions: N/A"""
+    response = HttpResponse(json.dumps(service_status()), status=503)
+    response['Retry-After'] = '%d' % (RETRY_AFTER_SECONDS)
+    return response
+
+
+def ready_required(view):
+    """
+    Purpose: Decorate a view to answer 503 Service Unavailable until
+             data has been loaded, and while database searches are too
+             busy to take the request, see search_slot.
+    Input Parameters:
+        view - view function to decorate.
+    Return: decorated view function.
+    Exceptions: N/A"""
+    @wraps(view)
+    def handler(request, *args, **kwargs):
+        if not DATAMGR.is_ready():
+            return not_ready_response()
+        try:
+            return view(request, *args, **kwargs)
+        except DatabaseBusyError, busy_error:
+            response = HttpResponse(str(busy_error), status=503)
+            response['Retry-After'] = '%d' % (RETRY_AFTER_SECONDS)
+            return response
+    return handler
+
+
+def search_engine(snapshot):
+    """
+    Purpose: Choose the search engine answering a request; the configured
+             PWDSVC_SEARCH, except that the database is only searched
+             once it holds snapshot and memory is searched until then.
+    Input Parameters:
+        snapshot - DataSnapshot the request is answered from.
+    Return: 'DataBaseSearch' to search the database, otherwise 'DataManager'.
+    Exceptions: N/A"""
+    search_type = settings.PWDSVC_SEARCH
+    if search_type == 'DataBaseSearch' and DATAMGR.database_generation() != snapshot.generation:
+        return DataManager.__name__
+    return search_type
+
+
+@contextmanager
+def search_slot(snapshot, page=None):
+    """
+    Purpose: Choose the search engine answering a request as search_engine
+             does, holding one of DB_SEARCH_SLOTS while the database is
+             searched.  With every slot taken, the request waits up to
+             PWDSVC_DB_SEARCH_WAIT seconds for one; memory is not searched
+             instead, as it lists group members differently and the
+             response would not match its ETag.  The engines order
+             results differently, so pages after the first are only
+             answered by the engine their cursor was issued by.
+    Input Parameters:
+        snapshot - DataSnapshot the request is answered from.
+        page - Page of results requested, default = None.
+    Return: context manager giving the search engine name.
+    Exceptions: DatabaseBusyError when no slot is freed in time,
+                SnapshotChangedError when the search engine changed
+                since the cursor of page was issued."""
+    search_type = search_engine(snapshot)
+    if page is not None and page.generation is not None and page.search_type != search_type:
+        raise SnapshotChangedError(
+            'Search engine changed since cursor was issued, restart from the first page.')
+    if search_type != 'DataBaseSearch' or DB_SEARCH_SLOTS is None:
+        yield search_type
+    elif not DB_SEARCH_SLOTS.acquire(settings.PWDSVC_DB_SEARCH_WAIT):
+        raise DatabaseBusyError('Database searches busy, retry later.')
+    else:
+        try:
+            yield search_type
+        finally:
+            DB_SEARCH_SLOTS.release()
+
+
+def snapshot_changed_handler(view):
+    """
+    Purpose: Decorate a list view to answer 410 Gone when its cursor
+             was taken from a snapshot that has since been replaced.
+    Input Parameters:
+        view - view function to decorate.
+    Return: decorated view function.
+    Exceptions: N/A"""
+    @wraps(view)
+    def handler(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except SnapshotChangedError, snapshot_error:
+            return HttpResponseGone(str(snapshot_error))
+    return handler
+
+
+def search_results_handler(result_list, request=None, page=None):
+    """
+    Purpose: Raise Http404 if results are empty.  Results are encoded
+             in the format negotiated from the Accept header.  Results
+             larger than PWDSVC_STREAMING_THRESHOLD, or requested as
+             ndjson, are streamed a chunk of records at a time rather
+             than encoded into one body, unless their encoding in the
+             format is already cached.
+             When a page is requested the response carries a Link
+             header to the next page, if there is one.
+    Input Parameters:
+        result_list - ResultList of search reults to scan for content;
+                      for a page, its results followed by the first
+                      result of the next page if any.
+        request - HTTP request info used to negotiate format, default = None.
+        page - Page of results requested, default = None.
+    Return: HttpResponse or StreamingHttpResponse
     Exceptions: Http404 on empty results."""
 
-    if not result_list:
+    next_url = None
+    if page is not None:
+        if len(result_list) > page.limit:
+            params = request.GET.copy()
+            params['limit'] = page.limit
+            params['cursor'] = encode_cursor(result_list.generation,
+                                             page.offset + page.limit, page.search_type)
+            next_url = '%s?%s' % (request.path, params.urlencode())
+            result_list = ResultList(result_list[:page.limit], result_list.generation)
+
+    # Pages after the first may be empty, i.e. when the list ends on a page boundary.
+    if not result_list and (page is None or not page.offset):
         raise Http404('No results found.')
+
+    response_format = JSON if request is None else request_format(request)
+    threshold = settings.PWDSVC_STREAMING_THRESHOLD
+    if response_format is not NDJSON and (result_list.is_encoded(response_format) or
+                                          threshold is None or
+                                          len(result_list) <= threshold):
+        response = encoded_response(result_list.encode(response_format), response_format)
     else:
-        return HttpResponse("%s" % result_list)
+        response = encoded_response(result_list.iter_encoded(response_format),
+                                    response_format, streaming=True)
+
+    if next_url is not None:
+        response['Link'] = '<%s>; rel="next"' % (next_url)
+    return response
 
 
-def search_handler(data_type_name, search_key=None, search_value=None):
+def cache_results(cache_key, result_list, db_generation=None, response_format=JSON):
+    """
+    Purpose: Add search results to RESULT_CACHE unless they are too
+             many to encode in one body, see PWDSVC_STREAMING_THRESHOLD,
+             or were read from a database not yet matching the snapshot.
+    Input Parameters:
+        cache_key - key of the search in RESULT_CACHE.
+        result_list - ResultList of search results.
+        db_generation - generation in the database before searching,
+                        default = None when not searched in the database.
+        response_format - formats.ResponseFormat the results are
+                          requested in, default = JSON.
+    Return: N/A
+    Exceptions: N/A"""
+    if cache_key[1] == 'DataBaseSearch' and db_generation != result_list.generation:
+        return
+
+    threshold = settings.PWDSVC_STREAMING_THRESHOLD
+    if (result_list.is_encoded(response_format) or threshold is None or
+            len(result_list) <= threshold):
+        RESULT_CACHE.put(cache_key, result_list, response_format)
+
+
+def search_handler(data_type_name, search_key=None, search_value=None, snapshot=None,
+                   page=None, response_format=JSON):
     """
     Purpose: Adapt PathError and QueryError to appropriate Django error types.
     Input Parameters:
         data_type_name - One of the searchable types 'PasswordData' or 'GroupData'.
         search_key - Name of searchable field for type specified Optional, default = None.
         search_value - Value of defined field to match from data, default = None.
-    Return: HttpResponse with json representation of returned values.
+        snapshot - DataSnapshot to search when not using the database, default = None.
+        page - Page of results to return, default = None for all results.
+        response_format - formats.ResponseFormat the results are
+                          requested in, cached apart, default = JSON.
+    Return: ResultList of search results.
     Exceptions: Http404 on QueryError,
                 ImproperlyConfigured on PathError """
 
-    result_list = []
-    try:
-        search_type = settings.PWDSVC_SEARCH
-        if search_type == 'DataBaseSearch':
-            db_search = DataBaseSearch(DATAMGR)
-            result_list = db_search.search(data_type_name, search_key, search_value)
-        else:
-            result_list = DATAMGR.search(data_type_name, search_key, search_value)
-    except PathError, path_error:
-        raise ImproperlyConfigured(path_error)
-    except QueryError, query_error:
-        raise Http404(query_error)
-
-    if not result_list:
+    if snapshot is None:
+        snapshot = DATAMGR.get_snapshot()
+
+    with search_slot(snapshot, page) as search_type:
+        cache_key = ('search', search_type, data_type_name, search_key, search_value,
+                     page and page[:2], response_format.name)
+
+        result_list = RESULT_CACHE.get(snapshot.generation, cache_key)
+        if result_list is None:
+            try:
+                db_generation = DATAMGR.database_generation()
+                if search_type == 'DataBaseSearch':
+                    db_search = DataBaseSearch(DATAMGR)
+                    result_list = db_search.search(data_type_name, search_key, search_value,
+                                                   page)
+                else:
+                    result_list = DATAMGR.search(data_type_name, search_key, search_value,
+                                                 snapshot)
+                    if page is not None:
+                        result_list = result_list.page(page)
+            except PathError, path_error:
+                raise ImproperlyConfigured(path_error)
+            except QueryError, query_error:
+                raise Http404(query_error)
+
+            cache_results(cache_key, result_list, db_generation, response_format)
+
+    if not result_list and (page is None or not page.offset):
         raise Http404('No results.')
 
     return result_list
 
 
-def search_with_params_handler(data_type_name, dict_):
+def all_matches(data_type_name, dict_, snapshot):
+    """
+    Purpose: Search memory for every result of query parameters, keeping
+             them in RESULT_CACHE so that all pages of the query are
+             sliced from a single search.
+    Input Parameters:
+        data_type_name - One of the searchable types 'PasswordData' or 'GroupData'.
+        dict_ - dictionary of parameters passed in to act as search keys.
+        snapshot - DataSnapshot to search.
+    Return: ResultList of search results.
+    Exceptions: QueryError, PathError as raised by the search."""
+    cache_key = ('matches', data_type_name, canonical_params(dict_))
+    result_list = RESULT_CACHE.get(snapshot.generation, cache_key)
+    if result_list is None:
+        result_list = DATAMGR.search_with_params(data_type_name, dict_, snapshot)
+        # Results are records of the snapshot; the list alone is held.
+        RESULT_CACHE.put(cache_key, result_list, size=sys.getsizeof(result_list))
+    return result_list
+
+
+def search_with_params_handler(data_type_name, dict_, snapshot=None, page=None,
+                               response_format=JSON):
     """
     Purpose: Adapt PathError and QueryError to appropriate Django error types.
     Input Parameters:
         data_type_name - One of the searchable types 'PasswordData' or 'GroupData'.
         dict_ - dictionary of parameters passed in to act as search keys.
-    Return: HttpResponse with json representation of returned values.
+        snapshot - DataSnapshot to search when not using the database, default = None.
+        page - Page of results to return, default = None for all results.
+        response_format - formats.ResponseFormat the results are
+                          requested in, cached apart, default = JSON.
+    Return: ResultList of search results.
     Exceptions: Http404 on QueryError,
                 ImproperlyConfigured on PathError """
-    result_list = []
+    if snapshot is None:
+        snapshot = DATAMGR.get_snapshot()
+
+    with search_slot(snapshot, page) as search_type:
+        cache_key = ('params', search_type, data_type_name, canonical_params(dict_),
+                     page and page[:2], response_format.name)
+
+        result_list = RESULT_CACHE.get(snapshot.generation, cache_key)
+        if result_list is not None:
+            return result_list
+
+        try:
+            db_generation = DATAMGR.database_generation()
+            if search_type == 'DataBaseSearch':
+                db_search = DataBaseSearch(DATAMGR)
+                result_list = db_search.search_with_params(data_type_name, dict_, page)
+            elif page is None:
+                result_list = DATAMGR.search_with_params(data_type_name, dict_, snapshot)
+            else:
+                result_list = all_matches(data_type_name, dict_, snapshot).page(page)
+
+        except PathError, path_error:
+            raise ImproperlyConfigured(path_error)
+        except QueryError, query_error:
+            raise Http404(query_error)
+
+        cache_results(cache_key, result_list, db_generation, response_format)
+    return result_list
+
 
+def read_batch(request, data_type_name):
+    """
+    Purpose: Read the lists of values to look up from the json body of a
+             batch request, e.g. {"uids": ["0", "1000"], "names": ["root"]}.
+    Input Parameters:
+        request - HTTP request info passed in from framework.
+        data_type_name - One of the searchable types 'PasswordData' or 'GroupData'.
+    Return: list of (list name, field, list of values) in BATCH_FIELDS order,
+            for the lists given; values are listed once, in request order.
+    Exceptions: ValueError if the body is not a json object of lists of
+                strings or integers named in BATCH_FIELDS, or holds more
+                than PWDSVC_BATCH_LIMIT values."""
+    body = json.loads(request.body)
+    if not isinstance(body, dict):
+        raise ValueError('Batch request must be a json object.')
+
+    fields = BATCH_FIELDS[data_type_name]
+    unknown = set(body) - set(list_name for list_name, _ in fields)
+    if unknown:
+        raise ValueError('Unknown batch lists: %s.' % (', '.join(sorted(unknown))))
+
+    batch = []
+    count = 0
+    for list_name, field in fields:
+        if list_name not in body:
+            continue
+        values = body[list_name]
+        if not isinstance(values, list):
+            raise ValueError('Batch list %s must be a json array.' % (list_name))
+
+        strings = []
+        seen = set()
+        for value in values:
+            if isinstance(value, unicode):
+                # Loaded data is held as utf-8 encoded strings.
+                value = value.encode('utf-8')
+            elif isinstance(value, (int, long)) and not isinstance(value, bool):
+                value = '%d' % (value)
+            else:
+                raise ValueError('Batch list %s must hold strings or integers.' % (list_name))
+            if value not in seen:
+                seen.add(value)
+                strings.append(value)
+        count += len(strings)
+        batch.append((list_name, field, strings))
+
+    if count > settings.PWDSVC_BATCH_LIMIT:
+        raise ValueError('Batch of %d values exceeds limit of %d.' %
+                         (count, settings.PWDSVC_BATCH_LIMIT))
+    return batch
+
+
+def batch_handler(request, data_type_name):
+    """
+    Purpose: Look up every value of a batch request, in memory or with
+             IN queries in the database, see search_slot.
+    Input Parameters:
+        request - HTTP request info passed in from framework.
+        data_type_name - One of the searchable types 'PasswordData' or 'GroupData'.
+    Return: HttpResponse with the records found in the format negotiated,
+            400 Bad Request if the body can't be read.
+    Exceptions: ImproperlyConfigured on PathError """
     try:
-        search_type = settings.PWDSVC_SEARCH
-        if search_type == 'DataBaseSearch':
-            db_search = DataBaseSearch(DATAMGR)
-            result_list = db_search.search_with_params(data_type_name, dict_)
-        else:
-            result_list = DATAMGR.search_with_params(data_type_name, dict_)
+        batch = read_batch(request, data_type_name)
+    except ValueError, value_error:
+        return HttpResponseBadRequest(str(value_error))
 
+    snapshot = DATAMGR.get_snapshot()
+    found = []
+    try:
+        with search_slot(snapshot) as search_type:
+            for list_name, field, values in batch:
+                if search_type == 'DataBaseSearch':
+                    db_search = DataBaseSearch(DATAMGR)
+                    records = db_search.batch_search(data_type_name, field, values)
+                else:
+                    records = DATAMGR.batch_search(data_type_name, field, values, snapshot)
+                found.append((list_name, values, records))
     except PathError, path_error:
         raise ImproperlyConfigured(path_error)
-    except QueryError, query_error:
-        raise Http404(query_error)
 
-    return result_list
+    response_format = request_format(request, RECORD_FORMATS)
+    return encoded_response(response_format.encode_batch(found), response_format)
 
 
-def unique_result_expected_handler(result_list):
+def unique_result_expected_handler(result_list, response_format=JSON):
     """
     Purpose: Prune result from list to dictionary and detect multiple results
             when unique result expected.
     Input Parameters:
         result_list - list of result values to evaluate.
-    Return: HttpResponse with json representation of returned values.
+        response_format - formats.ResponseFormat to encode the result in,
+                          default = JSON.
+    Return: HttpResponse with the encoded result.
     Exceptions: Http404 on QueryError,
                 ImproperlyConfigured on PathError """
     if len(result_list) > 1:
@@ -100,24 +672,34 @@ def unique_result_expected_handler(result_list):
         # prune to first result
         result_list = result_list[0]
 
-    return HttpResponse(result_list)
+    return encoded_response(response_format.encode_record(result_list), response_format)
 
 
+@ready_required
+@snapshot_condition
+@snapshot_changed_handler
 def users(request):
     """
-    Purpose: Handle GET /users; return a list of all users on the system,
+    Purpose: Handle GET /users[?limit=<n>[&cursor=<c>]];
+             return a list of all users on the system,
              as defined in the /etc/passwd file.
     Input Parameters:
         request - HTTP request info passed in from framework.
-    Return: HttpResponse with json representation of returned values.
+    Return: HttpResponse with returned values in the format negotiated
+            from the Accept header.
     Exceptions: N/A """
 
     logger.debug('Request routed to users: %s', request)
-    result_list = search_handler(PasswordData.__name__)
+    snapshot = DATAMGR.get_snapshot()
+    page = read_page(request, snapshot)
+    result_list = search_handler(PasswordData.__name__, snapshot=snapshot, page=page,
+                                 response_format=request_format(request))
 
-    return search_results_handler(result_list)
+    return search_results_handler(result_list, request, page)
 
 
+@ready_required
+@snapshot_condition
 def users_by_uid(request, uid):
     """
     Purpose: Handle GET /users/<uid>, return a single user with <uid>.
@@ -125,37 +707,57 @@ def users_by_uid(request, uid):
     Input Parameters:
         request - HTTP request info passed in from framework.
         uid - string representation of uid value.
-    Return: HttpResponse with json representation of returned values.
+    Return: HttpResponse with returned values in the format negotiated
+            from the Accept header.
     Exceptions: N/A """
     logger.debug('Request routed to user_by_uid: %s', request)
-    result_list = search_handler(PasswordData.__name__, 'uid', uid)
-    return unique_result_expected_handler(result_list)
+    response_format = request_format(request, RECORD_FORMATS)
+    result_list = search_handler(PasswordData.__name__, 'uid', uid,
+                                 response_format=response_format)
+    return unique_result_expected_handler(result_list, response_format)
 
 
+@ready_required
+@snapshot_condition
+@snapshot_changed_handler
 def users_uid_groups(request, uid):
     """
-    Purpose: Handle GET /users/<uid>/groups;
+    Purpose: Handle GET /users/<uid>/groups[?limit=<n>[&cursor=<c>]];
              return all the groups for a given user.
     Input Parameters:
         request - HTTP request info passed in from framework.
         uid - string representation of uid value.
-    Return: HttpResponse with json representation of returned values.
+    Return: HttpResponse with returned values in the format negotiated
+            from the Accept header.
     Exceptions: N/A """
 
     logger.debug('Request routed to users_uid_groups: %s', request)
-    # This will throw 404 if no user by uid finds result.
-    user = search_handler(PasswordData.__name__, 'uid', uid)
+    snapshot = DATAMGR.get_snapshot()
+    page = read_page(request, snapshot)
 
-    name = user[0].get_field('name')
-    gid = user[0].get_field('gid')
-
-    # Joining matches of search on user name and gid to group information.
-    result_list = DATAMGR.search(GroupData.__name__, 'gid', gid)
-    result_list += DATAMGR.search(GroupData.__name__, 'members', name)
+    result_list = []
+    try:
+        with search_slot(snapshot, page) as search_type:
+            if search_type == 'DataBaseSearch':
+                db_search = DataBaseSearch(DATAMGR)
+                result_list = db_search.user_groups('uid', uid, page)
+            else:
+                # Primary and member groups are indexed per snapshot, the
+                # encoded body is cached with the list on first request.
+                result_list = DATAMGR.user_groups('uid', uid, snapshot)
+                if page is not None:
+                    result_list = result_list.page(page)
+    except PathError, path_error:
+        raise ImproperlyConfigured(path_error)
+    except QueryError, query_error:
+        raise Http404(query_error)
 
-    return search_results_handler(result_list)
+    return search_results_handler(result_list, request, page)
 
 
+@ready_required
+@snapshot_condition
+@snapshot_changed_handler
 def users_query(request):
     """
     Purpose: Handle GET
@@ -168,45 +770,67 @@ def users_query(request):
             -gid
             -comment
             -home
+
+            uid and gid also accept the range operators __gt, __gte,
+            __lt and __lte, compared as integers.  name, home and
+            comment accept the case sensitive prefix operator __startswith.
     Input Parameters:
         request - HTTP request info passed in from framework;
                 namely including dictionary of parameters.
-    Return: HttpResponse with json representation of returned values.
+    Return: HttpResponse with returned values in the format negotiated
+            from the Accept header.
     Exceptions: N/A """
     logger.debug('Routed to users_query %s.', request)
+    snapshot = DATAMGR.get_snapshot()
+    page = read_page(request, snapshot)
     result_list = search_with_params_handler(
-        PasswordData.__name__, request.GET)
-    return search_results_handler(result_list)
+        PasswordData.__name__, query_params(request), snapshot, page, request_format(request))
+    return search_results_handler(result_list, request, page)
 
 
+@ready_required
+@snapshot_condition
+@snapshot_changed_handler
 def groups(request):
     """
-    Purpose: Handle GET /groups;
+    Purpose: Handle GET /groups[?limit=<n>[&cursor=<c>]];
              return a list of all groups on the system,
              a defined by /etc/group.
     Input Parameters:
         request - HTTP request info passed in from framework.
-    Return: HttpResponse with json representation of returned values.
+    Return: HttpResponse with returned values in the format negotiated
+            from the Accept header.
     Exceptions: N/A """
     logger.debug('Routed to groups %s.', request)
-    result_list = search_handler(GroupData.__name__)
+    snapshot = DATAMGR.get_snapshot()
+    page = read_page(request, snapshot)
+    result_list = search_handler(GroupData.__name__, snapshot=snapshot, page=page,
+                                 response_format=request_format(request))
 
-    return search_results_handler(result_list)
+    return search_results_handler(result_list, request, page)
 
 
+@ready_required
+@snapshot_condition
 def groups_by_gid(request, gid):
     """
     Purpose: Handle GET /groups/<gid>;
              return a single group with <gid>. Return 404 if <gid> is not found.
     Input Parameters:
         request - HTTP request info passed in from framework.
-    Return: HttpResponse with json representation of returned values.
+    Return: HttpResponse with returned values in the format negotiated
+            from the Accept header.
     Exceptions: N/A """
     logger.debug('Routed to group_by_gid: %s.', request)
-    result_list = search_handler(GroupData.__name__, 'gid', gid)
-    return unique_result_expected_handler(result_list)
+    response_format = request_format(request, RECORD_FORMATS)
+    result_list = search_handler(GroupData.__name__, 'gid', gid,
+                                 response_format=response_format)
+    return unique_result_expected_handler(result_list, response_format)
 
 
+@ready_required
+@snapshot_condition
+@snapshot_changed_handler
 def groups_query(request):
     """
     Purpose: Handle GET
@@ -221,12 +845,96 @@ def groups_query(request):
 
             Any group containing all the specified members should be returned,
             i.e. when query members are a subset of group members.
+
+            gid also accepts the range operators gid__gt, gid__gte,
+            gid__lt and gid__lte, compared as integers, and name
+            accepts the prefix operator name__startswith.
     Input Parameters:
         request - HTTP request info passed in from framework;
                   namely including dictionary of parameters.
-    Return: HttpResponse with json representation of returned values.
+    Return: HttpResponse with returned values in the format negotiated
+            from the Accept header.
     Exceptions: N/A """
 
     logger.debug('Routed to groups_query %s', request.GET)
-    result_list = search_with_params_handler(GroupData.__name__, request.GET)
-    return search_results_handler(result_list)
+    snapshot = DATAMGR.get_snapshot()
+    page = read_page(request, snapshot)
+    result_list = search_with_params_handler(
+        GroupData.__name__, query_params(request), snapshot, page, request_format(request))
+    return search_results_handler(result_list, request, page)
+
+
+@csrf_exempt
+@require_POST
+@ready_required
+def users_batch(request):
+    """
+    Purpose: Handle POST /users/batch with a json body of
+             {"uids": [<uid>, ...], "names": [<name>, ...]}, either list
+             optional; return each user by uid and by name at once.
+    Input Parameters:
+        request - HTTP request info passed in from framework.
+    Return: HttpResponse with json object, or msgpack map, of "uids" and
+            "names", each an object of the values asked for to their user,
+            null when not found; as text, the lines of the users found.
+            400 Bad Request on a malformed body.
+    Exceptions: N/A """
+    logger.debug('Routed to users_batch %s.', request)
+    return batch_handler(request, PasswordData.__name__)
+
+
+@csrf_exempt
+@require_POST
+@ready_required
+def groups_batch(request):
+    """
+    Purpose: Handle POST /groups/batch with a json body of
+             {"gids": [<gid>, ...], "names": [<name>, ...]}, either list
+             optional; return each group by gid and by name at once.
+    Input Parameters:
+        request - HTTP request info passed in from framework.
+    Return: HttpResponse with json object, or msgpack map, of "gids" and
+            "names", each an object of the values asked for to their group,
+            null when not found; as text, the lines of the groups found.
+            400 Bad Request on a malformed body.
+    Exceptions: N/A """
+    logger.debug('Routed to groups_batch %s.', request)
+    return batch_handler(request, GroupData.__name__)
+
+
+def cache_stats(request):
+    """
+    Purpose: Handle GET /cache; return counters of the search result cache.
+    Input Parameters:
+        request - HTTP request info passed in from framework.
+    Return: HttpResponse with json representation of cache counters.
+    Exceptions: N/A """
+    logger.debug('Routed to cache_stats %s.', request)
+    return HttpResponse(json.dumps(RESULT_CACHE.stats()))
+
+
+def ready(request):
+    """
+    Purpose: Handle GET /ready; answer whether data has been loaded
+             and requests can be served, for readiness probes.
+    Input Parameters:
+        request - HTTP request info passed in from framework.
+    Return: HttpResponse with json representation of loading progress,
+            503 Service Unavailable with Retry-After until data is loaded.
+    Exceptions: N/A """
+    logger.debug('Routed to ready %s.', request)
+    if not DATAMGR.is_ready():
+        return not_ready_response()
+    return HttpResponse(json.dumps(service_status()))
+
+
+def live(request):
+    """
+    Purpose: Handle GET /live; answer that the service is running,
+             whether or not data has been loaded, for liveness probes.
+    Input Parameters:
+        request - HTTP request info passed in from framework.
+    Return: HttpResponse with json representation of loading progress.
+    Exceptions: N/A """
+    logger.debug('Routed to live %s.', request)
+    return HttpResponse(json.dumps(service_status()))
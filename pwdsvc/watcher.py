@@ -0,0 +1,318 @@
+"""
+This module provides one service watching all configured files for
+change, with native filesystem events and a stat based poller for
+filesystems, such as NFS and some overlays, that never deliver them.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+# Get an instance of a logger.
+import logging
+logger = logging.getLogger(__name__)
+
+# Watch with native filesystem events and poll as a safety net.
+BACKEND_AUTO = 'auto'
+# Watch with native filesystem events alone.
+BACKEND_NATIVE = 'native'
+# Watch by polling alone.
+BACKEND_POLL = 'poll'
+
+BACKENDS = (BACKEND_AUTO, BACKEND_NATIVE, BACKEND_POLL)
+
+
+def stat_signature(path):
+    """
+    Purpose: Summarize the state of a file that changes when it is
+             written or replaced.
+    Input Parameters: path - path of file.
+    Return: tuple of (mtime, size, inode), None if the file is missing.
+    Exceptions: N/A."""
+    try:
+        stat = os.stat(path)
+    except EnvironmentError:
+        return None
+    return stat.st_mtime, stat.st_size, stat.st_ino
+
+
+class WatchEventHandler(FileSystemEventHandler):
+    """
+    This class passes native file events in a watched directory on to
+    the FileWatcher, which ignores files it doesn't watch.
+    """
+
+    def __init__(self, watcher):
+        FileSystemEventHandler.__init__(self)
+        self._watcher = watcher
+
+    def on_modified(self, event):
+        """
+        Purpose: Receives notification of file change.
+        Input Parameters:
+            event - type of filesystem event.
+        Return: N/A.
+        Exceptions: N/A."""
+        if not event.is_directory:
+            self._watcher.path_changed(event.src_path, BACKEND_NATIVE)
+
+    def on_created(self, event):
+        """
+        Purpose: Receives notification of file creation, such as a
+                 file replaced by deleting and writing it again.
+        Input Parameters:
+            event - type of filesystem event.
+        Return: N/A.
+        Exceptions: N/A."""
+        if not event.is_directory:
+            self._watcher.path_changed(event.src_path, BACKEND_NATIVE)
+
+    def on_moved(self, event):
+        """
+        Purpose: Receives notification of file rename, such as a
+                 new file renamed over the file watched.
+        Input Parameters:
+            event - type of filesystem event.
+        Return: N/A.
+        Exceptions: N/A."""
+        if not event.is_directory:
+            self._watcher.path_changed(event.dest_path, BACKEND_NATIVE)
+
+
+class FileWatcher(object):
+    """
+    This class watches a set of files and calls back with the key of
+    each one that changes.  Native events are received by a single
+    observer for all watched directories.  A poller thread compares the
+    mtime, size and inode of each file every interval seconds; alone
+    with the poll backend, as a safety net for events never delivered
+    with the auto backend, and in place of native events that can't be
+    set up.  A file being deleted is not a change, so data stays loaded
+    until a file is written back.
+    """
+
+    def __init__(self, callback, backend=BACKEND_AUTO, interval=2.0):
+        """
+        Input Parameters:
+            callback - callable taking the key of a changed file.
+            backend - one of BACKENDS, default = BACKEND_AUTO.
+            interval - seconds between polls, default = 2.0.
+        Exceptions: ValueError if backend is not one of BACKENDS.
+        """
+        if backend not in BACKENDS:
+            raise ValueError('Unknown watch backend: %s' % (backend))
+
+        self.backend = backend
+        self.interval = interval
+        self._callback = callback
+
+        self._lock = threading.Lock()
+        # Path watched to key passed to callback.
+        self._paths = {}
+        # Path watched to stat_signature when last seen.
+        self._signatures = {}
+
+        self._observer = None
+        # Directories the observer is watching.
+        self._directories = set()
+        self._poller = None
+        self._stopping = threading.Event()
+
+        # Backend to number of changes detected and seconds from
+        # modification to detection, last and largest.
+        self._detected = {}
+
+    def watch(self, path, key):
+        """
+        Purpose: Watch path, calling back with key when it changes;
+                 watching a path again replaces its key.
+        Input Parameters:
+            path - path of file to watch.
+            key - key passed to callback.
+        Return: N/A
+        Exceptions: N/A."""
+        with self._lock:
+            if path not in self._paths:
+                self._signatures[path] = stat_signature(path)
+            self._paths[path] = key
+            if self._observer is not None:
+                self._observe(os.path.dirname(path))
+
+    def _observe(self, directory):
+        """
+        Purpose: Add directory to the native observer, falling back to
+                 polling alone if it can't be watched.  Caller must hold
+                 the lock.
+        Input Parameters: directory - directory of a watched file.
+        Return: N/A
+        Exceptions: N/A."""
+        if directory in self._directories:
+            return
+
+        try:
+            self._observer.schedule(WatchEventHandler(self), directory, recursive=False)
+        except EnvironmentError, env_error:
+            logger.warning('Unable to watch %s for events, polling every %.1f seconds: %s',
+                           directory, self.interval, env_error)
+            self._start_poller()
+            return
+        self._directories.add(directory)
+
+    def _start_poller(self):
+        """
+        Purpose: Start the poller thread if not already running.  Caller
+                 must hold the lock.
+        Input Parameters: N/A
+        Return: N/A
+        Exceptions: N/A."""
+        if self._poller is None:
+            self._poller = threading.Thread(target=self._poll_loop, name='FileWatcherPoll')
+            self._poller.daemon = True
+            self._poller.start()
+
+    def start(self):
+        """
+        Purpose: Start watching with the configured backend if not
+                 already running.
+        Input Parameters: N/A
+        Return: N/A
+        Exceptions: N/A."""
+        with self._lock:
+            if self._observer is not None or self._poller is not None:
+                return
+            self._stopping.clear()
+
+            if self.backend != BACKEND_POLL:
+                observer = Observer()
+                try:
+                    observer.start()
+                except EnvironmentError, env_error:
+                    logger.warning('Native file events unavailable, polling every %.1f '
+                                   'seconds: %s', self.interval, env_error)
+                else:
+                    self._observer = observer
+                    for path in self._paths:
+                        self._observe(os.path.dirname(path))
+
+            if self.backend != BACKEND_NATIVE or self._observer is None:
+                self._start_poller()
+
+    def stop(self):
+        """
+        Purpose: Stop watching and wait for the observer and poller
+                 threads to finish.  Watched paths are kept for a later
+                 start.
+        Input Parameters: N/A
+        Return: N/A
+        Exceptions: N/A."""
+        with self._lock:
+            self._stopping.set()
+            observer, self._observer = self._observer, None
+            poller, self._poller = self._poller, None
+            self._directories.clear()
+
+        current = threading.current_thread()
+        if observer is not None:
+            observer.stop()
+            if observer is not current:
+                observer.join()
+        if poller is not None and poller is not current:
+            poller.join()
+
+    def running(self):
+        """
+        Purpose: Determine if files are being watched.
+        Input Parameters: N/A
+        Return: True if the observer or poller is running.
+        Exceptions: N/A."""
+        with self._lock:
+            return self._observer is not None or self._poller is not None
+
+    def path_changed(self, path, backend):
+        """
+        Purpose: Call back with the key of path if it is watched, and
+                 record how long after its modification it was detected.
+        Input Parameters:
+            path - path of file reported changed.
+            backend - BACKEND_NATIVE or BACKEND_POLL, as detected by.
+        Return: N/A
+        Exceptions: N/A."""
+        detected = time.time()
+        with self._lock:
+            key = self._paths.get(path)
+            if key is None:
+                return
+
+            signature = stat_signature(path)
+            if signature is None:
+                # Deleted, or renamed away; wait for a file to return.
+                self._signatures[path] = None
+                return
+
+            if backend == BACKEND_POLL and signature == self._signatures.get(path):
+                # Already reported by a native event.
+                return
+            self._signatures[path] = signature
+
+            # Clocks of network filesystems may run ahead of this host.
+            latency = max(detected - signature[0], 0.0)
+            counts = self._detected.setdefault(backend, [0, None, 0.0])
+            counts[0] += 1
+            counts[1] = latency
+            counts[2] = max(counts[2], latency)
+
+        logger.info('Change to %s detected by %s %.3f seconds after modification.',
+                    path, backend, latency)
+        self._callback(key)
+
+    def poll(self):
+        """
+        Purpose: Check every watched file for a change since last seen.
+        Input Parameters: N/A
+        Return: N/A
+        Exceptions: N/A."""
+        with self._lock:
+            changed = [path for path, signature in self._signatures.iteritems()
+                       if stat_signature(path) != signature]
+
+        for path in changed:
+            self.path_changed(path, BACKEND_POLL)
+
+    def _poll_loop(self):
+        """
+        Purpose: Poller thread loop checking files every interval seconds.
+        Input Parameters: N/A
+        Return: N/A
+        Exceptions: N/A."""
+        while not self._stopping.wait(self.interval):
+            try:
+                self.poll()
+            except Exception, error: # pylint: disable=broad-except
+                # Keep polling for later changes.
+                logger.exception('Polling watched files failed: %s', error)
+
+    def stats(self):
+        """
+        Purpose: Report how files are watched and how quickly changes
+                 have been detected.
+        Input Parameters: N/A
+        Return: OrderedDict of backend, poll interval, whether native
+                events are received, whether polling and, per backend
+                detecting changes, their number and last and largest
+                seconds from modification to detection.
+        Exceptions: N/A."""
+        with self._lock:
+            stats = OrderedDict()
+            stats['backend'] = self.backend
+            stats['interval'] = self.interval
+            stats['events'] = self._observer is not None
+            stats['polling'] = self._poller is not None
+            for backend in (BACKEND_NATIVE, BACKEND_POLL):
+                changes, last_latency, max_latency = self._detected.get(backend, (0, None, 0.0))
+                detected = OrderedDict()
+                detected['changes'] = changes
+                detected['last_latency'] = last_latency
+                detected['max_latency'] = max_latency
+                stats[backend] = detected
+            return stats